@@ -0,0 +1,413 @@
+"""
+Request-independent parts of the HTTP API, shared by the Flask (app.py) and ASGI (asgi_app.py) servers:
+response payloads, request parsing and what happens after every mutation.
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import os
+from typing import List
+
+try:
+    import brotli # Optional: `pip install brotli` adds Content-Encoding: br
+except ImportError:
+    brotli = None
+
+from game_engine import GameState, ChangeSet, Move, Player, add_player, apply_move, undo_move, changes_since, legal_moves
+from storage import create_game, has_game, save_game, get_game, delete_game, import_game, room_lock, lobby_rooms, LobbyEntry, LOBBY_STATUSES
+from scheduler import TurnScheduler
+from bots import POLICIES
+import codec
+import events
+
+def card_to_dict(card):
+    return {
+        "id": card.id,
+        "type": card.type,
+        "value": card.value,
+        "name": card.name,
+    }
+
+def player_to_dict(game: GameState, player, viewer_id=None):
+    data = {"id": player.id, "name": player.name, "score": player.score, "bot": player.bot}
+    # Only the viewer sees their own hand, opponents just get a card count
+    if player.id == viewer_id:
+        data["hand"] = [card_to_dict(c) for c in player.hand]
+    else:
+        data["handCount"] = len(player.hand)
+    data["queensAwake"] = [card_to_dict(c) for c in game.queens_awake.get(player.id, [])]
+    return data
+
+def game_to_dict(game: GameState, viewer_id=None):
+    """The game as seen by `viewer_id` (a player id, or None for spectators)."""
+    is_member = viewer_id in game.players
+    return {
+        "id": game.id,
+        "version": game.version,
+        "lastMessage": game.last_action_message,
+        "winnerId": game.winner_id,
+        "pendingRoseWake": game.pending_rose_wake,
+        "started": game.started,
+        "turnPlayerId": game.turn_player_id,
+        "discardPile": [card_to_dict(c) for c in game.discard_pile],
+        "players": [player_to_dict(game, p, viewer_id) for p in game.players.values()],
+        "queensSleeping": [card_to_dict(c) for c in game.queens_sleeping],
+        "deckSize": len(game.deck),
+        # --- NEW: Return API Key to clients so they can use AI ---
+        # Only players of the room get it
+        "apiKey": game.api_key if is_member else None
+    }
+
+# --- Seat keys: /join hands each player a secret that proves a request comes from their seat ---
+def seat_key(game: GameState, player_id):
+    """The seat's key, derived from the room's (never exposed) seed so it needs no storage."""
+    return hmac.new(str(game.seed).encode(), player_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+def seat_viewer(game: GameState, player_id, key):
+    """player_id if `key` is that seat's key, otherwise None (the spectator view)."""
+    if not isinstance(player_id, str) or player_id not in game.players or not isinstance(key, str):
+        return None
+    return player_id if hmac.compare_digest(key, seat_key(game, player_id)) else None
+
+def check_seat(game: GameState, player_id, key):
+    """Raises PermissionError unless `key` is the seat key of player_id."""
+    if seat_viewer(game, player_id, key) is None:
+        raise PermissionError("seatKey does not match playerId")
+
+def _cached_view(game: GameState, viewer_id):
+    if viewer_id not in game.players:
+        viewer_id = None # Unknown ids share the spectator view (keeps the cache bounded)
+    cached = game.view_cache.get(viewer_id)
+    if cached is None or cached[0] != game.version:
+        cached = (game.version, game_to_dict(game, viewer_id), {})
+        game.view_cache[viewer_id] = cached
+    return cached
+
+def game_view(game: GameState, viewer_id=None):
+    """game_to_dict, cached per (version, viewer) so N pollers cost one serialization each per change."""
+    return _cached_view(game, viewer_id)[1]
+
+# --- Pre-encoded state responses: JSON bytes (and compressed variants) cached next to the view ---
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=9)
+PREFERRED_ENCODINGS = ("br", "gzip")
+
+def _accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+def negotiate_encoding(accept_encoding):
+    """The best compression the client accepts (an Accept-Encoding header value), or None."""
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in PREFERRED_ENCODINGS:
+        if encoding in COMPRESSORS and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+def game_view_body(game: GameState, viewer_id=None, accept_encoding=None):
+    """
+    The GET /rooms/<id> body as (bytes, content encoding or None). Encoded and compressed
+    once per (version, viewer, encoding), so repeated polls of a changed room only copy bytes.
+    """
+    _, view, bodies = _cached_view(game, viewer_id)
+    encoding = negotiate_encoding(accept_encoding)
+    body = bodies.get(encoding)
+    if body is None:
+        body = bodies.get(None)
+        if body is None:
+            body = json.dumps(view, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            bodies[None] = body
+        if encoding is not None:
+            body = COMPRESSORS[encoding](body)
+            bodies[encoding] = body
+    return body, encoding
+
+def after_mutation(game: GameState):
+    """Persists a changed game, notifies its event streams and schedules bot / timed-out turns."""
+    save_game(game)
+    events.publish(game.id, game.version)
+    scheduler.notify(game)
+
+# Plays bot seats and timed-out turns in the background (see scheduler.py)
+scheduler = TurnScheduler.from_env(after_mutation)
+
+# --- Seats: POST /rooms/<id>/join and POST /rooms/<id>/bots {"count": 1, "policy": "greedy"} ---
+MAX_PLAYERS = 5 # Also keeps seat numbers within a byte in snapshots (see codec.py)
+DEFAULT_BOT_POLICY = "greedy"
+
+def join_player(game: GameState, name: str) -> Player:
+    """Seats a person. Raises ValueError if the room is full."""
+    if len(game.players) >= MAX_PLAYERS:
+        raise ValueError(f"Room is full ({MAX_PLAYERS} players at most)")
+    return add_player(game, name)
+
+def add_bots(game: GameState, data) -> List[Player]:
+    """Seats `count` bots playing `policy` (one of bots.POLICIES). Raises ValueError for invalid requests."""
+    policy = data.get("policy") or DEFAULT_BOT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+    count = data.get("count", 1)
+    if not isinstance(count, int) or count < 1:
+        raise ValueError("count must be a positive number")
+    if game.started:
+        raise ValueError("Game already started")
+    if len(game.players) + count > MAX_PLAYERS:
+        raise ValueError(f"Room is full ({MAX_PLAYERS} players at most)")
+
+    numbered = sum(1 for p in game.players.values() if p.bot)
+    return [add_player(game, f"Bot {numbered + i + 1} ({policy})", bot=policy) for i in range(count)]
+
+# --- Delta Updates: change sets since a client-supplied version ---
+_CHANGED_FIELDS = {
+    "turn_player_id": "turnPlayerId",
+    "last_action_message": "lastMessage",
+    "winner_id": "winnerId",
+    "pending_rose_wake": "pendingRoseWake",
+    "started": "started",
+}
+
+def zone_to_str(zone):
+    kind, owner = zone
+    return f"{kind}:{owner}" if owner else kind
+
+def _is_visible(zone, viewer_id):
+    kind, owner = zone
+    if kind == "deck": return False # Cards going into the deck are face down
+    return kind != "hand" or owner == viewer_id
+
+def changes_to_dict(changes: ChangeSet, viewer_id=None):
+    moves, players = [], []
+    for op in changes.ops:
+        if op[0] == "move":
+            _, card, src, _, dst = op
+            move = {"from": zone_to_str(src), "to": zone_to_str(dst)}
+            # Cards moving between hidden zones stay anonymous, or their ids would track them across hands
+            if _is_visible(src, viewer_id) or _is_visible(dst, viewer_id):
+                move["cardId"] = card.id
+            if _is_visible(dst, viewer_id):
+                move["card"] = card_to_dict(card)
+            moves.append(move)
+        elif op[0] == "join":
+            player = op[1]
+            hand_key = ("hand", []) if player.id == viewer_id else ("handCount", 0)
+            players.append({"id": player.id, "name": player.name, "bot": player.bot, hand_key[0]: hand_key[1]})
+
+    before, after = changes.before, changes.after
+    data = {"version": changes.version, "moves": moves}
+    fields = {name: after[key] for key, name in _CHANGED_FIELDS.items() if after[key] != before[key]}
+    scores = {pid: score for pid, score in after["scores"].items() if before["scores"].get(pid) != score}
+    if fields: data["fields"] = fields
+    if scores: data["scores"] = scores
+    if players: data["players"] = players
+    return data
+
+def game_update_dict(game: GameState, since_version=None, viewer_id=None):
+    """Deltas since `since_version` when the change log still covers it, otherwise the full view."""
+    changes = changes_since(game, since_version) if since_version is not None else None
+    if changes is None:
+        return game_view(game, viewer_id)
+    return {
+        "version": game.version,
+        "fromVersion": since_version,
+        "changes": [changes_to_dict(c, viewer_id) for c in changes],
+    }
+
+# --- Lobby: GET /rooms?status=open&limit=50&cursor=... ---
+LOBBY_PAGE_SIZE = 50
+LOBBY_MAX_PAGE_SIZE = 500
+
+def room_summary(entry: LobbyEntry):
+    """One entry of the GET /rooms listing."""
+    return {
+        "id": entry.id,
+        "status": entry.status,
+        "playerCount": entry.player_count,
+        "started": entry.status != "open",
+        "winnerId": entry.winner_id,
+        "createdAt": entry.created_at,
+    }
+
+def lobby_cursor(entry: LobbyEntry):
+    return f"{entry.created_at!r}:{entry.id}" # Same format as router.py builds from room summaries
+
+def _parse_cursor(cursor):
+    created_at, _, room_id = cursor.partition(":")
+    try:
+        return float(created_at), room_id
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+def lobby_dict(args):
+    """
+    One page of the lobby from the request's query args (status, limit, cursor).
+    Raises ValueError for invalid args.
+    """
+    status = args.get("status") or None
+    if status is not None and status not in LOBBY_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(LOBBY_STATUSES)}")
+    try:
+        limit = int(args.get("limit") or LOBBY_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be a number")
+    limit = max(1, min(limit, LOBBY_MAX_PAGE_SIZE))
+    before = _parse_cursor(args["cursor"]) if args.get("cursor") else None
+
+    entries = lobby_rooms(status, limit + 1, before) # One extra tells whether there is a next page
+    page = entries[:limit]
+    return {
+        "rooms": [room_summary(entry) for entry in page],
+        "nextCursor": lobby_cursor(page[-1]) if len(entries) > limit else None,
+    }
+
+# --- Request strings: every one ends up in snapshots (codec.py), so they are checked before the engine sees them ---
+MAX_NAME_LENGTH = 64
+MAX_API_KEY_LENGTH = 512
+
+def parse_player_name(data):
+    """The player name of a /join request body ("Player" if missing). Raises ValueError if it isn't a short string."""
+    name = data.get("name") or "Player"
+    if not isinstance(name, str) or len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"name must be a string of at most {MAX_NAME_LENGTH} characters")
+    return name
+
+def parse_api_key(data):
+    """The apiKey of a room creation body (None if missing). Raises ValueError if it isn't a short string."""
+    api_key = data.get("apiKey")
+    if api_key is not None and (not isinstance(api_key, str) or len(api_key) > MAX_API_KEY_LENGTH):
+        raise ValueError(f"apiKey must be a string of at most {MAX_API_KEY_LENGTH} characters")
+    return api_key
+
+def legal_moves_dict(game: GameState, player_id):
+    return {
+        "version": game.version,
+        "moves": [
+            {"cardIds": move.card_ids, "targetCardId": move.target_card_id}
+            for move in legal_moves(game, player_id)
+        ],
+    }
+
+def parse_play_request(data):
+    """Returns (player_id, card_ids, target_card_id, since_version) from a /play request body."""
+    player_id = data.get("playerId")
+    
+    # --- Support for List or Single ID ---
+    card_ids = data.get("cardIds") 
+    if not card_ids and card_ids is not None: 
+        # If card_ids is an empty list [], that's fine (Rose Bonus uses this)
+        pass
+    elif not card_ids:
+        # If card_ids is None or missing, try cardId or default to empty list
+        single_id = data.get("cardId")
+        if single_id:
+            card_ids = [single_id]
+        else:
+            card_ids = []
+    # -------------------------------------
+
+    target_card_id = data.get("targetCardId")
+    since_version = data.get("sinceVersion")
+    if not isinstance(since_version, int):
+        since_version = None
+    return player_id, card_ids, target_card_id, since_version
+
+# --- Batch Moves: POST /rooms/<id>/play-batch ---
+MAX_BATCH_MOVES = 1000 # Bounds how long one batch holds the room lock
+
+def play_batch(game: GameState, data):
+    """
+    Applies {"moves": [{"playerId", "seatKey", "cardIds", "targetCardId"}, ...]} in order (playerId and
+    seatKey default to the body's) and stops at the first move the engine rejects. With "atomic": true a
+    rejected move also undoes the ones before it. Returns the state once, as /play does ("sinceVersion" / "playerId"),
+    or with "response": "steps" only the version and message after every applied move.
+    Raises ValueError for malformed requests and PermissionError (before any move) if a step's seatKey
+    doesn't match its player; rejected moves are reported as "error" / "failedIndex".
+    """
+    steps = data.get("moves")
+    if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+        raise ValueError("moves must be a list of moves")
+    if len(steps) > MAX_BATCH_MOVES:
+        raise ValueError(f"At most {MAX_BATCH_MOVES} moves per batch")
+    response = data.get("response") or "state"
+    if response not in ("state", "steps"):
+        raise ValueError("response must be state or steps")
+    default_player_id, _, _, since_version = parse_play_request(data)
+    default_seat_key = data.get("seatKey")
+    for step in steps:
+        check_seat(game, step.get("playerId") or default_player_id, step.get("seatKey") or default_seat_key)
+
+    applied: List[ChangeSet] = []
+    result = {}
+    for index, step in enumerate(steps):
+        player_id, card_ids, target_card_id, _ = parse_play_request(step)
+        try:
+            applied.append(apply_move(game, player_id or default_player_id, Move(card_ids, target_card_id)))
+        except ValueError as e:
+            result = {"error": str(e), "failedIndex": index}
+            if data.get("atomic"):
+                while applied:
+                    undo_move(game, applied.pop())
+            break
+
+    result["applied"] = len(applied)
+    if response == "steps":
+        result["version"] = game.version
+        result["steps"] = [{"version": c.version, "lastMessage": c.after["last_action_message"]} for c in applied]
+    else:
+        result.update(game_update_dict(game, since_version, seat_viewer(game, default_player_id, default_seat_key)))
+    return result
+
+def state_etag(game: GameState):
+    return f'"{game.id}-{game.version}"'
+
+# --- Sharding: internal routes used by the shard router (router.py) ---
+SHARD_TOKEN = os.environ.get("SQ_SHARD_TOKEN")
+
+def is_shard_request(headers):
+    """Internal routes only exist when SQ_SHARD_TOKEN is set, and require it in X-Shard-Token."""
+    return bool(SHARD_TOKEN) and hmac.compare_digest(headers.get("X-Shard-Token", ""), SHARD_TOKEN)
+
+def export_room(room_id):
+    """Removes a room from this worker and returns its snapshot. Raises KeyError if it isn't here."""
+    with room_lock(room_id):
+        blob = codec.encode(get_game(room_id))
+        delete_game(room_id)
+    events.close(room_id, moved=True)
+    return blob
+
+def create_routed_room(data):
+    """
+    Creates the room the router picked an id ("roomId") for, so it lands on the worker that owns it.
+    Returns None if that room exists already: a retried create must not replace a live room.
+    Raises ValueError for invalid bodies.
+    """
+    room_id = data.get("roomId")
+    if not isinstance(room_id, str) or not room_id:
+        raise ValueError("roomId is required")
+    api_key = parse_api_key(data)
+    with room_lock(room_id):
+        if has_game(room_id):
+            return None
+        return create_game(api_key=api_key, game_id=room_id)
+
+def import_room(blob, room_id):
+    """Takes over a room exported by another worker. Raises ValueError for a bad snapshot or one of another room."""
+    game = codec.decode(blob)
+    if game.id != room_id:
+        raise ValueError("Snapshot is of another room")
+    with room_lock(game.id):
+        import_game(game)
+        scheduler.notify(game) # Its clock starts over here
+    events.unmark_moved(game.id)
+    return game
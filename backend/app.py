@@ -1,10 +1,15 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
+import json
 import os
 
 # Updated imports: Removed 'delete_game' to prevent startup crash if it's missing in storage.py
-from storage import create_game, get_game
-from game_engine import GameState, add_player, start_game, play_card
+from storage import create_game, get_game, room_lock, room_ids
+from game_engine import GameState, start_game, play_card
+from api import game_view, game_view_body, game_update_dict, after_mutation, lobby_dict, legal_moves_dict, parse_play_request, state_etag, add_bots, play_batch
+from api import is_shard_request, create_routed_room, export_room, import_room, parse_player_name, parse_api_key
+from api import seat_key, seat_viewer, check_seat, join_player
+import events
 
 # --- CONFIGURATION: Serve React App ---
 # We assume the React build is in a folder named 'dist' or 'build' 
@@ -16,61 +21,13 @@ if not os.path.exists(static_folder_path):
 app = Flask(__name__, static_folder=static_folder_path)
 CORS(app)
 
-def card_to_dict(card):
-    return {
-        "id": card.id,
-        "type": card.type,
-        "value": card.value,
-        "name": card.name,
-    }
-
-def game_to_dict(game: GameState):
-    return {
-        "id": game.id,
-        "lastMessage": game.last_action_message,
-        "winnerId": game.winner_id,
-        "pendingRoseWake": game.pending_rose_wake,
-        "started": game.started,
-        "turnPlayerId": game.turn_player_id,
-        "discardPile": [card_to_dict(c) for c in game.discard_pile],
-        "players": [
-            {
-                "id": p.id,
-                "name": p.name,
-                "score": p.score,
-                "hand": [card_to_dict(c) for c in p.hand],
-                "queensAwake": [
-                    card_to_dict(c) for c in game.queens_awake.get(p.id, [])
-                ],
-            }
-            for p in game.players.values()
-        ],
-        "queensSleeping": [card_to_dict(c) for c in game.queens_sleeping],
-        "deckSize": len(game.deck),
-        # --- NEW: Return API Key to clients so they can use AI ---
-        # Using getattr to avoid errors if you haven't updated GameState yet
-        "apiKey": getattr(game, 'api_key', None) 
-    }
-
 # --- NEW: List Rooms Endpoint ---
 @app.route("/rooms", methods=["GET"])
 def api_list_rooms():
     try:
-        # Dynamic import to prevent crash if storage.py isn't updated
-        from storage import get_all_games
-        games = get_all_games()
-        rooms_data = []
-        for game in games:
-            rooms_data.append({
-                "id": game.id,
-                "playerCount": len(game.players),
-                "started": game.started,
-                "winnerId": game.winner_id
-            })
-        return jsonify({"rooms": rooms_data})
-    except ImportError:
-        # Fallback if get_all_games is missing
-        return jsonify({"rooms": []})
+        return jsonify(lobby_dict(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -78,7 +35,10 @@ def api_list_rooms():
 def api_create_room():
     # --- NEW: Extract API Key ---
     data = request.get_json(force=True) or {}
-    api_key = data.get("apiKey")
+    try:
+        api_key = parse_api_key(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # Note: You must update create_game() in storage.py to accept api_key
     try:
@@ -94,37 +54,159 @@ def api_create_room():
 @app.route("/rooms/<room_id>/join", methods=["POST"])
 def api_join_room(room_id):
     data = request.get_json(force=True) or {}
-    name = data.get("name") or "Player"
     try:
-        game = get_game(room_id)
-    except KeyError:
-        return jsonify({"error": "Room not found"}), 404
+        name = parse_player_name(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+
+        try:
+            player = join_player(game, name)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        after_mutation(game)
+    return jsonify({"playerId": player.id, "seatKey": seat_key(game, player.id)})
 
-    player = add_player(game, name)
-    return jsonify({"playerId": player.id})
+# --- Bot Seats: played by the server (see scheduler.py) ---
+@app.route("/rooms/<room_id>/bots", methods=["POST"])
+def api_add_bots(room_id):
+    data = request.get_json(force=True) or {}
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+        try:
+            bots = add_bots(game, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        after_mutation(game)
+    return jsonify({"botIds": [bot.id for bot in bots]}), 201
 
 @app.route("/rooms/<room_id>/start", methods=["POST"])
 def api_start_game(room_id):
-    try:
-        game = get_game(room_id)
-    except KeyError:
-        return jsonify({"error": "Room not found"}), 404
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
 
-    try:
-        start_game(game)
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+        try:
+            start_game(game)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        after_mutation(game)
+        return jsonify(game_view(game, _viewer(game)))
 
-    return jsonify(game_to_dict(game))
+def _viewer(game: GameState):
+    """?playerId= if ?seatKey= proves the request comes from that seat, otherwise None (the spectator view)."""
+    return seat_viewer(game, request.args.get("playerId"), request.args.get("seatKey"))
+
+def _is_unchanged(game: GameState):
+    # Conditional GET: either a standard If-None-Match header or ?sinceVersion=N
+    if request.if_none_match.contains(state_etag(game).strip('"')): # ETags holds unquoted tags
+        return True
+    since_version = request.args.get("sinceVersion", type=int)
+    return since_version is not None and since_version >= game.version
 
 @app.route("/rooms/<room_id>", methods=["GET"])
 def api_get_state(room_id):
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+
+        # Most polls hit idle rooms: skip serialization entirely when nothing changed
+        if _is_unchanged(game):
+            response = app.response_class(status=304)
+        else:
+            body, encoding = game_view_body(game, _viewer(game), request.headers.get("Accept-Encoding"))
+            response = app.response_class(body, mimetype="application/json")
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = state_etag(game)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
+
+@app.route("/rooms/<room_id>/changes", methods=["GET"])
+def api_get_changes(room_id):
+    since_version = request.args.get("sinceVersion", type=int)
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+
+        return jsonify(game_update_dict(game, since_version, _viewer(game)))
+
+# --- Legal Moves: lets clients and bots skip trial-and-error plays ---
+@app.route("/rooms/<room_id>/moves", methods=["GET"])
+def api_get_moves(room_id):
+    player_id = request.args.get("playerId")
+    if not player_id:
+        return jsonify({"error": "playerId is required"}), 400
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+        try:
+            check_seat(game, player_id, request.args.get("seatKey"))
+        except PermissionError as e:
+            return jsonify({"error": str(e)}), 403
+
+        return jsonify(legal_moves_dict(game, player_id))
+
+# --- Server-Sent Events: push the state on every change instead of polling ---
+EVENTS_KEEPALIVE_SECONDS = 15
+
+@app.route("/rooms/<room_id>/events", methods=["GET"])
+def api_room_events(room_id):
     try:
-        game = get_game(room_id)
+        viewer_id = _viewer(get_game(room_id))
     except KeyError:
         return jsonify({"error": "Room not found"}), 404
 
-    return jsonify(game_to_dict(game))
+
+    def stream():
+        events.listen(room_id)
+        try:
+            last_version = -1
+            while True:
+                try:
+                    update = None
+                    with room_lock(room_id): # Never held while yielding or waiting
+                        game = get_game(room_id)
+                        if game.version != last_version:
+                            update = game_update_dict(game, last_version if last_version >= 0 else None, viewer_id)
+                            data = json.dumps(update)
+                            last_version = game.version
+                    if update is not None:
+                        event = "event: changes\n" if "changes" in update else ""
+                        yield f"{event}data: {data}\n\n"
+                    elif events.wait_for_change(room_id, last_version, EVENTS_KEEPALIVE_SECONDS) is None:
+                        yield ": keepalive\n\n"
+                except KeyError:
+                    if events.was_moved(room_id):
+                        yield "retry: 500\n\n" # Moved to another worker: end quietly, the client reconnects
+                        return
+                    yield "event: closed\ndata: {}\n\n"
+                    return
+        finally:
+            events.unlisten(room_id)
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # Disable nginx buffering for this stream
+    return response
 
 # --- NEW: Terminate Game Endpoint (Robust) ---
 @app.route("/rooms/<room_id>", methods=["DELETE"])
@@ -133,7 +215,9 @@ def api_terminate_game(room_id):
     try:
         # Check if delete_game is available in storage module
         from storage import delete_game
-        delete_game(room_id)
+        with room_lock(room_id):
+            delete_game(room_id)
+        events.close(room_id)
         return jsonify({"message": "Game terminated"})
     except ImportError:
         # Fallback: Try to access the 'games' dictionary directly if delete_game is missing
@@ -141,6 +225,7 @@ def api_terminate_game(room_id):
             from storage import games
             if room_id in games:
                 del games[room_id]
+                events.close(room_id)
                 return jsonify({"message": "Game terminated"})
             else:
                 return jsonify({"error": "Room not found"}), 404
@@ -152,23 +237,7 @@ def api_terminate_game(room_id):
 @app.route("/rooms/<room_id>/play", methods=["POST"])
 def api_play_card(room_id):
     data = request.get_json(force=True) or {}
-    player_id = data.get("playerId")
-    
-    # --- Support for List or Single ID ---
-    card_ids = data.get("cardIds") 
-    if not card_ids and card_ids is not None: 
-        # If card_ids is an empty list [], that's fine (Rose Bonus uses this)
-        pass
-    elif not card_ids:
-        # If card_ids is None or missing, try cardId or default to empty list
-        single_id = data.get("cardId")
-        if single_id:
-            card_ids = [single_id]
-        else:
-            card_ids = []
-    # -------------------------------------
-
-    target_card_id = data.get("targetCardId")
+    player_id, card_ids, target_card_id, since_version = parse_play_request(data)
 
     # FIXED: Relaxed validation. 
     # We only check for player_id. 
@@ -177,13 +246,80 @@ def api_play_card(room_id):
     if not player_id:
         return jsonify({"error": "playerId is required"}), 400
 
+    # Moves within a room are linearized, different rooms run in parallel
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+        try:
+            check_seat(game, player_id, data.get("seatKey"))
+            play_card(game, player_id, card_ids, target_card_id=target_card_id)
+        except PermissionError as e:
+            return jsonify({"error": str(e)}), 403
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        after_mutation(game)
+        return jsonify(game_update_dict(game, since_version, player_id))
+
+# --- Batch Moves: many play_card calls under one lock, one response ---
+@app.route("/rooms/<room_id>/play-batch", methods=["POST"])
+def api_play_batch(room_id):
+    data = request.get_json(force=True) or {}
+    with room_lock(room_id):
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return jsonify({"error": "Room not found"}), 404
+        version = game.version
+        try:
+            result = play_batch(game, data)
+        except PermissionError as e:
+            return jsonify({"error": str(e)}), 403
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if game.version != version:
+            after_mutation(game)
+        return jsonify(result), 400 if "error" in result else 200
+
+# --- Sharding: internal routes for the shard router (router.py), hidden unless SQ_SHARD_TOKEN matches ---
+@app.route("/internal/rooms", methods=["GET", "POST"])
+def api_internal_rooms():
+    if not is_shard_request(request.headers):
+        return jsonify({"error": "Not found"}), 404
+    if request.method == "GET":
+        return jsonify({"rooms": room_ids()})
+    # The router picks the room id, so the room lands on the worker that owns it
+    data = request.get_json(force=True) or {}
     try:
-        game = get_game(room_id)
-        play_card(game, player_id, card_ids, target_card_id=target_card_id)
+        game = create_routed_room(data)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    if game is None:
+        return jsonify({"error": "Room already exists"}), 409
+    return jsonify({"roomId": game.id}), 201
+
+@app.route("/internal/rooms/<room_id>/export", methods=["POST"])
+def api_internal_export_room(room_id):
+    if not is_shard_request(request.headers):
+        return jsonify({"error": "Not found"}), 404
+    try:
+        blob = export_room(room_id)
+    except KeyError:
+        return jsonify({"error": "Room not found"}), 404
+    return Response(blob, mimetype="application/octet-stream")
 
-    return jsonify(game_to_dict(game))
+@app.route("/internal/rooms/<room_id>", methods=["PUT"])
+def api_internal_import_room(room_id):
+    if not is_shard_request(request.headers):
+        return jsonify({"error": "Not found"}), 404
+    try:
+        game = import_room(request.get_data(), room_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"roomId": game.id})
 
 @app.route("/health", methods=["GET"])
 def health():
@@ -0,0 +1,382 @@
+"""
+ASGI version of the backend API: the same routes and payloads as app.py on asyncio (Starlette),
+so thousands of polls and /events streams can be served from one process.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Room handlers take the same per-room lock as app.py, but only in the thread pool
+(run_in_threadpool): waiting for that lock, for the storage lock, or for a room to be read
+back from disk never blocks the event loop. Nothing awaits while holding a lock.
+"""
+import json
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from storage import create_game, get_game, delete_game, room_lock, room_ids
+from game_engine import GameState, start_game, play_card
+from api import game_view, game_view_body, game_update_dict, after_mutation, lobby_dict, legal_moves_dict, parse_play_request, state_etag, add_bots, play_batch
+from api import is_shard_request, create_routed_room, export_room, import_room, parse_player_name, parse_api_key
+from api import seat_key, seat_viewer, check_seat, join_player
+import events
+
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+def _error(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code)
+
+def _room_not_found() -> JSONResponse:
+    return _error("Room not found", 404)
+
+async def _json_body(request: Request):
+    """The request body as a dict ({} when empty), or None if it isn't valid JSON."""
+    body = await request.body()
+    if not body:
+        return {}
+    try:
+        return json.loads(body) or {}
+    except ValueError:
+        return None
+
+def _viewer(request: Request, game: GameState):
+    """?playerId= if ?seatKey= proves the request comes from that seat, otherwise None (the spectator view)."""
+    return seat_viewer(game, request.query_params.get("playerId"), request.query_params.get("seatKey"))
+
+def _int_arg(request: Request, name: str):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return None
+
+
+# --- Rooms ---
+async def list_rooms(request: Request):
+    try:
+        return JSONResponse(await run_in_threadpool(lobby_dict, request.query_params))
+    except ValueError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        return _error(str(e), 500)
+
+async def create_room(request: Request):
+    data = await _json_body(request)
+    if data is None:
+        return _error("Invalid JSON body", 400)
+    try:
+        api_key = parse_api_key(data)
+    except ValueError as e:
+        return _error(str(e), 400)
+    game = await run_in_threadpool(create_game, api_key=api_key)
+    return JSONResponse({"roomId": game.id}, status_code=201)
+
+async def join_room(request: Request):
+    room_id = request.path_params["room_id"]
+    data = await _json_body(request)
+    if data is None:
+        return _error("Invalid JSON body", 400)
+    try:
+        name = parse_player_name(data)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    def join():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+
+            try:
+                player = join_player(game, name)
+            except ValueError as e:
+                return _error(str(e), 400)
+            after_mutation(game)
+        return JSONResponse({"playerId": player.id, "seatKey": seat_key(game, player.id)})
+    return await run_in_threadpool(join)
+
+async def add_room_bots(request: Request):
+    room_id = request.path_params["room_id"]
+    data = await _json_body(request)
+    if data is None:
+        return _error("Invalid JSON body", 400)
+
+    def add():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+            try:
+                bots = add_bots(game, data)
+            except ValueError as e:
+                return _error(str(e), 400)
+
+            after_mutation(game)
+        return JSONResponse({"botIds": [bot.id for bot in bots]}, status_code=201)
+    return await run_in_threadpool(add)
+
+async def start_room(request: Request):
+    room_id = request.path_params["room_id"]
+
+    def start():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+
+            try:
+                start_game(game)
+            except ValueError as e:
+                return _error(str(e), 400)
+
+            after_mutation(game)
+            return JSONResponse(game_view(game, _viewer(request, game)))
+    return await run_in_threadpool(start)
+
+def _is_unchanged(request: Request, game: GameState):
+    # Conditional GET: either a standard If-None-Match header or ?sinceVersion=N
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or state_etag(game) in [t.strip() for t in if_none_match.split(",")]):
+        return True
+    since_version = _int_arg(request, "sinceVersion")
+    return since_version is not None and since_version >= game.version
+
+async def get_state(request: Request):
+    room_id = request.path_params["room_id"]
+
+    def state():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+
+            # Most polls hit idle rooms: skip serialization entirely when nothing changed
+            if _is_unchanged(request, game):
+                response = Response(status_code=304)
+            else:
+                body, encoding = game_view_body(game, _viewer(request, game), request.headers.get("accept-encoding"))
+                response = Response(body, media_type="application/json")
+                if encoding:
+                    response.headers["Content-Encoding"] = encoding
+            response.headers["ETag"] = state_etag(game)
+            response.headers["Cache-Control"] = "no-cache"
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+    return await run_in_threadpool(state)
+
+async def get_changes(request: Request):
+    room_id = request.path_params["room_id"]
+    since_version = _int_arg(request, "sinceVersion")
+
+    def changes():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+
+            return JSONResponse(game_update_dict(game, since_version, _viewer(request, game)))
+    return await run_in_threadpool(changes)
+
+async def get_moves(request: Request):
+    room_id = request.path_params["room_id"]
+    player_id = request.query_params.get("playerId")
+    if not player_id:
+        return _error("playerId is required", 400)
+
+    def moves():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+            try:
+                check_seat(game, player_id, request.query_params.get("seatKey"))
+            except PermissionError as e:
+                return _error(str(e), 403)
+
+            return JSONResponse(legal_moves_dict(game, player_id))
+    return await run_in_threadpool(moves)
+
+async def room_events(request: Request):
+    room_id = request.path_params["room_id"]
+    try:
+        viewer_id = _viewer(request, await run_in_threadpool(get_game, room_id))
+    except KeyError:
+        return _room_not_found()
+
+    def poll(last_version: int):
+        """(update, its JSON, version) if the room moved past `last_version`, else (None, None, last_version)."""
+        with room_lock(room_id):
+            game = get_game(room_id)
+            if game.version == last_version:
+                return None, None, last_version
+            update = game_update_dict(game, last_version if last_version >= 0 else None, viewer_id)
+            return update, json.dumps(update), game.version
+
+    async def stream():
+        events.listen(room_id)
+        try:
+            last_version = -1
+            while True:
+                try:
+                    update, data, last_version = await run_in_threadpool(poll, last_version)
+                    if update is not None:
+                        event = "event: changes\n" if "changes" in update else ""
+                        yield f"{event}data: {data}\n\n"
+                    elif await events.wait_for_change_async(room_id, last_version, EVENTS_KEEPALIVE_SECONDS) is None:
+                        yield ": keepalive\n\n"
+                except KeyError:
+                    if events.was_moved(room_id):
+                        yield "retry: 500\n\n" # Moved to another worker: end quietly, the client reconnects
+                        return
+                    yield "event: closed\ndata: {}\n\n"
+                    return
+        finally:
+            events.unlisten(room_id)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # Disable nginx buffering for this stream
+    })
+
+async def terminate_game(request: Request):
+    room_id = request.path_params["room_id"]
+
+    def delete():
+        with room_lock(room_id):
+            delete_game(room_id)
+    try:
+        await run_in_threadpool(delete)
+    except KeyError:
+        return _room_not_found()
+    events.close(room_id)
+    return JSONResponse({"message": "Game terminated"})
+
+async def play(request: Request):
+    room_id = request.path_params["room_id"]
+    data = await _json_body(request)
+    if data is None:
+        return _error("Invalid JSON body", 400)
+    player_id, card_ids, target_card_id, since_version = parse_play_request(data)
+    if not player_id:
+        return _error("playerId is required", 400)
+
+    # Moves within a room are linearized, different rooms run in parallel
+    def move():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+            try:
+                check_seat(game, player_id, data.get("seatKey"))
+                play_card(game, player_id, card_ids, target_card_id=target_card_id)
+            except PermissionError as e:
+                return _error(str(e), 403)
+            except ValueError as e:
+                return _error(str(e), 400)
+
+            after_mutation(game)
+            return JSONResponse(game_update_dict(game, since_version, player_id))
+    return await run_in_threadpool(move)
+
+async def play_moves(request: Request):
+    room_id = request.path_params["room_id"]
+    data = await _json_body(request)
+    if data is None:
+        return _error("Invalid JSON body", 400)
+
+    # One lock and one response for the whole sequence
+    def moves():
+        with room_lock(room_id):
+            try:
+                game = get_game(room_id)
+            except KeyError:
+                return _room_not_found()
+            version = game.version
+            try:
+                result = play_batch(game, data)
+            except PermissionError as e:
+                return _error(str(e), 403)
+            except ValueError as e:
+                return _error(str(e), 400)
+
+            if game.version != version:
+                after_mutation(game)
+            return JSONResponse(result, status_code=400 if "error" in result else 200)
+    return await run_in_threadpool(moves)
+
+# --- Sharding: internal routes for the shard router (router.py), hidden unless SQ_SHARD_TOKEN matches ---
+def _not_found() -> JSONResponse:
+    return _error("Not found", 404)
+
+async def internal_rooms(request: Request):
+    if not is_shard_request(request.headers):
+        return _not_found()
+    if request.method == "GET":
+        return JSONResponse({"rooms": await run_in_threadpool(room_ids)})
+    # The router picks the room id, so the room lands on the worker that owns it
+    data = await _json_body(request)
+    if data is None:
+        return _error("Invalid JSON body", 400)
+    try:
+        game = await run_in_threadpool(create_routed_room, data)
+    except ValueError as e:
+        return _error(str(e), 400)
+    if game is None:
+        return _error("Room already exists", 409)
+    return JSONResponse({"roomId": game.id}, status_code=201)
+
+async def internal_export_room(request: Request):
+    if not is_shard_request(request.headers):
+        return _not_found()
+    try:
+        blob = await run_in_threadpool(export_room, request.path_params["room_id"])
+    except KeyError:
+        return _room_not_found()
+    return Response(blob, media_type="application/octet-stream")
+
+async def internal_import_room(request: Request):
+    if not is_shard_request(request.headers):
+        return _not_found()
+    blob = await request.body()
+    try:
+        game = await run_in_threadpool(import_room, blob, request.path_params["room_id"])
+    except ValueError as e:
+        return _error(str(e), 400)
+    return JSONResponse({"roomId": game.id})
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+routes = [
+    Route("/rooms", list_rooms, methods=["GET"]),
+    Route("/rooms", create_room, methods=["POST"]),
+    Route("/rooms/{room_id}", get_state, methods=["GET"]),
+    Route("/rooms/{room_id}", terminate_game, methods=["DELETE"]),
+    Route("/rooms/{room_id}/join", join_room, methods=["POST"]),
+    Route("/rooms/{room_id}/bots", add_room_bots, methods=["POST"]),
+    Route("/rooms/{room_id}/start", start_room, methods=["POST"]),
+    Route("/rooms/{room_id}/play", play, methods=["POST"]),
+    Route("/rooms/{room_id}/play-batch", play_moves, methods=["POST"]),
+    Route("/rooms/{room_id}/changes", get_changes, methods=["GET"]),
+    Route("/rooms/{room_id}/moves", get_moves, methods=["GET"]),
+    Route("/rooms/{room_id}/events", room_events, methods=["GET"]),
+    Route("/internal/rooms", internal_rooms, methods=["GET", "POST"]),
+    Route("/internal/rooms/{room_id}/export", internal_export_room, methods=["POST"]),
+    Route("/internal/rooms/{room_id}", internal_import_room, methods=["PUT"]),
+    Route("/health", health, methods=["GET"]),
+]
+
+# The React client is served by nginx (see docker-compose.yml), so unlike app.py there is no static fallback
+app = Starlette(routes=routes, middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])])
@@ -0,0 +1,82 @@
+"""
+Snapshot format benchmark: size and encode/decode speed of codec.py against the JSON paths.
+
+    python bench_codec.py --games 200 --repeat 5
+
+Games are sampled at random points of seeded self-play games, so runs are comparable.
+"""
+import argparse
+import json
+import random
+import time
+from typing import Callable, List
+
+from game_engine import GameState, add_player, create_new_game, play_card, start_game
+from api import game_to_dict
+from bots import greedy_policy
+import codec
+import compact
+
+
+def sample_games(count: int, seed: int) -> List[GameState]:
+    rng = random.Random(seed)
+    games = []
+    for i in range(count):
+        game = create_new_game(seed=seed * 100000 + i)
+        for p in range(rng.randint(2, 5)):
+            add_player(game, f"Player {p + 1}")
+        start_game(game)
+        for _ in range(rng.randint(0, 30)):
+            if game.winner_id: break
+            player_id = game.turn_player_id
+            for move in greedy_policy(game, player_id, rng):
+                try:
+                    play_card(game, player_id, move.card_ids, move.target_card_id)
+                except ValueError:
+                    continue
+                break
+            else:
+                break
+        games.append(game)
+    return games
+
+
+def _time_per_item(func: Callable, items: List, repeat: int) -> float:
+    """Best of `repeat` passes, in microseconds per item."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - started)
+    return best / len(items) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark game snapshot formats")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    games = sample_games(args.games, args.seed)
+    formats = [
+        # name, encode, decode (None: the format can't rebuild a GameState)
+        ("api json (game_to_dict)", lambda g: json.dumps(game_to_dict(g, next(iter(g.players)))).encode("utf-8"), None),
+        ("compact zlib json", compact.dumps, compact.loads),
+        ("codec", codec.encode, codec.decode),
+    ]
+
+    print(f"{args.games} games, best of {args.repeat}")
+    print(f"{'format':<26}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, encode, decode in formats:
+        blobs = [encode(g) for g in games]
+        size = sum(len(b) for b in blobs) / len(blobs)
+        encode_us = _time_per_item(encode, games, args.repeat)
+        decode_us = _time_per_item(decode, blobs, args.repeat) if decode else None
+        decode_text = f"{decode_us:12.1f}" if decode_us is not None else f"{'-':>12}"
+        print(f"{name:<26}{size:8.0f}{encode_us:12.1f}{decode_text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+from typing import Iterator, List, Optional, Tuple
+
+from game_engine import CARD_TABLE, MAX_NUMBER_COMBO, NUMBER_COMBOS, VALID_NUMBER_SETS, GameState
+from compact import CompactGame, card_id
+
+# -----------------------------------------------------------------------------
+# Bitset Game State
+# Every zone is an int used as a bitmask over the card universe (bit i = CARD_TABLE[i]),
+# so legal move generation is a handful of and/or operations instead of list scans.
+# -----------------------------------------------------------------------------
+
+NUM_CARDS = len(CARD_TABLE)
+
+
+def _mask_where(predicate) -> int:
+    mask = 0
+    for i, spec in enumerate(CARD_TABLE):
+        if predicate(*spec):
+            mask |= 1 << i
+    return mask
+
+
+ALL_MASK = (1 << NUM_CARDS) - 1
+NUMBER_MASK = _mask_where(lambda t, v, n: t == "number")
+KING_MASK = _mask_where(lambda t, v, n: t == "king")
+KNIGHT_MASK = _mask_where(lambda t, v, n: t == "knight")
+POTION_MASK = _mask_where(lambda t, v, n: t == "potion")
+JESTER_MASK = _mask_where(lambda t, v, n: t == "jester")
+QUEEN_MASK = _mask_where(lambda t, v, n: t == "queen")
+DOG_MASK = _mask_where(lambda t, v, n: n == "Dog Queen")
+CAT_MASK = _mask_where(lambda t, v, n: n == "Cat Queen")
+
+# Card value by index (numbers: face value, queens: points)
+VALUES: Tuple[int, ...] = tuple(v for _, v, _ in CARD_TABLE)
+
+# Move kinds, mirroring the card types that can be played
+NUMBERS, KING, KNIGHT, POTION, JESTER, ROSE = "number", "king", "knight", "potion", "jester", "rose"
+
+# (kind, mask of the played cards, target card index or -1)
+BitMove = Tuple[str, int, int]
+
+
+def bits(mask: int) -> Iterator[int]:
+    """Yields the card indices set in `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def blocked_queens(awake_mask: int) -> int:
+    """Queens a player may not take (Dog and Cat Queens exclude each other, see _can_take_queen)."""
+    blocked = 0
+    if awake_mask & DOG_MASK: blocked |= CAT_MASK
+    if awake_mask & CAT_MASK: blocked |= DOG_MASK
+    return blocked
+
+
+def is_valid_numbers(mask: int) -> bool:
+    """Bitmask version of _validate_numbers_move."""
+    if not mask & (mask - 1): return True # Single card
+    return tuple(sorted(VALUES[i] for i in bits(mask))) in VALID_NUMBER_SETS
+
+
+def _subsets(mask: int) -> Iterator[int]:
+    subset = mask
+    while subset:
+        yield subset
+        subset = (subset - 1) & mask
+
+
+def number_combo_masks(numbers: int) -> List[int]:
+    """Every valid discard out of the number cards in `numbers`, as masks (see NUMBER_COMBOS)."""
+    cards = sorted(bits(numbers), key=VALUES.__getitem__)
+    if len(cards) > MAX_NUMBER_COMBO:
+        return [subset for subset in _subsets(numbers) if is_valid_numbers(subset)]
+    combos = NUMBER_COMBOS.get(tuple(VALUES[i] for i in cards), ())
+    result = []
+    for positions in combos:
+        mask = 0
+        for pos in positions:
+            mask |= 1 << cards[pos]
+        result.append(mask)
+    return result
+
+
+class BitState:
+    __slots__ = ("player_ids", "hands", "awake", "sleeping", "deck", "discard", "turn", "pending_rose_wake", "ids")
+
+    def __init__(self, player_ids: List[str]):
+        self.player_ids = player_ids        # Seat order
+        self.hands = [0] * len(player_ids)  # Aligned with player_ids
+        self.awake = [0] * len(player_ids)
+        self.sleeping = 0
+        self.deck = 0
+        self.discard = 0
+        self.turn = -1                      # Seat index of turn_player_id
+        self.pending_rose_wake = False
+        self.ids: List[Optional[str]] = [None] * NUM_CARDS # External card id by index
+
+    def seat_of(self, player_id: str) -> int:
+        return self.player_ids.index(player_id)
+
+
+def _mask_of(cards, ids: Optional[List[Optional[str]]] = None) -> int:
+    """Bitmask of `cards`, optionally recording their external ids by index."""
+    mask = 0
+    for c in cards:
+        mask |= 1 << c.index
+        if ids is not None:
+            ids[c.index] = c.id
+    return mask
+
+
+def _mask_of_indices(indices) -> int:
+    mask = 0
+    for i in indices:
+        mask |= 1 << i
+    return mask
+
+
+def from_game(game: GameState) -> BitState:
+    state = BitState(list(game.players.keys()))
+    # Only cards that can be part of a move need their ids
+    for seat, p in enumerate(game.players.values()):
+        state.hands[seat] = _mask_of(p.hand, state.ids)
+        state.awake[seat] = _mask_of(game.queens_awake.get(p.id, []), state.ids)
+    state.sleeping = _mask_of(game.queens_sleeping, state.ids)
+    state.deck = _mask_of(game.deck)
+    state.discard = _mask_of(game.discard_pile)
+    if game.turn_player_id in game.players:
+        state.turn = state.seat_of(game.turn_player_id)
+    state.pending_rose_wake = game.pending_rose_wake
+    return state
+
+
+def from_compact(game: CompactGame) -> BitState:
+    state = BitState([p[0] for p in game.players])
+    for seat in range(len(game.players)):
+        state.hands[seat] = _mask_of_indices(game.hands[seat])
+        state.awake[seat] = _mask_of_indices(game.awake[seat])
+    state.sleeping = _mask_of_indices(game.sleeping)
+    state.deck = _mask_of_indices(game.deck)
+    state.discard = _mask_of_indices(game.discard)
+    state.ids = [card_id(game, i) for i in range(NUM_CARDS)]
+    if game.turn_player_id in state.player_ids:
+        state.turn = state.seat_of(game.turn_player_id)
+    state.pending_rose_wake = game.pending_rose_wake
+    return state
+
+
+# -----------------------------------------------------------------------------
+# Legal Move Generation
+# -----------------------------------------------------------------------------
+
+def legal_moves(state: BitState, seat: int) -> List[BitMove]:
+    """Every play_card call that the engine would accept for `seat` (ignoring whose turn it is)."""
+    my_awake = state.awake[seat]
+    takeable = ~blocked_queens(my_awake)
+
+    if state.pending_rose_wake:
+        return [(ROSE, 0, q) for q in bits(state.sleeping & takeable)]
+
+    hand = state.hands[seat]
+    opponents = 0
+    for other, awake in enumerate(state.awake):
+        if other != seat:
+            opponents |= awake
+
+    moves: List[BitMove] = [(NUMBERS, combo, -1) for combo in number_combo_masks(hand & NUMBER_MASK)]
+
+    king_targets = list(bits(state.sleeping & takeable))
+    knight_targets = list(bits(opponents & takeable))
+    potion_targets = list(bits(opponents))
+    for card in bits(hand & ~NUMBER_MASK):
+        bit = 1 << card
+        if bit & KING_MASK:
+            moves.extend((KING, bit, q) for q in king_targets)
+        elif bit & KNIGHT_MASK:
+            moves.extend((KNIGHT, bit, q) for q in knight_targets)
+        elif bit & POTION_MASK:
+            moves.extend((POTION, bit, q) for q in potion_targets)
+        elif bit & JESTER_MASK:
+            moves.append((JESTER, bit, -1))
+    return moves
+
+
+def move_card_ids(state: BitState, move: BitMove) -> Tuple[List[str], Optional[str]]:
+    """Translates a BitMove into play_card arguments (card_ids, target_card_id)."""
+    _, cards, target = move
+    return [state.ids[i] for i in bits(cards)], (state.ids[target] if target >= 0 else None)
@@ -0,0 +1,69 @@
+import importlib
+import random
+from typing import Callable, Dict, List
+
+from game_engine import GameState, Move, legal_moves
+from ismcts import ismcts_policy
+
+# -----------------------------------------------------------------------------
+# Candidates
+# -----------------------------------------------------------------------------
+
+def candidate_moves(game: GameState, player_id: str) -> List[Move]:
+    """
+    Every play the engine accepts for a player (singles, pairs and equations, every power-card target).
+    A copy of the engine's legal_moves, which is cached per version, so policies may reorder it.
+    """
+    return list(legal_moves(game, player_id))
+
+
+# -----------------------------------------------------------------------------
+# Policies
+# A policy returns the candidate moves in order of preference; callers play the first that works.
+# -----------------------------------------------------------------------------
+
+Policy = Callable[[GameState, str, random.Random], List[Move]]
+
+
+def random_policy(game: GameState, player_id: str, rng: random.Random) -> List[Move]:
+    moves = candidate_moves(game, player_id)
+    rng.shuffle(moves)
+    return moves
+
+
+def greedy_policy(game: GameState, player_id: str, rng: random.Random) -> List[Move]:
+    """Takes the most valuable queen it can, otherwise dumps as many number cards as possible."""
+    cards = {c.id: c for c in game.players[player_id].hand}
+    queens = {q.id: q for q in game.queens_sleeping}
+    for pid, awake in game.queens_awake.items():
+        queens.update((q.id, q) for q in awake)
+
+    def score(move: Move):
+        if move.target_card_id:
+            bonus = 1 if move.card_ids and cards[move.card_ids[0]].type == "knight" else 0
+            return (2, queens[move.target_card_id].value, bonus)
+        if cards[move.card_ids[0]].type == "jester":
+            return (1, 0, 0)
+        return (0, len(move.card_ids), 0)
+
+    moves = candidate_moves(game, player_id)
+    rng.shuffle(moves) # Random tie-breaks
+    moves.sort(key=score, reverse=True)
+    return moves
+
+
+POLICIES: Dict[str, Policy] = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "ismcts": ismcts_policy,
+}
+
+
+def get_policy(name: str) -> Policy:
+    """Looks up a built-in policy, or imports one given as 'module:function'."""
+    if name in POLICIES:
+        return POLICIES[name]
+    if ":" not in name:
+        raise ValueError(f"Unknown policy: {name}")
+    module_name, func_name = name.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
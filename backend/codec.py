@@ -0,0 +1,185 @@
+import struct
+import uuid
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from game_engine import CARD_TABLE, Card, GameState, Player, seeded_card_ids
+from compact import all_cards
+
+# -----------------------------------------------------------------------------
+# Binary Game Snapshots
+# The storage / hibernation / move log / shard handoff format. Cards are their CARD_TABLE
+# index (one byte) and zones are length-prefixed byte strings of indices. Card ids are
+# normally not stored at all: games created with a seed regenerate them from it (see
+# seeded_card_ids); otherwise the 16-byte uuids follow the header, ordered by card index.
+#
+#   header   magic "SQG", schema, flags, seed, shuffles, version, created at
+#   strings  game id, last action message, api key (if FLAG_API_KEY)
+#   seats    turn seat, winner seat (NO_SEAT for None)
+#   ids      NUM_CARDS * 16 bytes, unless FLAG_SEEDED_IDS
+#   players  count, then per player: id, name, bot policy ("" for people), score, hand zone, awake zone
+#   zones    deck, discard, sleeping
+#
+# Strings carry a 32-bit byte length. Only the current schema is read: rooms were kept in
+# memory only before this format, so there are no older snapshots to migrate.
+#
+# decode(encode(game)) == game for every game.
+# -----------------------------------------------------------------------------
+
+MAGIC = b"SQG"
+SCHEMA_VERSION = 4
+
+FLAG_STARTED = 1
+FLAG_PENDING_ROSE_WAKE = 2
+FLAG_SEEDED_IDS = 4
+FLAG_API_KEY = 8
+
+NO_SEAT = 0xFF
+NUM_CARDS = len(CARD_TABLE)
+ID_SIZE = 16
+
+_HEADER = struct.Struct("<3sBBQIId")  # magic, schema, flags, seed, shuffles, version, created at
+_U16 = struct.Struct("<H")
+_STR_SIZE = struct.Struct("<I")
+_SEATS = struct.Struct("<BB")
+
+
+@lru_cache(maxsize=256)
+def _seeded_ids(seed: int) -> Tuple[str, ...]:
+    return tuple(seeded_card_ids(seed))
+
+
+# --- Encoding ---
+def _str(out: bytearray, value: str):
+    raw = value.encode("utf-8")
+    out += _STR_SIZE.pack(len(raw))
+    out += raw
+
+def _zone(out: bytearray, cards: List[Card]):
+    out.append(len(cards))
+    out += bytes(c.index for c in cards)
+
+def encode(game: GameState) -> bytes:
+    cards = all_cards(game)
+    ids = _seeded_ids(game.seed)
+    seeded = all(ids[c.index] == c.id for c in cards)
+
+    flags = (FLAG_STARTED if game.started else 0) | (FLAG_PENDING_ROSE_WAKE if game.pending_rose_wake else 0)
+    flags |= (FLAG_SEEDED_IDS if seeded else 0) | (FLAG_API_KEY if game.api_key is not None else 0)
+
+    out = bytearray(_HEADER.pack(MAGIC, SCHEMA_VERSION, flags, game.seed, game.shuffles, game.version, game.created_at))
+    _str(out, game.id)
+    _str(out, game.last_action_message)
+    if game.api_key is not None:
+        _str(out, game.api_key)
+
+    seats = {pid: seat for seat, pid in enumerate(game.players)}
+    out += _SEATS.pack(seats.get(game.turn_player_id, NO_SEAT), seats.get(game.winner_id, NO_SEAT))
+
+    if not seeded:
+        raw_ids = [b"\0" * ID_SIZE] * NUM_CARDS
+        for c in cards:
+            raw_ids[c.index] = uuid.UUID(c.id).bytes
+        out += b"".join(raw_ids)
+
+    out.append(len(game.players))
+    for p in game.players.values():
+        _str(out, p.id)
+        _str(out, p.name)
+        _str(out, p.bot or "")
+        out += _U16.pack(p.score)
+        _zone(out, p.hand)
+        _zone(out, game.queens_awake.get(p.id, []))
+
+    _zone(out, game.deck)
+    _zone(out, game.discard_pile)
+    _zone(out, game.queens_sleeping)
+    return bytes(out)
+
+
+# --- Decoding ---
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes, pos: int):
+        self.data = data
+        self.pos = pos
+
+    def u8(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self.data, self.pos)
+        self.pos += fmt.size
+        return values
+
+    def raw(self, size: int) -> bytes:
+        value = self.data[self.pos:self.pos + size]
+        if len(value) != size:
+            raise ValueError("Truncated snapshot")
+        self.pos += size
+        return value
+
+    def str(self) -> str:
+        size, = self.unpack(_STR_SIZE)
+        return self.raw(size).decode("utf-8")
+
+    def zone(self, cards: List[Card]) -> List[Card]:
+        return [cards[i] for i in self.raw(self.u8())]
+
+
+def decode(blob: bytes) -> GameState:
+    """Raises ValueError for blobs that aren't game snapshots."""
+    if blob[:3] != MAGIC:
+        raise ValueError("Not a game snapshot")
+    try:
+        return _decode(blob)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Corrupt snapshot: {e}")
+
+def _decode(blob: bytes) -> GameState:
+    reader = _Reader(blob, 0)
+    schema = blob[len(MAGIC)]
+    if schema != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported snapshot schema: {schema}")
+    _, _, flags, seed, shuffles, version, created_at = reader.unpack(_HEADER)
+    game_id = reader.str()
+    message = reader.str()
+    api_key: Optional[str] = reader.str() if flags & FLAG_API_KEY else None
+    turn_seat, winner_seat = reader.unpack(_SEATS)
+
+    if flags & FLAG_SEEDED_IDS:
+        ids = _seeded_ids(seed)
+    else:
+        raw_ids = reader.raw(NUM_CARDS * ID_SIZE)
+        ids = tuple(str(uuid.UUID(bytes=raw_ids[i * ID_SIZE:(i + 1) * ID_SIZE])) for i in range(NUM_CARDS))
+    cards = [Card(ids[i], type_, value, name, i) for i, (type_, value, name) in enumerate(CARD_TABLE)] # Positional: measurably faster
+
+    game = GameState(
+        id=game_id,
+        last_action_message=message,
+        started=bool(flags & FLAG_STARTED),
+        pending_rose_wake=bool(flags & FLAG_PENDING_ROSE_WAKE),
+        api_key=api_key,
+        version=version,
+        seed=seed,
+        shuffles=shuffles,
+        created_at=created_at,
+    )
+    for _ in range(reader.u8()):
+        pid = reader.str()
+        name = reader.str()
+        bot = reader.str() or None
+        score, = reader.unpack(_U16)
+        game.players[pid] = Player(id=pid, name=name, hand=reader.zone(cards), score=score, bot=bot)
+        game.queens_awake[pid] = reader.zone(cards)
+    game.deck = reader.zone(cards)
+    game.discard_pile = reader.zone(cards)
+    game.queens_sleeping = reader.zone(cards)
+
+    player_ids = list(game.players)
+    game.turn_player_id = player_ids[turn_seat] if turn_seat != NO_SEAT else None
+    game.winner_id = player_ids[winner_seat] if winner_seat != NO_SEAT else None
+    return game
@@ -0,0 +1,177 @@
+import base64
+import json
+import secrets
+import uuid
+import zlib
+from typing import List, Optional, Tuple
+
+from game_engine import CARD_TABLE, Card, CardSpec, GameState, Player
+
+# -----------------------------------------------------------------------------
+# Compact Game Representation
+# Cards are small integers (positions in CARD_TABLE) and zones are bytearrays of them.
+# External card ids are kept as one bytes blob of 16-byte uuids, ordered by card index.
+# -----------------------------------------------------------------------------
+
+ID_SIZE = 16
+
+
+class CompactGame:
+    __slots__ = (
+        "id", "card_ids", "players", "hands", "awake",
+        "deck", "discard", "sleeping",
+        "turn_player_id", "started", "last_action_message", "winner_id",
+        "pending_rose_wake", "api_key", "version", "seed", "shuffles", "created_at",
+    )
+
+    def __init__(self, id: str, card_ids: bytes):
+        self.id = id
+        self.card_ids = card_ids
+        self.players: List[Tuple[str, str, int, Optional[str]]] = [] # (id, name, score, bot) in seat order
+        self.hands: List[bytearray] = []              # Aligned with players
+        self.awake: List[bytearray] = []              # Aligned with players
+        self.deck = bytearray()
+        self.discard = bytearray()
+        self.sleeping = bytearray()
+        self.turn_player_id: Optional[str] = None
+        self.started = False
+        self.last_action_message = ""
+        self.winner_id: Optional[str] = None
+        self.pending_rose_wake = False
+        self.api_key: Optional[str] = None
+        self.version = 0
+        self.seed = 0
+        self.shuffles = 0
+        self.created_at = 0.0
+
+
+def card_spec(index: int) -> CardSpec:
+    return CARD_TABLE[index]
+
+
+def card_id(game: CompactGame, index: int) -> str:
+    return str(uuid.UUID(bytes=game.card_ids[index * ID_SIZE:(index + 1) * ID_SIZE]))
+
+
+def card_index(game: CompactGame, external_id: str) -> int:
+    """Maps an external card id back to its index. Raises KeyError if it isn't part of the game."""
+    try:
+        raw = uuid.UUID(external_id).bytes
+    except ValueError:
+        raise KeyError(external_id)
+    pos = game.card_ids.find(raw)
+    while pos != -1 and pos % ID_SIZE:
+        pos = game.card_ids.find(raw, pos + 1)
+    if pos == -1:
+        raise KeyError(external_id)
+    return pos // ID_SIZE
+
+
+def _indices(cards: List[Card]) -> bytearray:
+    return bytearray(c.index for c in cards)
+
+
+def all_cards(game: GameState) -> List[Card]:
+    cards = game.deck + game.discard_pile + game.queens_sleeping
+    for p in game.players.values():
+        cards += p.hand
+    for queens in game.queens_awake.values():
+        cards += queens
+    return cards
+
+
+def pack(game: GameState) -> CompactGame:
+    """Converts a GameState into its compact form."""
+    ids = [b""] * len(CARD_TABLE)
+    for c in all_cards(game):
+        ids[c.index] = uuid.UUID(c.id).bytes
+
+    compact = CompactGame(game.id, b"".join(ids))
+    for p in game.players.values():
+        compact.players.append((p.id, p.name, p.score, p.bot))
+        compact.hands.append(_indices(p.hand))
+        compact.awake.append(_indices(game.queens_awake.get(p.id, [])))
+    compact.deck = _indices(game.deck)
+    compact.discard = _indices(game.discard_pile)
+    compact.sleeping = _indices(game.queens_sleeping)
+    compact.turn_player_id = game.turn_player_id
+    compact.started = game.started
+    compact.last_action_message = game.last_action_message
+    compact.winner_id = game.winner_id
+    compact.pending_rose_wake = game.pending_rose_wake
+    compact.api_key = game.api_key
+    compact.version = game.version
+    compact.seed = game.seed
+    compact.shuffles = game.shuffles
+    compact.created_at = game.created_at
+    return compact
+
+
+def unpack(compact: CompactGame) -> GameState:
+    """Rebuilds a full GameState (with fresh Card objects) from its compact form."""
+    cards = [
+        Card(id=card_id(compact, i), type=type_, value=value, name=name, index=i)
+        for i, (type_, value, name) in enumerate(CARD_TABLE)
+    ]
+    game = GameState(
+        id=compact.id,
+        turn_player_id=compact.turn_player_id,
+        deck=[cards[i] for i in compact.deck],
+        discard_pile=[cards[i] for i in compact.discard],
+        queens_sleeping=[cards[i] for i in compact.sleeping],
+        started=compact.started,
+        last_action_message=compact.last_action_message,
+        winner_id=compact.winner_id,
+        pending_rose_wake=compact.pending_rose_wake,
+        api_key=compact.api_key,
+        version=compact.version,
+        seed=compact.seed,
+        shuffles=compact.shuffles,
+        created_at=compact.created_at,
+    )
+    for (pid, name, score, bot), hand, awake in zip(compact.players, compact.hands, compact.awake):
+        game.players[pid] = Player(id=pid, name=name, hand=[cards[i] for i in hand], score=score, bot=bot)
+        game.queens_awake[pid] = [cards[i] for i in awake]
+    return game
+
+
+# -----------------------------------------------------------------------------
+# Serialization (storage snapshots)
+# -----------------------------------------------------------------------------
+
+FORMAT_VERSION = 3 # 2: adds seed and shuffles, 3: adds created_at and bot seats
+
+
+def dumps(game: GameState) -> bytes:
+    """Serializes a game into a small zlib-compressed blob."""
+    c = pack(game)
+    data = [
+        FORMAT_VERSION, c.id, base64.b64encode(c.card_ids).decode("ascii"),
+        [list(p) for p in c.players], [h.hex() for h in c.hands], [a.hex() for a in c.awake],
+        c.deck.hex(), c.discard.hex(), c.sleeping.hex(),
+        c.turn_player_id, c.started, c.last_action_message, c.winner_id,
+        c.pending_rose_wake, c.api_key, c.version, c.seed, c.shuffles, c.created_at,
+    ]
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def loads(blob: bytes) -> GameState:
+    data = json.loads(zlib.decompress(blob).decode("utf-8"))
+    if data[0] == 1:
+        data += [secrets.randbits(63), 0] # Games saved before seeding continue with a fresh seed
+    elif data[0] not in (2, FORMAT_VERSION):
+        raise ValueError(f"Unsupported snapshot format: {data[0]}")
+    if data[0] < 3:
+        data.append(0.0) # Creation time unknown (like codec schema 1), and no bot seats yet
+    (_, game_id, card_ids, players, hands, awake, deck, discard, sleeping,
+     turn_player_id, started, message, winner_id, pending_rose_wake, api_key, version, seed, shuffles, created_at) = data
+
+    c = CompactGame(game_id, base64.b64decode(card_ids))
+    c.players = [(p[0], p[1], p[2], p[3] if len(p) > 3 else None) for p in players]
+    c.hands = [bytearray.fromhex(h) for h in hands]
+    c.awake = [bytearray.fromhex(a) for a in awake]
+    c.deck, c.discard, c.sleeping = bytearray.fromhex(deck), bytearray.fromhex(discard), bytearray.fromhex(sleeping)
+    c.turn_player_id, c.started, c.last_action_message, c.winner_id = turn_player_id, started, message, winner_id
+    c.pending_rose_wake, c.api_key, c.version = pending_rose_wake, api_key, version
+    c.seed, c.shuffles, c.created_at = seed, shuffles, created_at
+    return unpack(c)
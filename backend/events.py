@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# -----------------------------------------------------------------------------
+# Room Change Notifications (used by the /events push stream)
+# -----------------------------------------------------------------------------
+
+class RoomChannel:
+    """Tracks the latest published version of a room and wakes up waiting streams."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = -1
+        self.closed = False
+        self.listeners = 0
+        # asyncio streams waiting for a change: (their event loop, event to set)
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def notify(self):
+        """Wakes every waiter. Must be called with the condition held."""
+        self.condition.notify_all()
+        for loop, event in self.async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+
+_channels: Dict[str, RoomChannel] = {}
+_channels_lock = threading.Lock()
+
+# Rooms recently handed to another worker (see router.py). Their streams end without a
+# "closed" event, so clients reconnect (through the router) instead of leaving the room.
+MOVED_ROOMS_REMEMBERED = 10000
+_moved: "OrderedDict[str, None]" = OrderedDict()
+
+
+def listen(room_id: str):
+    """Registers a stream for a room. Call before reading the room state to avoid missed updates."""
+    with _channels_lock:
+        channel = _channels.get(room_id)
+        if channel is None:
+            channel = RoomChannel()
+            _channels[room_id] = channel
+        channel.listeners += 1
+
+
+def unlisten(room_id: str):
+    with _channels_lock:
+        channel = _channels.get(room_id)
+        if channel is None:
+            return
+        channel.listeners -= 1
+        if channel.listeners <= 0:
+            del _channels[room_id]
+
+
+def publish(room_id: str, version: int):
+    """Announces that a room reached a new state version. No-op if nobody is listening."""
+    with _channels_lock:
+        channel = _channels.get(room_id)
+    if channel is None:
+        return
+    with channel.condition:
+        channel.version = max(channel.version, version)
+        channel.notify()
+
+
+def close(room_id: str, moved: bool = False):
+    """Wakes up all listeners of a deleted (or moved) room so their streams can end."""
+    with _channels_lock:
+        channel = _channels.pop(room_id, None)
+        if moved:
+            _moved[room_id] = None
+            if len(_moved) > MOVED_ROOMS_REMEMBERED:
+                _moved.popitem(last=False)
+        else:
+            _moved.pop(room_id, None)
+    if channel is None:
+        return
+    with channel.condition:
+        channel.closed = True
+        channel.notify()
+
+
+def was_moved(room_id: str) -> bool:
+    with _channels_lock:
+        return room_id in _moved
+
+
+def unmark_moved(room_id: str):
+    """The room moved (back) to this worker."""
+    with _channels_lock:
+        _moved.pop(room_id, None)
+
+
+def _listened_channel(room_id: str) -> RoomChannel:
+    with _channels_lock:
+        channel = _channels.get(room_id)
+    if channel is None:
+        raise KeyError(f"Game with ID {room_id} is not being listened to")
+    return channel
+
+
+def _check_change(room_id: str, channel: RoomChannel, last_version: int) -> Optional[int]:
+    if channel.closed:
+        raise KeyError(f"Game with ID {room_id} was closed")
+    if channel.version > last_version:
+        return channel.version
+    return None
+
+
+def wait_for_change(room_id: str, last_version: int, timeout: float) -> Optional[int]:
+    """
+    Blocks until the room is published past `last_version`.
+    Returns the new version, or None on timeout. Raises KeyError if the room was closed.
+    """
+    channel = _listened_channel(room_id)
+    with channel.condition:
+        channel.condition.wait_for(
+            lambda: channel.closed or channel.version > last_version, timeout=timeout
+        )
+        return _check_change(room_id, channel, last_version)
+
+
+async def wait_for_change_async(room_id: str, last_version: int, timeout: float) -> Optional[int]:
+    """wait_for_change for asyncio streams: waits on the event loop instead of blocking a thread."""
+    channel = _listened_channel(room_id)
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    with channel.condition:
+        version = _check_change(room_id, channel, last_version)
+        if version is not None:
+            return version
+        channel.async_waiters.append(waiter)
+    try:
+        await asyncio.wait_for(waiter[1].wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with channel.condition:
+            channel.async_waiters.remove(waiter)
+    with channel.condition:
+        return _check_change(room_id, channel, last_version)
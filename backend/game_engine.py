@@ -1,7 +1,12 @@
+from collections import deque
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple
+from itertools import combinations, combinations_with_replacement
+from typing import Any, Deque, List, Dict, NamedTuple, Optional, Tuple
 import uuid
 import random
+import secrets
+import time
 
 # -----------------------------------------------------------------------------
 # Data Structures
@@ -13,6 +18,7 @@ class Card:
     type: str        # "queen", "king", "knight", "potion", "dragon", "wand", "number", "jester"
     value: int = 0   # numbers (1-10)
     name: str = ""   # Queens (e.g. "Rose Queen")
+    index: int = -1  # Position in CARD_TABLE (compact encodings use this instead of the id)
 
 @dataclass
 class Player:
@@ -20,6 +26,37 @@ class Player:
     name: str
     hand: List[Card] = field(default_factory=list)
     score: int = 0
+    bot: Optional[str] = None # Policy name (bots.POLICIES) for seats played by the server
+
+# Zones are addressed as (kind, owner): ("deck", None), ("discard", None), ("sleeping", None),
+# ("hand", player_id), ("awake", player_id)
+Zone = Tuple[str, Optional[str]]
+ZONE_DECK: Zone = ("deck", None)
+ZONE_DISCARD: Zone = ("discard", None)
+ZONE_SLEEPING: Zone = ("sleeping", None)
+
+# How many recent change sets a game keeps for delta updates
+CHANGE_LOG_SIZE = 64
+
+@dataclass
+class ChangeSet:
+    """
+    Everything one engine call (add_player / start_game / play_card) changed.
+    call holds the call itself: ("join", player_id, name[, bot]), ("start",) or ("play", player_id, card_ids, target_card_id).
+    ops holds ("move", card, src_zone, src_pos, dst_zone), ("shuffle", zone, previous_order, new_order)
+    and ("join", player) entries; before/after hold the scalar fields (turn, scores, message...).
+    """
+    from_version: int
+    version: int = 0
+    call: Tuple = ()
+    ops: List[Tuple] = field(default_factory=list)
+    before: Dict[str, Any] = field(default_factory=dict)
+    after: Dict[str, Any] = field(default_factory=dict)
+
+class Move(NamedTuple):
+    """Arguments of one play_card call."""
+    card_ids: List[str]
+    target_card_id: Optional[str] = None
 
 @dataclass
 class GameState:
@@ -43,14 +80,46 @@ class GameState:
     # --- NEW: Store API Key for AI features ---
     api_key: Optional[str] = None
 
+    # Monotonic state version, bumped on every mutation (used for ETags / polling)
+    version: int = 0
+
+    # Epoch seconds, orders the lobby listing (0 for rooms stored before it was recorded)
+    created_at: float = 0.0
+
+    # Deterministic shuffling: shuffle n uses the game's RNG seeded from (seed, n), so a game
+    # restored from (seed, shuffles) continues exactly as it would have
+    seed: int = 0
+    shuffles: int = 0
+    rng: Optional[random.Random] = field(default=None, repr=False, compare=False) # Created on first shuffle
+
+    # Recent change sets for delta updates (transient, not part of the game itself)
+    change_log: Deque[ChangeSet] = field(
+        default_factory=lambda: deque(maxlen=CHANGE_LOG_SIZE), repr=False, compare=False
+    )
+    recording: Optional[ChangeSet] = field(default=None, repr=False, compare=False)
+    # Serialized per-viewer views, keyed by viewer id -> (version, view, encoded bodies); filled by the API layer
+    view_cache: Dict[Optional[str], Tuple[int, Any, Dict[Optional[str], bytes]]] = field(default_factory=dict, repr=False, compare=False)
+    # Legal moves per player id -> (version, moves), see legal_moves()
+    moves_cache: Dict[str, Tuple[int, List[Move]]] = field(default_factory=dict, repr=False, compare=False)
+    # Recorded shuffle results (card index orders) consumed instead of shuffling while replaying a log
+    replay_shuffles: Optional[Deque[List[int]]] = field(default=None, repr=False, compare=False)
+    # Card lookups by id: the cards themselves and the zone each one is in (kept current by _move_card).
+    # Built from the zones on first use, so code that fills the zone lists directly leaves them None
+    cards: Optional[Dict[str, Card]] = field(default=None, repr=False, compare=False)
+    card_zones: Optional[Dict[str, Zone]] = field(default=None, repr=False, compare=False)
+
 
 # -----------------------------------------------------------------------------
 # Deck Building
 # -----------------------------------------------------------------------------
 
-def _build_deck() -> List[Card]:
-    cards: List[Card] = []
-    
+# (type, value, name) of every card. Cards are identified by their position in this
+# table in compact encodings, while Card.id stays the stable external (API) id.
+CardSpec = Tuple[str, int, str]
+
+def _card_specs() -> List[CardSpec]:
+    specs: List[CardSpec] = []
+
     # 1. Queens
     queens_data = [
         ("Rose Queen", 5), ("Dog Queen", 15), ("Cat Queen", 15),
@@ -60,31 +129,201 @@ def _build_deck() -> List[Card]:
         ("Fire Queen", 20), ("Book Queen", 10) 
     ]
     for name, val in queens_data:
-        cards.append(Card(id=str(uuid.uuid4()), type="queen", value=val, name=name))
+        specs.append(("queen", val, name))
 
     # 2. Action Cards
-    for _ in range(8): cards.append(Card(id=str(uuid.uuid4()), type="king"))
-    for _ in range(4): cards.append(Card(id=str(uuid.uuid4()), type="knight"))
-    for _ in range(4): cards.append(Card(id=str(uuid.uuid4()), type="potion"))
-    for _ in range(3): cards.append(Card(id=str(uuid.uuid4()), type="dragon"))
-    for _ in range(3): cards.append(Card(id=str(uuid.uuid4()), type="wand"))
+    specs += [("king", 0, "")] * 8
+    specs += [("knight", 0, "")] * 4
+    specs += [("potion", 0, "")] * 4
+    specs += [("dragon", 0, "")] * 3
+    specs += [("wand", 0, "")] * 3
     
     # --- New: 4 Jesters ---
-    for _ in range(4): cards.append(Card(id=str(uuid.uuid4()), type="jester"))
+    specs += [("jester", 0, "")] * 4
 
     # 3. Number Cards
     for value in range(1, 11):
-        for _ in range(4):
-            cards.append(Card(id=str(uuid.uuid4()), type="number", value=value))
+        specs += [("number", value, "")] * 4
 
-    random.shuffle(cards)
+    return specs
+
+CARD_TABLE: Tuple[CardSpec, ...] = tuple(_card_specs())
+
+def _draw_card_ids(rng: random.Random) -> List[str]:
+    return [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in CARD_TABLE]
+
+def _build_deck(rng: random.Random) -> List[Card]:
+    cards = [
+        Card(id=card_id, type=type_, value=value, name=name, index=i)
+        for card_id, (i, (type_, value, name)) in zip(_draw_card_ids(rng), enumerate(CARD_TABLE))
+    ]
+    rng.shuffle(cards)
     return cards
 
+def seeded_card_ids(seed: int) -> List[str]:
+    """The card ids (by card index) that create_new_game(seed=seed) hands out."""
+    return _draw_card_ids(random.Random(_shuffle_seed(seed, 0)))
+
+
+# -----------------------------------------------------------------------------
+# Number Combination Index
+# Every sorted multiset of number values a hand can hold (1-10, up to 5 cards),
+# precomputed so validation and combo search are dictionary lookups.
+# -----------------------------------------------------------------------------
+
+MAX_NUMBER_COMBO = 5
+
+def _is_valid_number_values(values: Tuple[int, ...]) -> bool:
+    """values must be sorted"""
+    if len(values) == 1: return True
+    if all(v == values[0] for v in values): return True # Pair/Triple
+    if len(values) >= 3 and sum(values[:-1]) == values[-1]: return True # Equation
+    return False
+
+# Sorted value tuples that form a valid discard
+VALID_NUMBER_SETS = frozenset(
+    key
+    for size in range(1, MAX_NUMBER_COMBO + 1)
+    for key in combinations_with_replacement(range(1, 11), size)
+    if _is_valid_number_values(key)
+)
+
+def _build_number_combos() -> Dict[Tuple[int, ...], Tuple[Tuple[int, ...], ...]]:
+    combos = {}
+    for size in range(1, MAX_NUMBER_COMBO + 1):
+        for key in combinations_with_replacement(range(1, 11), size):
+            combos[key] = tuple(
+                positions
+                for count in range(1, size + 1)
+                for positions in combinations(range(size), count)
+                if tuple(key[i] for i in positions) in VALID_NUMBER_SETS
+            )
+    return combos
+
+# Sorted hand values -> every valid subset, as positions into that sorted tuple
+NUMBER_COMBOS = _build_number_combos()
+
 
 # -----------------------------------------------------------------------------
 # Helper Functions (Logic)
 # -----------------------------------------------------------------------------
 
+def _bump_version(game: GameState):
+    game.version += 1
+
+def _zone_cards(game: GameState, zone: Zone) -> List[Card]:
+    kind, owner = zone
+    if kind == "deck": return game.deck
+    if kind == "discard": return game.discard_pile
+    if kind == "sleeping": return game.queens_sleeping
+    if kind == "hand": return game.players[owner].hand
+    if kind == "awake": return game.queens_awake[owner]
+    raise ValueError(f"Unknown zone: {kind}")
+
+def _zones(game: GameState) -> List[Zone]:
+    return [ZONE_DECK, ZONE_DISCARD, ZONE_SLEEPING] + [
+        (kind, pid) for pid in game.players for kind in ("hand", "awake")
+    ]
+
+def _index_cards(game: GameState):
+    game.cards, game.card_zones = {}, {}
+    for zone in _zones(game):
+        for c in _zone_cards(game, zone):
+            game.cards[c.id] = c
+            game.card_zones[c.id] = zone
+
+def _find_card(game: GameState, card_id: Optional[str], zone: Optional[Zone] = None) -> Tuple[Optional[Card], Optional[Zone]]:
+    """(card, its zone) for a card id, or (None, None) if there is no such card (in `zone`, if given)."""
+    if not isinstance(card_id, str):
+        return None, None
+    if game.card_zones is None:
+        _index_cards(game)
+    found = game.card_zones.get(card_id)
+    if found is None or (zone is not None and found != zone):
+        return None, None
+    return game.cards[card_id], found
+
+def _position(cards: List[Card], card: Card) -> int:
+    # By identity (Card.__eq__ compares every field), checking the ends first:
+    # draws take the last card and reshuffles empty the discard pile from the front
+    last = len(cards) - 1
+    if last >= 0 and cards[last] is card: return last
+    for pos, c in enumerate(cards):
+        if c is card: return pos
+    raise ValueError("Card not in zone")
+
+def _move_card(game: GameState, card: Card, src: Zone, dst: Zone):
+    """Single entry point for moving a card between zones (keeps the change log and card index complete)."""
+    src_cards = _zone_cards(game, src)
+    pos = _position(src_cards, card)
+    del src_cards[pos]
+    _zone_cards(game, dst).append(card)
+    if game.card_zones is not None:
+        game.card_zones[card.id] = dst
+    if game.recording is not None:
+        game.recording.ops.append(("move", card, src, pos, dst))
+
+def _shuffle_seed(seed: int, shuffle: int) -> str:
+    return f"{seed}:{shuffle}"
+
+def _next_rng(game: GameState) -> random.Random:
+    """The game's RNG, re-seeded for its next shuffle."""
+    seed = _shuffle_seed(game.seed, game.shuffles)
+    if game.rng is None:
+        game.rng = random.Random(seed)
+    else:
+        game.rng.seed(seed)
+    game.shuffles += 1
+    return game.rng
+
+def _shuffle_zone(game: GameState, zone: Zone):
+    cards = _zone_cards(game, zone)
+    previous = cards[:]
+    rng = _next_rng(game)
+    if game.replay_shuffles:
+        by_index = {c.index: c for c in cards}
+        cards[:] = [by_index[i] for i in game.replay_shuffles.popleft()]
+    else:
+        rng.shuffle(cards)
+    if game.recording is not None:
+        game.recording.ops.append(("shuffle", zone, previous, cards[:]))
+
+def _reshuffle_discard(game: GameState):
+    """Moves the whole discard pile into the (empty) deck and shuffles it."""
+    for c in game.discard_pile[:]:
+        _move_card(game, c, ZONE_DISCARD, ZONE_DECK)
+    _shuffle_zone(game, ZONE_DECK)
+
+def _snapshot_fields(game: GameState) -> Dict[str, Any]:
+    return {
+        "turn_player_id": game.turn_player_id,
+        "last_action_message": game.last_action_message,
+        "winner_id": game.winner_id,
+        "pending_rose_wake": game.pending_rose_wake,
+        "started": game.started,
+        "shuffles": game.shuffles,
+        "scores": {pid: p.score for pid, p in game.players.items()},
+    }
+
+@contextmanager
+def _recording(game: GameState, call: Tuple):
+    """
+    Records the changes of one engine call into game.change_log (discarded on error).
+    The call bumps the version once if it changed anything, however many steps it took.
+    """
+    changes = ChangeSet(from_version=game.version, call=call, before=_snapshot_fields(game))
+    game.recording = changes
+    try:
+        yield changes
+    finally:
+        game.recording = None
+    after = _snapshot_fields(game)
+    if changes.ops or after != changes.before:
+        _bump_version(game)
+        changes.version = game.version
+        changes.after = after
+        game.change_log.append(changes)
+
 def _next_player_id(game: GameState) -> str:
     player_ids = list(game.players.keys())
     if not player_ids: return ""
@@ -94,26 +333,28 @@ def _next_player_id(game: GameState) -> str:
         return player_ids[(idx + 1) % len(player_ids)]
     except ValueError: return player_ids[0]
 
+def _blocked_queen(player_queens: List[Card]) -> Optional[str]:
+    """Name of the queen a player can't take: Dog and Cat Queens never go together."""
+    for q in player_queens:
+        if q.name == "Dog Queen": return "Cat Queen"
+        if q.name == "Cat Queen": return "Dog Queen"
+    return None
+
 def _can_take_queen(player_queens: List[Card], new_queen: Card) -> bool:
-    has_dog = any(q.name == "Dog Queen" for q in player_queens)
-    has_cat = any(q.name == "Cat Queen" for q in player_queens)
-    if new_queen.name == "Dog Queen" and has_cat: return False
-    if new_queen.name == "Cat Queen" and has_dog: return False
-    return True
+    return new_queen.name != _blocked_queen(player_queens)
 
 def _find_opponent_queen(game: GameState, attacker_id: str, target_card_id: str) -> Tuple[Optional[str], Optional[Card]]:
-    for pid, queens in game.queens_awake.items():
-        if pid == attacker_id: continue
-        found = next((q for q in queens if q.id == target_card_id), None)
-        if found: return pid, found
-    return None, None
+    card, zone = _find_card(game, target_card_id)
+    if card is None or zone[0] != "awake" or zone[1] == attacker_id:
+        return None, None
+    return zone[1], card
 
 def _validate_numbers_move(cards: List[Card]) -> bool:
     if len(cards) == 1: return True
-    values = sorted([c.value for c in cards])
-    if all(v == values[0] for v in values): return True # Pair/Triple
-    if len(values) >= 3 and sum(values[:-1]) == values[-1]: return True # Equation
-    return False
+    values = tuple(sorted(c.value for c in cards))
+    if len(values) <= MAX_NUMBER_COMBO:
+        return values in VALID_NUMBER_SETS
+    return _is_valid_number_values(values)
 
 def _check_victory(game: GameState, player: Player):
     player_queens = game.queens_awake.get(player.id, [])
@@ -140,19 +381,16 @@ def _draw_cards(game: GameState, player: Player, count: int):
                 break # No cards left anywhere
             
             # Move discard to deck (shuffle)
-            game.deck = game.discard_pile[:]
-            game.discard_pile = []
-            random.shuffle(game.deck)
+            _reshuffle_discard(game)
             
         if game.deck:
-            player.hand.append(game.deck.pop())
+            _move_card(game, game.deck[-1], ZONE_DECK, ("hand", player.id))
 
 def _finish_turn(game: GameState, player: Player, cards_played: List[Card], message: str, extra_turn: bool = False):
     # 1. Discard played cards
     for c in cards_played:
-        if c in player.hand:
-            player.hand.remove(c)
-            game.discard_pile.append(c)
+        if _find_card(game, c.id, ("hand", player.id))[0] is not None:
+            _move_card(game, c, ("hand", player.id), ZONE_DISCARD)
     
     # 2. Draw new cards
     cards_needed = 5 - len(player.hand) # Always fill up to 5
@@ -185,18 +423,17 @@ def _handle_numbers(player: Player, cards: List[Card]) -> str:
 
 def _handle_king(game: GameState, player: Player, target_card_id: str) -> str:
     if not target_card_id: raise ValueError("Select a sleeping queen")
-    target_queen = next((c for c in game.queens_sleeping if c.id == target_card_id), None)
+    target_queen, _ = _find_card(game, target_card_id, ZONE_SLEEPING)
     if not target_queen: raise ValueError("Target not sleeping")
     
     if not _can_take_queen(game.queens_awake[player.id], target_queen):
         raise ValueError(f"Cannot take {target_queen.name} (Animal conflict)")
 
-    game.queens_sleeping.remove(target_queen)
-    game.queens_awake[player.id].append(target_queen)
+    _move_card(game, target_queen, ZONE_SLEEPING, ("awake", player.id))
     
     if target_queen.name == "Rose Queen":
         game.pending_rose_wake = True
-        
+
     return f"{player.name} woke up {target_queen.name}!"
 
 
@@ -212,13 +449,11 @@ def _handle_knight(game: GameState, player: Player, target_card_id: str) -> str:
     defense_card = next((c for c in opponent.hand if c.type == "dragon"), None)
 
     if defense_card:
-        opponent.hand.remove(defense_card)
-        game.discard_pile.append(defense_card)
+        _move_card(game, defense_card, ("hand", opponent.id), ZONE_DISCARD)
         _draw_cards(game, opponent, 1) # Opponent draws immediately
         return f"Attack blocked! {opponent.name} used Dragon!"
     else:
-        game.queens_awake[target_owner_id].remove(target_queen)
-        game.queens_awake[player.id].append(target_queen)
+        _move_card(game, target_queen, ("awake", target_owner_id), ("awake", player.id))
         return f"{player.name} stole {target_queen.name} from {opponent.name}!"
 
 
@@ -231,13 +466,11 @@ def _handle_potion(game: GameState, player: Player, target_card_id: str) -> str:
     defense_card = next((c for c in opponent.hand if c.type == "wand"), None)
 
     if defense_card:
-        opponent.hand.remove(defense_card)
-        game.discard_pile.append(defense_card)
+        _move_card(game, defense_card, ("hand", opponent.id), ZONE_DISCARD)
         _draw_cards(game, opponent, 1)
         return f"Attack blocked! {opponent.name} used Wand!"
     else:
-        game.queens_awake[target_owner_id].remove(target_queen)
-        game.queens_sleeping.append(target_queen)
+        _move_card(game, target_queen, ("awake", target_owner_id), ZONE_SLEEPING)
         return f"{player.name} put {opponent.name}'s Queen to sleep!"
 
 
@@ -250,11 +483,9 @@ def _handle_jester(game: GameState, player: Player) -> Tuple[str, bool]:
         if not game.discard_pile:
             return "Jester played but deck is empty!", False
         # Reshuffle manually here since we need to peek
-        game.deck = game.discard_pile[:]
-        game.discard_pile = []
-        random.shuffle(game.deck)
+        _reshuffle_discard(game)
         
-    revealed_card = game.deck.pop()
+    revealed_card = game.deck[-1]
     
     # 2. Logic
     msg = f"{player.name} played Jester and revealed: {revealed_card.type} "
@@ -265,7 +496,7 @@ def _handle_jester(game: GameState, player: Player) -> Tuple[str, bool]:
     # Scenario A: Power Card (King, Knight, Potion, Dragon, Wand, Jester, Queen?)
     # Rules say: Add to hand and play again.
     if revealed_card.type != "number":
-        player.hand.append(revealed_card)
+        _move_card(game, revealed_card, ZONE_DECK, ("hand", player.id))
         msg += ". It's a Power Card! You get it and play again."
         extra_turn = True
         
@@ -273,7 +504,7 @@ def _handle_jester(game: GameState, player: Player) -> Tuple[str, bool]:
     else:
         # Rules: Count players starting from current player.
         # The landing player gets to wake a queen.
-        game.discard_pile.append(revealed_card) # Number is discarded
+        _move_card(game, revealed_card, ZONE_DECK, ZONE_DISCARD) # Number is discarded
         
         count = revealed_card.value
         player_ids = list(game.players.keys())
@@ -294,8 +525,7 @@ def _handle_jester(game: GameState, player: Player) -> Tuple[str, bool]:
                     break
             
             if valid_queen:
-                game.queens_sleeping.remove(valid_queen)
-                game.queens_awake[target_pid].append(valid_queen)
+                _move_card(game, valid_queen, ZONE_SLEEPING, ("awake", target_pid))
                 msg += f". Counted {count} to {target_player.name}, who woke {valid_queen.name}!"
                 
                 # Rose Queen check for the lucky winner
@@ -303,14 +533,14 @@ def _handle_jester(game: GameState, player: Player) -> Tuple[str, bool]:
                     # Special edge case: If it's NOT my turn, handling Rose is complex.
                     # For MVP: We will auto-wake another random one for them to avoid blocking game.
                     if game.queens_sleeping:
-                        bonus_q = game.queens_sleeping.pop()
-                        game.queens_awake[target_pid].append(bonus_q)
+                        bonus_q = game.queens_sleeping[-1]
+                        _move_card(game, bonus_q, ZONE_SLEEPING, ("awake", target_pid))
                         msg += f" (Rose Bonus: {target_player.name} also got {bonus_q.name}!)"
             else:
                 msg += f". Counted to {target_player.name}, but they couldn't take any queen!"
         else:
             msg += ". No sleeping queens left!"
-            
+
     return msg, extra_turn
 
 
@@ -318,40 +548,52 @@ def _handle_jester(game: GameState, player: Player) -> Tuple[str, bool]:
 # Main Game Management
 # -----------------------------------------------------------------------------
 
-def create_new_game(api_key: Optional[str] = None) -> GameState:
-    deck = _build_deck()
-    game_id = str(uuid.uuid4())
+def create_new_game(api_key: Optional[str] = None, seed: Optional[int] = None, game_id: Optional[str] = None) -> GameState:
+    """
+    Games created with the same seed deal the same cards (with the same card ids) for the same moves.
+    game_id is given by the shard router, which picks the id (and so the owning worker) itself.
+    """
+    if seed is None: seed = secrets.randbits(63)
+    game_id = game_id or str(uuid.uuid4())
     # --- NEW: Pass api_key to GameState constructor ---
-    return GameState(id=game_id, deck=deck, api_key=api_key)
-
-def add_player(game: GameState, name: str) -> Player:
-    pid = str(uuid.uuid4())
-    p = Player(id=pid, name=name)
-    game.players[pid] = p
-    game.queens_awake[pid] = []
+    game = GameState(id=game_id, api_key=api_key, seed=seed, created_at=time.time())
+    game.deck = _build_deck(_next_rng(game))
+    return game
+
+def add_player(game: GameState, name: str, player_id: Optional[str] = None, bot: Optional[str] = None) -> Player:
+    """player_id is only passed when replaying a log, new players get a fresh id. bot makes it a server played seat."""
+    pid = player_id or str(uuid.uuid4())
+    call = ("join", pid, name, bot) if bot else ("join", pid, name)
+    with _recording(game, call) as changes:
+        p = Player(id=pid, name=name, bot=bot)
+        game.players[pid] = p
+        game.queens_awake[pid] = []
+        changes.ops.append(("join", p))
     return p
 
 def start_game(game: GameState):
     if game.started: return
     if not game.players: raise ValueError("Need players")
     
-    new_deck = []
-    for c in game.deck:
-        if c.type == "queen": game.queens_sleeping.append(c)
-        else: new_deck.append(c)
-    game.deck = new_deck
-    
-    # Deal 5 cards
-    for _ in range(5):
-        for p in game.players.values():
-            _draw_cards(game, p, 1)
-            
-    game.turn_player_id = next(iter(game.players.keys()))
-    game.started = True
+    with _recording(game, ("start",)):
+        for c in game.deck[:]:
+            if c.type == "queen": _move_card(game, c, ZONE_DECK, ZONE_SLEEPING)
+        
+        # Deal 5 cards
+        for _ in range(5):
+            for p in game.players.values():
+                _draw_cards(game, p, 1)
+                
+        game.turn_player_id = next(iter(game.players.keys()))
+        game.started = True
 
 def get_game(game_id: str): pass 
 
 def play_card(game: GameState, player_id: str, card_ids: List[str], target_card_id: Optional[str] = None) -> None:
+    with _recording(game, ("play", player_id, list(card_ids), target_card_id)):
+        _play_card(game, player_id, card_ids, target_card_id)
+
+def _play_card(game: GameState, player_id: str, card_ids: List[str], target_card_id: Optional[str]) -> None:
     # 1. Pre-checks
     if not game.started: raise ValueError("Game not started")
     if player_id != game.turn_player_id: raise ValueError("Not your turn")
@@ -361,15 +603,14 @@ def play_card(game: GameState, player_id: str, card_ids: List[str], target_card_
     # === ROSE QUEEN BONUS STATE ===
     if game.pending_rose_wake:
         if not target_card_id: raise ValueError("Rose Bonus: Select sleeping queen!")
-        target_queen = next((c for c in game.queens_sleeping if c.id == target_card_id), None)
+        target_queen, _ = _find_card(game, target_card_id, ZONE_SLEEPING)
         if not target_queen: raise ValueError("Target not sleeping")
         
         if not _can_take_queen(game.queens_awake[player.id], target_queen):
              raise ValueError(f"Cannot take {target_queen.name} (Animal conflict)")
 
-        game.queens_sleeping.remove(target_queen)
-        game.queens_awake[player.id].append(target_queen)
-        game.pending_rose_wake = False 
+        _move_card(game, target_queen, ZONE_SLEEPING, ("awake", player.id))
+        game.pending_rose_wake = False
         _finish_turn(game, player, [], f"{player.name} used Rose Bonus to wake {target_queen.name}!")
         return
     # ==============================
@@ -377,8 +618,9 @@ def play_card(game: GameState, player_id: str, card_ids: List[str], target_card_
     # 2. Extract Cards
     if not card_ids: raise ValueError("No cards selected")
     cards_to_play = []
+    hand_zone = ("hand", player.id)
     for cid in card_ids:
-        c = next((x for x in player.hand if x.id == cid), None)
+        c, _ = _find_card(game, cid, hand_zone)
         if not c: raise ValueError(f"Card not found")
         cards_to_play.append(c)
 
@@ -410,4 +652,152 @@ def play_card(game: GameState, player_id: str, card_ids: List[str], target_card_
         else: raise ValueError(f"Unknown card type: {first_type}")
 
     # 5. Finish
-    _finish_turn(game, player, cards_to_play, action_result, extra_turn=extra_turn)
\ No newline at end of file
+    _finish_turn(game, player, cards_to_play, action_result, extra_turn=extra_turn)
+
+def changes_since(game: GameState, version: int) -> Optional[List[ChangeSet]]:
+    """
+    Returns the change sets that bring a client at `version` up to date,
+    or None if the log no longer reaches back that far (client needs a full state).
+    """
+    if version == game.version:
+        return []
+    if version > game.version or not game.change_log or game.change_log[0].from_version > version:
+        return None
+    return [c for c in game.change_log if c.version > version]
+
+
+# -----------------------------------------------------------------------------
+# Search Support: Cloning and Undo
+# Cards are never changed once dealt, so copies share them and only copy the zone lists.
+# apply_move / undo_move reuse the change journal: undoing walks a change set's ops backwards,
+# so both cost as much as the move itself, not as much as the whole state.
+# -----------------------------------------------------------------------------
+
+def clone_game(game: GameState) -> GameState:
+    """A copy of `game` that can be played independently (without the transient caches and change log)."""
+    return GameState(
+        id=game.id,
+        players={pid: Player(id=p.id, name=p.name, hand=p.hand[:], score=p.score, bot=p.bot) for pid, p in game.players.items()},
+        turn_player_id=game.turn_player_id,
+        deck=game.deck[:],
+        discard_pile=game.discard_pile[:],
+        queens_sleeping=game.queens_sleeping[:],
+        queens_awake={pid: queens[:] for pid, queens in game.queens_awake.items()},
+        cards=game.cards, # Shared like the cards themselves
+        card_zones=dict(game.card_zones) if game.card_zones is not None else None,
+        started=game.started,
+        last_action_message=game.last_action_message,
+        winner_id=game.winner_id,
+        pending_rose_wake=game.pending_rose_wake,
+        api_key=game.api_key,
+        version=game.version,
+        created_at=game.created_at,
+        seed=game.seed,
+        shuffles=game.shuffles,
+    )
+
+def _revert(game: GameState, changes: ChangeSet):
+    for op in reversed(changes.ops):
+        if op[0] == "move":
+            _, card, src, pos, dst = op
+            _zone_cards(game, dst).pop() # Moves append, and everything after this one is already undone
+            _zone_cards(game, src).insert(pos, card)
+            if game.card_zones is not None:
+                game.card_zones[card.id] = src
+        elif op[0] == "shuffle":
+            _zone_cards(game, op[1])[:] = op[2]
+        elif op[0] == "join":
+            del game.players[op[1].id]
+            del game.queens_awake[op[1].id]
+    before = changes.before
+    game.turn_player_id = before["turn_player_id"]
+    game.last_action_message = before["last_action_message"]
+    game.winner_id = before["winner_id"]
+    game.pending_rose_wake = before["pending_rose_wake"]
+    game.started = before["started"]
+    game.shuffles = before["shuffles"]
+    for pid, score in before["scores"].items():
+        game.players[pid].score = score
+    game.version = changes.from_version
+    # Versions get reused after an undo, so nothing cached by version can be trusted
+    game.moves_cache.clear()
+    game.view_cache.clear()
+
+def apply_move(game: GameState, player_id: str, move: Move) -> ChangeSet:
+    """
+    play_card for search: returns the change set to hand to undo_move.
+    Raises ValueError like play_card, leaving the game as it was.
+    """
+    changes = None
+    try:
+        with _recording(game, ("play", player_id, list(move.card_ids), move.target_card_id)) as changes:
+            _play_card(game, player_id, move.card_ids, move.target_card_id)
+    except ValueError:
+        if changes is not None and changes.ops:
+            _revert(game, changes)
+        raise
+    return changes
+
+def undo_move(game: GameState, changes: ChangeSet):
+    """Reverts the last applied move (undo in reverse order of apply_move), draws and reshuffles included."""
+    if changes.version != game.version:
+        raise ValueError("Can only undo the latest move")
+    _revert(game, changes)
+    if game.change_log and game.change_log[-1] is changes:
+        game.change_log.pop()
+
+
+# -----------------------------------------------------------------------------
+# Legal Moves
+# -----------------------------------------------------------------------------
+
+def number_combos(numbers: List[Card]) -> List[List[Card]]:
+    """Every valid set of number cards to discard from `numbers`."""
+    numbers = sorted(numbers, key=lambda c: c.value)
+    combos = NUMBER_COMBOS.get(tuple(c.value for c in numbers))
+    if combos is not None:
+        return [[numbers[i] for i in positions] for positions in combos]
+
+    # Bigger than any real hand: walk the subsets
+    result = []
+    for mask in range(1, 1 << len(numbers)):
+        combo = [c for i, c in enumerate(numbers) if mask >> i & 1]
+        if _validate_numbers_move(combo):
+            result.append(combo)
+    return result
+
+def _compute_legal_moves(game: GameState, player: Player) -> List[Move]:
+    blocked = _blocked_queen(game.queens_awake[player.id])
+
+    if game.pending_rose_wake:
+        return [Move([], q.id) for q in game.queens_sleeping if q.name != blocked]
+
+    opponent_queens = [q for pid, queens in game.queens_awake.items() if pid != player.id for q in queens]
+    king_targets = [q for q in game.queens_sleeping if q.name != blocked]
+    knight_targets = [q for q in opponent_queens if q.name != blocked]
+
+    moves = [Move([c.id for c in combo]) for combo in number_combos([c for c in player.hand if c.type == "number"])]
+    for c in player.hand:
+        if c.type == "king": moves += [Move([c.id], q.id) for q in king_targets]
+        elif c.type == "knight": moves += [Move([c.id], q.id) for q in knight_targets]
+        elif c.type == "potion": moves += [Move([c.id], q.id) for q in opponent_queens]
+        elif c.type == "jester": moves.append(Move([c.id]))
+    return moves
+
+def legal_moves(game: GameState, player_id: str) -> List[Move]:
+    """
+    Every play_card call that would succeed for `player_id` right now
+    (empty if it isn't their turn or the game is over). Cached per state version,
+    so treat the returned list as read-only.
+    """
+    player = game.players.get(player_id)
+    if not game.started or game.winner_id or player_id != game.turn_player_id or not player:
+        return []
+
+    cached = game.moves_cache.get(player_id)
+    if cached is not None and cached[0] == game.version:
+        return cached[1]
+    moves = _compute_legal_moves(game, player)
+    game.moves_cache.clear() # Only the current turn's moves are worth keeping
+    game.moves_cache[player_id] = (game.version, moves)
+    return moves
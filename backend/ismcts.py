@@ -0,0 +1,253 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from game_engine import ChangeSet, GameState, Move, apply_move, clone_game, legal_moves, undo_move
+import codec
+
+# -----------------------------------------------------------------------------
+# Information-Set Monte Carlo Tree Search (single observer)
+# Every iteration deals the cards the bot can't see (opponent hands and the deck order) at
+# random from the cards it can't account for, then walks one tree shared by all those deals:
+# children are moves, and a child only competes when it is legal in the current deal
+# (UCB over availability counts). Rollouts are short and scored by progress towards the
+# win (see _rewards), so a 50 ms budget still gets a few hundred iterations. One working copy is
+# redealt per iteration and every move played on it is undone afterwards.
+# -----------------------------------------------------------------------------
+
+DEFAULT_TIME_MS = 50
+DEFAULT_ROLLOUT_DEPTH = 12
+EXPLORATION = 0.7
+ROLLOUT_RANDOMNESS = 0.2 # Share of random moves in rollouts, the rest are greedy
+KING_IN_HAND = 0.5       # Part of a queen a King in hand is worth when scoring a rollout
+# New children start with PRIOR_VISITS virtual visits worth PRIOR_GREEDY for greedy's choice, PRIOR_OTHER otherwise
+PRIOR_VISITS = 5
+PRIOR_GREEDY = 0.6
+PRIOR_OTHER = 0.45
+
+MoveKey = Tuple[Tuple[str, ...], Optional[str]] # (card ids, target card id)
+
+
+def _key(move: Move) -> MoveKey:
+    return tuple(move.card_ids), move.target_card_id
+
+
+class _Node:
+    __slots__ = ("parent", "player_id", "children", "visits", "available", "reward")
+
+    def __init__(self, parent: Optional["_Node"], player_id: Optional[str]):
+        self.parent = parent
+        self.player_id = player_id  # Who made the move leading here
+        self.children: Dict[MoveKey, "_Node"] = {}
+        self.visits = 0
+        self.available = 1          # Iterations in which this move was legal
+        self.reward = 0.0           # Summed from player_id's point of view
+
+    def ucb(self) -> float:
+        return self.reward / self.visits + EXPLORATION * math.sqrt(math.log(self.available) / self.visits)
+
+
+# --- Determinization ---
+def redeal(state: GameState, viewer_id: str, rng: random.Random):
+    """
+    Deals everything `viewer_id` can't see (the other hands and the order of the deck) at random,
+    in place, with a fresh seed for any reshuffle to come.
+    """
+    hidden = state.deck[:]
+    for pid, p in state.players.items():
+        if pid != viewer_id:
+            hidden.extend(p.hand)
+    rng.shuffle(hidden)
+
+    dealt = 0
+    for pid, p in state.players.items():
+        if pid != viewer_id:
+            p.hand[:] = hidden[dealt:dealt + len(p.hand)]
+            dealt += len(p.hand)
+    state.deck[:] = hidden[dealt:]
+    state.card_zones = None # Cards changed zones behind the engine's back: re-indexed on the next lookup
+    state.seed = rng.getrandbits(63)
+    state.moves_cache.clear() # Same version, different hands
+
+
+def determinize(game: GameState, viewer_id: str, rng: random.Random) -> GameState:
+    """A playable copy of `game` with the cards `viewer_id` can't see dealt at random."""
+    state = clone_game(game)
+    redeal(state, viewer_id, rng)
+    return state
+
+
+# --- Rollouts ---
+def _win_progress(game: GameState, player_id: str) -> float:
+    """
+    How close a player is to winning (1.0 = won), see _check_victory. Kings in hand count as part
+    of a queen: otherwise a rollout that ends before they are played rates holding them as worthless.
+    """
+    queen_goal, score_goal = (5, 50) if len(game.players) <= 3 else (4, 40)
+    queens = len(game.queens_awake.get(player_id, []))
+    score = game.players[player_id].score
+    if game.queens_sleeping:
+        kings = sum(1 for c in game.players[player_id].hand if c.type == "king")
+        kings = min(kings, len(game.queens_sleeping)) * KING_IN_HAND
+        queens += kings
+        score += kings * sum(q.value for q in game.queens_sleeping) / len(game.queens_sleeping)
+    return max(queens / queen_goal, score / score_goal)
+
+
+def _rewards(game: GameState) -> Dict[str, float]:
+    """Per player result in [0, 1]: the outcome if the game ended, otherwise the lead in progress."""
+    if game.winner_id:
+        return {pid: 1.0 if pid == game.winner_id else 0.0 for pid in game.players}
+    progress = {pid: _win_progress(game, pid) for pid in game.players}
+    rewards = {}
+    for pid, own in progress.items():
+        best_other = max((p for other, p in progress.items() if other != pid), default=0.0)
+        rewards[pid] = min(1.0, max(0.0, 0.5 + 0.5 * (own - best_other)))
+    return rewards
+
+
+def _greedy_score(game: GameState, move: Move) -> Tuple[int, int]:
+    """Same preferences as bots.greedy_policy: the most valuable queen, then a Jester, then the most cards dumped."""
+    if move.target_card_id:
+        queen = next((q for q in game.queens_sleeping if q.id == move.target_card_id), None)
+        if queen is None:
+            queen = next(q for queens in game.queens_awake.values() for q in queens if q.id == move.target_card_id)
+        return (2, queen.value)
+    if len(move.card_ids) == 1 and any(c.id == move.card_ids[0] and c.type == "jester" for c in game.players[game.turn_player_id].hand):
+        return (1, 0)
+    return (0, len(move.card_ids))
+
+
+def _rollout_move(game: GameState, moves: List[Move], rng: random.Random) -> Move:
+    # Mostly greedy: random rollouts can't tell a strong move from a weak one in a few plies
+    if rng.random() < ROLLOUT_RANDOMNESS:
+        return rng.choice(moves)
+    return max(moves, key=lambda m: _greedy_score(game, m))
+
+
+def _play(game: GameState, move: Move, played: List[ChangeSet]) -> bool:
+    try:
+        played.append(apply_move(game, game.turn_player_id, move))
+        return True
+    except ValueError:
+        return False
+
+
+def _rollout(game: GameState, depth: int, rng: random.Random, played: List[ChangeSet]):
+    for _ in range(depth):
+        if game.winner_id:
+            return
+        moves = legal_moves(game, game.turn_player_id)
+        if not moves or not _play(game, _rollout_move(game, moves, rng), played):
+            return
+
+
+# --- Search ---
+def search(game: GameState, player_id: str, rng: Optional[random.Random] = None,
+           time_ms: float = DEFAULT_TIME_MS, iterations: Optional[int] = None,
+           rollout_depth: int = DEFAULT_ROLLOUT_DEPTH) -> List[Tuple[Move, int]]:
+    """
+    Ranks the legal moves of `player_id` (whose turn it must be) as (move, visits), most visited first.
+    Stops after `time_ms` milliseconds or `iterations` iterations, whichever comes first.
+    """
+    moves = legal_moves(game, player_id)
+    if len(moves) <= 1:
+        return [(move, 0) for move in moves]
+    rng = rng or random.Random()
+    deadline = time.perf_counter() + time_ms / 1000
+    root = _Node(None, None)
+    state = clone_game(game)
+    played: List[ChangeSet] = []
+
+    done = 0
+    while (iterations is None or done < iterations) and time.perf_counter() < deadline:
+        done += 1
+        redeal(state, player_id, rng)
+        node = root
+
+        # Selection / expansion
+        while not state.winner_id:
+            mover = state.turn_player_id
+            available = {_key(m): m for m in legal_moves(state, mover)}
+            if not available:
+                break
+            untried = [k for k in available if k not in node.children]
+            for k, child in node.children.items():
+                if k in available:
+                    child.available += 1
+            if untried:
+                # Greedy's choice first, and with a head start: a few iterations can't tell moves apart
+                greedy = max(available, key=lambda key: _greedy_score(state, available[key]))
+                k = greedy if greedy in untried else rng.choice(untried)
+                node.children[k] = child = _Node(node, mover)
+                child.visits = PRIOR_VISITS
+                child.reward = PRIOR_VISITS * (PRIOR_GREEDY if k == greedy else PRIOR_OTHER)
+                node = child
+                _play(state, available[k], played)
+                break
+            k, node = max(((k, c) for k, c in node.children.items() if k in available), key=lambda kc: kc[1].ucb())
+            if not _play(state, available[k], played):
+                break
+
+        _rollout(state, rollout_depth, rng, played)
+
+        # Backpropagation
+        rewards = _rewards(state)
+        while node is not None:
+            node.visits += 1
+            if node.player_id is not None:
+                node.reward += rewards.get(node.player_id, 0.0)
+            node = node.parent
+        while played:
+            undo_move(state, played.pop())
+
+    by_key = {_key(m): m for m in moves}
+    children = sorted(((child.reward / child.visits, child.visits, k) for k, child in root.children.items()), reverse=True)
+    ranked = [(by_key[k], visits) for _, visits, k in children]
+    ranked += [(m, 0) for k, m in by_key.items() if k not in root.children]
+    return ranked
+
+
+def best_move(game: GameState, player_id: str, rng: Optional[random.Random] = None, **budget) -> Optional[Move]:
+    ranked = search(game, player_id, rng, **budget)
+    return ranked[0][0] if ranked else None
+
+
+def ismcts_policy(game: GameState, player_id: str, rng: random.Random) -> List[Move]:
+    """Policy (see bots.py) with the default budget."""
+    return [move for move, _ in search(game, player_id, rng)]
+
+
+# -----------------------------------------------------------------------------
+# Worker Pool
+# Searches are pure CPU, so they run in worker processes: the servers hand over a snapshot
+# (codec.py) and get a Future of the move, and never block a request or the event loop.
+# -----------------------------------------------------------------------------
+
+def _search_snapshot(blob: bytes, player_id: str, time_ms: float, iterations: Optional[int]) -> Optional[Move]:
+    return best_move(codec.decode(blob), player_id, time_ms=time_ms, iterations=iterations)
+
+
+class BotPool:
+    def __init__(self, workers: Optional[int] = None, time_ms: float = DEFAULT_TIME_MS, iterations: Optional[int] = None):
+        self.time_ms = time_ms
+        self.iterations = iterations
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def from_env(cls) -> "BotPool":
+        """SQ_BOT_WORKERS (default: CPU count), SQ_BOT_TIME_MS and SQ_BOT_ITERATIONS (default: no limit)."""
+        workers = int(os.environ["SQ_BOT_WORKERS"]) if os.environ.get("SQ_BOT_WORKERS") else None
+        time_ms = float(os.environ.get("SQ_BOT_TIME_MS") or DEFAULT_TIME_MS)
+        iterations = int(os.environ["SQ_BOT_ITERATIONS"]) if os.environ.get("SQ_BOT_ITERATIONS") else None
+        return cls(workers, time_ms, iterations)
+
+    def choose(self, game: GameState, player_id: str) -> "Future[Optional[Move]]":
+        """Starts a search for `player_id` on a snapshot of `game` (call with the room lock held)."""
+        return self.executor.submit(_search_snapshot, codec.encode(game), player_id, self.time_ms, self.iterations)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
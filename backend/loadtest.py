@@ -0,0 +1,383 @@
+"""
+HTTP load generator: bot players play full games against a backend while every player
+polls the room like the React client does (GET /rooms/<id>?sinceVersion=N every 2 s).
+
+    python loadtest.py --rooms 200 --concurrency 50                       # starts asgi_app.py locally
+    python loadtest.py --server flask --storage sqlite --rooms 100
+    python loadtest.py --url http://127.0.0.1:5000 --rooms 50             # an already running server
+    python loadtest.py --max-p95-ms 50 --max-error-rate 0 --json          # fail the run on regression
+
+Each room gets a seeded RNG (--seed and its index) for player counts and moves, so runs are
+comparable. Reports p50/p95/p99 latency per route, throughput, errors and (for a locally
+started server) the server's memory per room. Exits with status 1 if a threshold is missed.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+from typing import Dict, List, Optional
+
+import httpx
+
+
+# -----------------------------------------------------------------------------
+# Local Server
+# -----------------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, storage: str, port: int) -> subprocess.Popen:
+    """Starts asgi_app.py (uvicorn) or app.py (gunicorn, one worker since rooms live in memory)."""
+    workdir = tempfile.mkdtemp(prefix="sleeping_queens-loadtest-")
+    env = dict(os.environ, SQ_HIBERNATE_DIR=os.path.join(workdir, "hibernate"))
+    env["SQ_STORAGE"] = f"sqlite:///{os.path.join(workdir, 'rooms.db')}" if storage == "sqlite" else "memory"
+    env.pop("SQ_MOVE_LOG_DIR", None)
+    if kind == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", "64",
+                   "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"]
+    return subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until_up(base_url: str, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            if httpx.get(f"{base_url}/rooms", params={"limit": 1}).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.time() > deadline:
+            raise RuntimeError("Server did not come up")
+        time.sleep(0.2)
+
+
+def _rss_kb(pid: int) -> Optional[int]:
+    """Resident memory of a process and its children (Linux only, None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, StopIteration, ValueError):
+        return None
+    return rss + sum(_rss_kb(child) or 0 for child in children)
+
+
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
+
+class Metrics:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list) # Route -> seconds
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.games_finished = 0
+        self.games_abandoned = 0
+        self.peak_rss_kb: Optional[int] = None
+
+    def merge(self, other: "Metrics"):
+        for route, values in other.latencies.items():
+            self.latencies[route].extend(values)
+        for route, count in other.errors.items():
+            self.errors[route] += count
+        self.games_finished += other.games_finished
+        self.games_abandoned += other.games_abandoned
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str,
+                      ok=(200, 201, 304), **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        if response.status_code not in ok:
+            self.errors[route] += 1
+            return None
+        return response
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values: return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(metrics: Metrics, elapsed: float, rooms: int, base_rss_kb: Optional[int]) -> Dict:
+    routes = {}
+    all_latencies = []
+    for route, values in sorted(metrics.latencies.items()):
+        values.sort()
+        all_latencies.extend(values)
+        routes[route] = {
+            "count": len(values),
+            "errors": metrics.errors.get(route, 0),
+            "p50Ms": percentile(values, 50) * 1000,
+            "p95Ms": percentile(values, 95) * 1000,
+            "p99Ms": percentile(values, 99) * 1000,
+            "maxMs": values[-1] * 1000,
+        }
+    all_latencies.sort()
+    requests = len(all_latencies)
+    errors = sum(metrics.errors.values())
+    kb_per_room = None
+    if base_rss_kb is not None and metrics.peak_rss_kb is not None and rooms:
+        kb_per_room = max(0, metrics.peak_rss_kb - base_rss_kb) / rooms
+    return {
+        "routes": routes,
+        "requests": requests,
+        "errors": errors,
+        "errorRate": errors / max(1, requests + errors),
+        "elapsedSeconds": elapsed,
+        "requestsPerSecond": requests / elapsed if elapsed else 0.0,
+        "p50Ms": percentile(all_latencies, 50) * 1000,
+        "p95Ms": percentile(all_latencies, 95) * 1000,
+        "p99Ms": percentile(all_latencies, 99) * 1000,
+        "gamesFinished": metrics.games_finished,
+        "gamesAbandoned": metrics.games_abandoned,
+        "peakRssKb": metrics.peak_rss_kb,
+        "kbPerRoom": kb_per_room,
+    }
+
+
+def print_report(report: Dict):
+    print(f"{'route':<10}{'count':>8}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for route, r in report["routes"].items():
+        print(f"{route:<10}{r['count']:>8}{r['errors']:>8}{r['p50Ms']:9.2f}{r['p95Ms']:9.2f}{r['p99Ms']:9.2f}{r['maxMs']:9.2f}")
+    print(f"\n{report['requests']} requests in {report['elapsedSeconds']:.1f}s "
+          f"({report['requestsPerSecond']:.0f} req/s), {report['errors']} errors")
+    print(f"latency p50 {report['p50Ms']:.2f} ms, p95 {report['p95Ms']:.2f} ms, p99 {report['p99Ms']:.2f} ms")
+    print(f"games finished {report['gamesFinished']}, abandoned {report['gamesAbandoned']}")
+    if report["kbPerRoom"] is not None:
+        print(f"server memory: peak {report['peakRssKb'] / 1024:.1f} MB, {report['kbPerRoom']:.1f} kB per room")
+
+
+def check_thresholds(report: Dict, args) -> List[str]:
+    """Messages for every threshold the run missed."""
+    failures = []
+    for name, key, limit in (
+        ("p50", "p50Ms", args.max_p50_ms), ("p95", "p95Ms", args.max_p95_ms), ("p99", "p99Ms", args.max_p99_ms),
+    ):
+        if limit is not None and report[key] > limit:
+            failures.append(f"{name} latency {report[key]:.2f} ms > {limit} ms")
+    if args.min_rps is not None and report["requestsPerSecond"] < args.min_rps:
+        failures.append(f"throughput {report['requestsPerSecond']:.0f} req/s < {args.min_rps} req/s")
+    if args.max_error_rate is not None and report["errorRate"] > args.max_error_rate:
+        failures.append(f"error rate {report['errorRate']:.4f} > {args.max_error_rate}")
+    if args.max_kb_per_room is not None and report["kbPerRoom"] is not None and report["kbPerRoom"] > args.max_kb_per_room:
+        failures.append(f"memory {report['kbPerRoom']:.1f} kB per room > {args.max_kb_per_room} kB")
+    return failures
+
+
+# -----------------------------------------------------------------------------
+# Simulated Clients
+# -----------------------------------------------------------------------------
+
+MAX_MOVES_PER_GAME = 500
+
+
+async def poll_room(client: httpx.AsyncClient, metrics: Metrics, room_id: str, seat: dict,
+                    interval: float, done: asyncio.Event, rng: random.Random):
+    """One player's browser: polls its seat's state every `interval` seconds with ?sinceVersion like the client."""
+    version = None
+    delay = rng.uniform(0, interval) # Players don't poll in lockstep
+    while True:
+        try:
+            await asyncio.wait_for(done.wait(), delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        params = dict(seat)
+        if version is not None:
+            params["sinceVersion"] = version
+        response = await metrics.request(client, "state", "GET", f"/rooms/{room_id}", params=params)
+        if response is not None and response.status_code == 200:
+            version = response.json()["version"]
+        delay = interval
+
+
+async def play_room(client: httpx.AsyncClient, metrics: Metrics, index: int, args, deadline: float):
+    """Creates a room, seats 2-5 bots and plays it to the end while every player polls."""
+    rng = random.Random(args.seed * 1000003 + index)
+    await metrics.request(client, "lobby", "GET", "/rooms", params={"status": "open"})
+    response = await metrics.request(client, "create", "POST", "/rooms", json={})
+    if response is None:
+        metrics.games_abandoned += 1
+        return
+    room_id = response.json()["roomId"]
+
+    seats = {} # playerId -> seatKey
+    for seat in range(rng.randint(args.min_players, args.max_players)):
+        response = await metrics.request(client, "join", "POST", f"/rooms/{room_id}/join", json={"name": f"Bot {seat + 1}"})
+        if response is not None:
+            joined = response.json()
+            seats[joined["playerId"]] = joined["seatKey"]
+    if not seats or await metrics.request(client, "start", "POST", f"/rooms/{room_id}/start") is None:
+        metrics.games_abandoned += 1
+        return
+
+    done = asyncio.Event()
+    pollers = [asyncio.ensure_future(poll_room(client, metrics, room_id, {"playerId": pid, "seatKey": key}, args.poll_interval, done, random.Random(rng.random())))
+               for pid, key in seats.items()]
+    try:
+        finished = False
+        first = next(iter(seats))
+        for _ in range(MAX_MOVES_PER_GAME):
+            if time.time() > deadline:
+                break
+            response = await metrics.request(client, "state", "GET", f"/rooms/{room_id}", params={"playerId": first, "seatKey": seats[first]})
+            if response is None:
+                break
+            state = response.json()
+            if state["winnerId"]:
+                finished = True
+                break
+            turn = {"playerId": state["turnPlayerId"], "seatKey": seats[state["turnPlayerId"]]}
+            response = await metrics.request(client, "moves", "GET", f"/rooms/{room_id}/moves", params=turn)
+            if response is None or not response.json()["moves"]:
+                break
+            move = rng.choice(response.json()["moves"])
+            await metrics.request(client, "play", "POST", f"/rooms/{room_id}/play", json={
+                **turn, "cardIds": move["cardIds"], "targetCardId": move["targetCardId"],
+                "sinceVersion": state["version"],
+            })
+            if args.think > 0:
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think)
+        if finished:
+            metrics.games_finished += 1
+        else:
+            metrics.games_abandoned += 1
+    finally:
+        done.set()
+        await asyncio.gather(*pollers)
+
+
+async def drive(base_url: str, args, indices: List[int], deadline: float) -> Metrics:
+    """Plays the rooms with the given indices, `args.concurrency` of them at a time (per process)."""
+    metrics = Metrics()
+    concurrency = max(1, args.concurrency // args.processes)
+    limits = httpx.Limits(max_connections=concurrency * (args.max_players + 1), max_keepalive_connections=None)
+    slots = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        async def one_room(index: int):
+            async with slots:
+                if time.time() < deadline:
+                    await play_room(client, metrics, index, args, deadline)
+
+        await asyncio.gather(*(one_room(i) for i in indices))
+    return metrics
+
+
+def _drive_share(share) -> Metrics:
+    return asyncio.run(drive(*share))
+
+
+def _sample_memory(metrics: Metrics, pid: int, stop: threading.Event):
+    while not stop.is_set():
+        rss = _rss_kb(pid)
+        if rss is not None:
+            metrics.peak_rss_kb = max(metrics.peak_rss_kb or 0, rss)
+        stop.wait(0.5)
+
+
+def run(args) -> Dict:
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = _free_port()
+        server = start_server(args.server, args.storage, port)
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        wait_until_up(base_url)
+        metrics = Metrics()
+        base_rss = _rss_kb(server.pid) if server else None
+        stop_sampling = threading.Event()
+        sampler = threading.Thread(target=_sample_memory, args=(metrics, server.pid, stop_sampling), daemon=True) if server else None
+        if sampler is not None:
+            sampler.start()
+
+        # One client process rarely gets past a few hundred requests/s, so the rooms are spread over --processes
+        started = time.perf_counter()
+        deadline = time.time() + args.duration
+        shares = [(base_url, args, list(range(i, args.rooms, args.processes)), deadline) for i in range(args.processes)]
+        if args.processes == 1:
+            results = [_drive_share(shares[0])]
+        else:
+            with Pool(args.processes) as pool:
+                results = pool.map(_drive_share, shares)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            metrics.merge(result)
+
+        if sampler is not None:
+            stop_sampling.set()
+            sampler.join()
+        return summarize(metrics, elapsed, args.rooms, base_rss)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+def _player_range(text: str):
+    low, _, high = text.partition("..")
+    return int(low), int(high or low)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Sleeping Queens HTTP API")
+    parser.add_argument("--server", choices=["asgi", "flask"], default="asgi", help="Which server to start locally")
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory", help="SQ_STORAGE of the local server")
+    parser.add_argument("--url", help="Test this running server instead of starting one")
+    parser.add_argument("--rooms", type=int, default=100, help="Games to play")
+    parser.add_argument("--concurrency", type=int, default=25, help="Games in progress at once")
+    parser.add_argument("--processes", type=int, default=1, help="Client processes generating the load")
+    parser.add_argument("--players", default="2..5", help="Players per game, e.g. 3 or 2..5")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between state polls per player")
+    parser.add_argument("--think", type=float, default=0.2, help="Average seconds between moves")
+    parser.add_argument("--duration", type=float, default=300.0, help="Stop starting moves after this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    thresholds = parser.add_argument_group("thresholds (exit status 1 when missed)")
+    thresholds.add_argument("--max-p50-ms", type=float)
+    thresholds.add_argument("--max-p95-ms", type=float)
+    thresholds.add_argument("--max-p99-ms", type=float)
+    thresholds.add_argument("--min-rps", type=float)
+    thresholds.add_argument("--max-error-rate", type=float)
+    thresholds.add_argument("--max-kb-per-room", type=float)
+    args = parser.parse_args(argv)
+    args.min_players, args.max_players = _player_range(args.players)
+
+    report = run(args)
+    failures = check_thresholds(report, args)
+    if args.json:
+        print(json.dumps(dict(report, failures=failures), indent=2))
+    else:
+        print_report(report)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Set
+
+from game_engine import ChangeSet, GameState, add_player, changes_since, play_card, start_game
+import codec
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Append-only Move Log
+# Every room has a snapshot file (<room>.snap, codec.encode) and a log of the engine calls
+# accepted since that snapshot (<room>.log, one JSON line per call with the resulting version
+# and the order every shuffle produced). Records are buffered and written + fsynced in batches
+# by a background thread; a new snapshot is taken every `snapshot_every` calls and truncates the log.
+# Recovery loads each snapshot and replays its log tail through the engine.
+# -----------------------------------------------------------------------------
+
+SNAPSHOT_SUFFIX = ".snap"
+LOG_SUFFIX = ".log"
+
+
+def _record_line(changes: ChangeSet) -> str:
+    record = {
+        "v": changes.version,
+        "call": list(changes.call),
+        "shuffles": [[c.index for c in op[3]] for op in changes.ops if op[0] == "shuffle"],
+    }
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def _apply(game: GameState, call: List):
+    kind = call[0]
+    if kind == "join":
+        add_player(game, call[2], player_id=call[1], bot=call[3] if len(call) > 3 else None)
+    elif kind == "start":
+        start_game(game)
+    elif kind == "play":
+        play_card(game, call[1], call[2], call[3])
+    else:
+        raise ValueError(f"Unknown call: {kind}")
+
+
+class MoveLog:
+    def __init__(self, directory: str, snapshot_every: int = 50, fsync_interval: float = 0.2):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        # room_id -> [snapshot blob or None, log lines] waiting to be written
+        self._pending: Dict[str, List] = {}
+        self._logged: Dict[str, int] = {}          # Last version handed to the log per room
+        self._since_snapshot: Dict[str, int] = {}  # Calls logged since the last snapshot
+        self._forgotten: Set[str] = set()          # Rooms whose files the flusher removes
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()           # Lock order is always _io_lock -> _lock
+        self._closed = False
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="movelog-flush", daemon=True)
+        self._flusher.start()
+
+    def _path(self, room_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, os.path.basename(room_id) + suffix)
+
+    # --- Recording ---
+    def record(self, game: GameState):
+        """Queues the calls applied to `game` since the last record() (or a snapshot if they can't be told apart)."""
+        with self._lock:
+            logged = self._logged.get(game.id)
+            if logged == game.version:
+                return
+            changes = changes_since(game, logged) if logged is not None else None
+            since_snapshot = self._since_snapshot.get(game.id, 0)
+            if changes is None or since_snapshot + len(changes) >= self.snapshot_every:
+                self._pending[game.id] = [codec.encode(game), []] # Supersedes any queued lines
+                self._since_snapshot[game.id] = 0
+            else:
+                self._pending.setdefault(game.id, [None, []])[1].extend(_record_line(c) for c in changes)
+                self._since_snapshot[game.id] = since_snapshot + len(changes)
+            self._logged[game.id] = game.version
+
+    def forget(self, room_id: str):
+        """Drops a room's log (deleted, or persisted elsewhere). The files go with the next flush."""
+        with self._lock:
+            self._pending.pop(room_id, None)
+            self._logged.pop(room_id, None)
+            self._since_snapshot.pop(room_id, None)
+            self._forgotten.add(room_id)
+
+    # --- Writing ---
+    def _flush_loop(self):
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            self.flush()
+
+    def flush(self):
+        """Writes and fsyncs everything queued so far."""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                forgotten, self._forgotten = self._forgotten, set()
+            # Removals first: a room forgotten and then recorded again starts over with a snapshot
+            for room_id in forgotten:
+                for suffix in (SNAPSHOT_SUFFIX, LOG_SUFFIX):
+                    try:
+                        os.remove(self._path(room_id, suffix))
+                    except FileNotFoundError:
+                        pass
+            for room_id, (snapshot, lines) in pending.items():
+                mode = "a"
+                if snapshot is not None:
+                    tmp_path = self._path(room_id, SNAPSHOT_SUFFIX) + ".tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(snapshot)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self._path(room_id, SNAPSHOT_SUFFIX))
+                    mode = "w" # The snapshot covers everything logged so far
+                with open(self._path(room_id, LOG_SUFFIX), mode) as f:
+                    f.write("".join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def close(self):
+        self._closed = True
+        self._flusher.join()
+        self.flush()
+
+    # --- Recovery ---
+    def _replay(self, game: GameState):
+        """Applies the logged calls newer than the snapshot."""
+        try:
+            f = open(self._path(game.id, LOG_SUFFIX))
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break # Torn write at the end of the log
+                if record["v"] <= game.version:
+                    continue
+                game.replay_shuffles = deque(record["shuffles"])
+                try:
+                    _apply(game, record["call"])
+                except ValueError:
+                    logger.exception("Move log replay of room %s stopped at version %s", game.id, record["v"])
+                    break
+                finally:
+                    game.replay_shuffles = None
+                if game.version != record["v"]:
+                    logger.error("Move log replay of room %s diverged at version %s (got %s)", game.id, record["v"], game.version)
+                    break
+
+    def recover(self) -> List[GameState]:
+        """
+        Rebuilds every logged room from its last snapshot plus the log tail.
+        The next record() of a recovered room starts over with a fresh snapshot.
+        """
+        games = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SNAPSHOT_SUFFIX):
+                continue
+            with open(os.path.join(self.directory, name), "rb") as f:
+                game = codec.decode(f.read())
+            self._replay(game)
+            games.append(game)
+        return games
@@ -0,0 +1,361 @@
+"""
+Shard router: spreads rooms over several backend worker processes by consistent hashing of
+the room id (see sharding.py), so capacity grows with cores and nodes.
+
+    python router.py --local 4     # 4 local workers (asgi_app.py) + the router on :5000
+
+    SQ_SHARD_WORKERS=http://w1:5000,http://w2:5000 SQ_SHARD_TOKEN=$(openssl rand -hex 16) uvicorn router:app --port 5000
+
+The router mints room ids itself (POST /rooms), so each room is created on the worker that owns
+it, and proxies every /rooms/<id>/... request to that worker. GET /rooms merges the workers'
+lobby pages. POST /shards {"workers": [...]} changes the worker set and moves every room whose owner
+changed (export from the old worker, import on the new one); requests for a room wait while it
+moves, and its /events streams end quietly so clients reconnect to the new owner.
+Workers must share SQ_SHARD_TOKEN, which enables their /internal routes; /shards (GET and POST)
+requires it in X-Shard-Token as well.
+"""
+import argparse
+import asyncio
+import contextlib
+import hmac
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from sharding import HashRing
+
+logger = logging.getLogger(__name__)
+
+# Connection-level headers that must not be forwarded
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+}
+REQUEST_SKIP = HOP_BY_HOP | {"host", "content-length", "accept-encoding"}
+# The router's own server sets these on every response it sends
+RESPONSE_SKIP = HOP_BY_HOP | {"date", "server"}
+
+# The token lets its holder move rooms anywhere (POST /shards), so guessable ones are refused
+PLACEHOLDER_TOKENS = {"change-me", "changeme", "secret", "token"}
+MIN_TOKEN_LENGTH = 16
+
+# Lobby page sizes, as in api.py
+LOBBY_PAGE_SIZE = 50
+LOBBY_MAX_PAGE_SIZE = 500
+
+
+class ShardRouter:
+    def __init__(self, workers: List[str], token: str):
+        self.ring = HashRing(workers)
+        self.token = token
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None)) # Streams stay open
+        self._moving: Dict[str, str] = {}              # Room id -> worker still holding it during a rebalance
+        self._move_locks: Dict[str, asyncio.Lock] = {} # Held while a moving room is exported/imported
+        # Room creations in flight vs. a rebalance listing rooms: the ring only switches when none
+        # are in flight, and new ones wait for the switch (creations never wait for each other)
+        self._creates = asyncio.Condition()
+        self._creating = 0
+        self._switching = False
+        self._rebalance_lock = asyncio.Lock()          # One rebalance at a time
+
+    @property
+    def _internal(self) -> Dict[str, str]:
+        return {"X-Shard-Token": self.token}
+
+    def owner(self, room_id: str) -> str:
+        return self._moving.get(room_id) or self.ring.node_for(room_id)
+
+    # --- Rooms ---
+    async def create_room(self, api_key: Optional[str]) -> httpx.Response:
+        # Counted as in flight, so a rebalance never misses a room created while it switches rings
+        async with self._creates:
+            await self._creates.wait_for(lambda: not self._switching)
+            self._creating += 1
+        try:
+            room_id = str(uuid.uuid4())
+            return await self.client.post(
+                f"{self.ring.node_for(room_id)}/internal/rooms",
+                json={"roomId": room_id, "apiKey": api_key}, headers=self._internal,
+            )
+        finally:
+            async with self._creates:
+                self._creating -= 1
+                self._creates.notify_all()
+
+    async def list_rooms(self, params: Dict[str, str]) -> Dict:
+        """
+        Merges one lobby page from every worker: each returns its newest rooms below the same
+        cursor, so the newest `limit` of all of them are the page. Raises ValueError for invalid params.
+        """
+        workers = set(self.ring.nodes) | set(self._moving.values())
+        responses = await asyncio.gather(*(self.client.get(f"{w}/rooms", params=params) for w in workers))
+        rooms: Dict[str, dict] = {}
+        more = False
+        for response in responses:
+            if response.status_code == 400:
+                raise ValueError(response.json().get("error")) # Every worker validates the same way
+            response.raise_for_status()
+            data = response.json()
+            more = more or data.get("nextCursor") is not None
+            for room in data["rooms"]:
+                rooms[room["id"]] = room
+
+        limit = max(1, min(int(params.get("limit") or LOBBY_PAGE_SIZE), LOBBY_MAX_PAGE_SIZE))
+        page = sorted(rooms.values(), key=lambda r: (r["createdAt"], r["id"]), reverse=True)
+        more = more or len(page) > limit
+        page = page[:limit]
+        next_cursor = f"{page[-1]['createdAt']!r}:{page[-1]['id']}" if more and page else None # As api.lobby_cursor
+        return {"rooms": page, "nextCursor": next_cursor}
+
+    async def forward(self, request: Request, room_id: str, stream: bool = False) -> Response:
+        lock = self._move_locks.get(room_id)
+        if lock is None or stream:
+            return await self._send(request, self.owner(room_id), stream)
+        async with lock: # The room is being moved: wait for it to land (and keep it from moving mid-request)
+            return await self._send(request, self.owner(room_id), stream=False)
+
+    async def _send(self, request: Request, worker: str, stream: bool) -> Response:
+        url = worker + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in REQUEST_SKIP]
+        # Only the client's own encodings: httpx would otherwise ask for gzip on its behalf
+        headers.append(("accept-encoding", request.headers.get("accept-encoding") or "identity"))
+        upstream = self.client.build_request(request.method, url, headers=headers, content=await request.body())
+        response = await self.client.send(upstream, stream=True)
+        response_headers = _response_headers(response)
+        if stream:
+            return StreamingResponse(
+                response.aiter_raw(), status_code=response.status_code,
+                headers=response_headers, background=BackgroundTask(response.aclose),
+            )
+        try:
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+        return Response(body, status_code=response.status_code, headers=response_headers)
+
+    # --- Rebalancing ---
+    async def rebalance(self, workers: List[str]) -> Dict:
+        """Switches to a new worker set, moving the rooms whose owner changes."""
+        async with self._rebalance_lock:
+            new_ring = HashRing(workers, self.ring.replicas)
+            async with self._creates:
+                self._switching = True
+            try:
+                async with self._creates:
+                    await self._creates.wait_for(lambda: self._creating == 0)
+                moves: Dict[str, str] = {}
+                for worker in self.ring.nodes:
+                    response = await self.client.get(f"{worker}/internal/rooms", headers=self._internal)
+                    response.raise_for_status()
+                    for room_id in response.json()["rooms"]:
+                        if new_ring.node_for(room_id) != worker:
+                            moves[room_id] = worker
+                for room_id in moves:
+                    self._move_locks[room_id] = asyncio.Lock()
+                self._moving.update(moves)
+                self.ring = new_ring
+            finally:
+                async with self._creates:
+                    self._switching = False
+                    self._creates.notify_all()
+
+            moved, failed = 0, 0
+            for room_id, source in moves.items():
+                async with self._move_locks[room_id]:
+                    try:
+                        if await self._move(room_id, source, new_ring.node_for(room_id)):
+                            moved += 1
+                        del self._moving[room_id]
+                    except httpx.HTTPError:
+                        failed += 1 # Stays pinned to its old worker (see _moving)
+                        logger.exception("Moving room %s from %s failed", room_id, source)
+                del self._move_locks[room_id]
+            return {"workers": new_ring.nodes, "moved": moved, "failed": failed}
+
+    async def _move(self, room_id: str, source: str, target: str) -> bool:
+        response = await self.client.post(f"{source}/internal/rooms/{room_id}/export", headers=self._internal)
+        if response.status_code == 404:
+            return False # Deleted in the meantime
+        response.raise_for_status()
+        snapshot = response.content
+        try:
+            (await self.client.put(f"{target}/internal/rooms/{room_id}", content=snapshot, headers=self._internal)).raise_for_status()
+        except httpx.HTTPError:
+            # Put it back rather than lose it
+            (await self.client.put(f"{source}/internal/rooms/{room_id}", content=snapshot, headers=self._internal)).raise_for_status()
+            raise
+        return True
+
+    async def wait_for_workers(self, timeout: float = 15.0):
+        deadline = time.time() + timeout
+        for worker in self.ring.nodes:
+            while True:
+                try:
+                    if (await self.client.get(f"{worker}/health")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.time() > deadline:
+                    logger.warning("Worker %s is not answering", worker)
+                    break
+                await asyncio.sleep(0.2)
+
+
+def _response_headers(response: httpx.Response) -> Dict[str, str]:
+    """
+    The worker's response headers the router passes on. CORS is left to the router's own middleware
+    (which adds Vary: Origin again), and repeated Vary values are merged once.
+    """
+    headers = {k: v for k, v in response.headers.items()
+               if k.lower() not in RESPONSE_SKIP and not k.lower().startswith("access-control-")}
+    vary = [v.strip() for v in headers.pop("vary", "").split(",") if v.strip() and v.strip().lower() != "origin"]
+    if vary:
+        headers["vary"] = ", ".join(dict.fromkeys(vary))
+    return headers
+
+
+router: Optional[ShardRouter] = None
+
+
+def _error(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+async def list_rooms(request: Request):
+    try:
+        return JSONResponse(await router.list_rooms(dict(request.query_params)))
+    except ValueError as e:
+        return _error(str(e), 400)
+    except httpx.HTTPError as e:
+        return _error(f"Worker unavailable: {e}", 502)
+
+async def create_room(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        response = await router.create_room((data or {}).get("apiKey"))
+    except httpx.HTTPError as e:
+        return _error(f"Worker unavailable: {e}", 502)
+    return Response(response.content, status_code=response.status_code, media_type="application/json")
+
+async def room_request(request: Request):
+    room_id = request.path_params["room_id"]
+    try:
+        return await router.forward(request, room_id, stream=request.url.path.endswith("/events"))
+    except httpx.HTTPError as e:
+        return _error(f"Worker unavailable: {e}", 502)
+
+async def shards(request: Request):
+    # The worker set is internal topology too, so reading it needs the token as well
+    if not hmac.compare_digest(request.headers.get("X-Shard-Token", ""), router.token):
+        return _error("Forbidden", 403)
+    if request.method == "GET":
+        return JSONResponse({"workers": router.ring.nodes, "moving": len(router._moving)})
+    try:
+        data = await request.json()
+    except ValueError:
+        return _error("Invalid JSON body", 400)
+    workers = data.get("workers") if isinstance(data, dict) else None
+    if not workers or not isinstance(workers, list) or not all(isinstance(w, str) for w in workers):
+        return _error("workers must be a non-empty list of URLs", 400)
+    try:
+        return JSONResponse(await router.rebalance(workers))
+    except httpx.HTTPError as e:
+        return _error(f"Rebalance failed: {e}", 502)
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global router
+    workers = [w.strip().rstrip("/") for w in os.environ.get("SQ_SHARD_WORKERS", "").split(",") if w.strip()]
+    token = os.environ.get("SQ_SHARD_TOKEN")
+    if not workers or not token:
+        raise RuntimeError("SQ_SHARD_WORKERS and SQ_SHARD_TOKEN are required")
+    if token in PLACEHOLDER_TOKENS or len(token) < MIN_TOKEN_LENGTH:
+        raise RuntimeError(f"SQ_SHARD_TOKEN must be a random secret of at least {MIN_TOKEN_LENGTH} characters")
+    router = ShardRouter(workers, token)
+    await router.wait_for_workers()
+    yield
+    await router.client.aclose()
+
+
+ALL_METHODS = ["GET", "POST", "PUT", "DELETE", "PATCH"]
+
+app = Starlette(
+    routes=[
+        Route("/rooms", list_rooms, methods=["GET"]),
+        Route("/rooms", create_room, methods=["POST"]),
+        Route("/rooms/{room_id}", room_request, methods=ALL_METHODS),
+        Route("/rooms/{room_id}/{rest:path}", room_request, methods=ALL_METHODS),
+        Route("/shards", shards, methods=["GET", "POST"]),
+        Route("/health", health, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
+
+
+# -----------------------------------------------------------------------------
+# Local Cluster
+# -----------------------------------------------------------------------------
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Sleeping Queens shard router")
+    parser.add_argument("--local", type=int, default=0, help="Start this many local worker processes")
+    parser.add_argument("--workers", default="", help="Comma separated URLs of already running workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--worker-base-port", type=int, default=5101)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(name)s: %(message)s") # Lines up with uvicorn's
+    logging.getLogger("httpx").setLevel(logging.WARNING) # Not a line per proxied request
+
+    token = os.environ.get("SQ_SHARD_TOKEN") or secrets.token_hex(16)
+    workers = [w for w in args.workers.split(",") if w]
+    processes = []
+    for i in range(args.local):
+        port = args.worker_base_port + i
+        # Local workers keep their rooms in memory, each with its own hibernation directory
+        env = dict(os.environ, SQ_SHARD_TOKEN=token, SQ_STORAGE="memory",
+                   SQ_HIBERNATE_DIR=os.path.join(tempfile.gettempdir(), f"sleeping_queens-{port}"))
+        env.pop("SQ_MOVE_LOG_DIR", None)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ))
+        workers.append(f"http://127.0.0.1:{port}")
+
+    os.environ["SQ_SHARD_WORKERS"] = ",".join(workers)
+    os.environ["SQ_SHARD_TOKEN"] = token
+    logger.info("Routing to %d workers: %s", len(workers), ", ".join(workers))
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
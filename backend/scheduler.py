@@ -0,0 +1,191 @@
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from game_engine import GameState, Move, play_card
+from storage import get_game, hibernate_game, room_lock
+from bots import get_policy
+from ismcts import BotPool
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Turn Scheduler
+# Plays the turns no request will: those of bot seats (Player.bot). A few worker threads take
+# rooms from one FIFO queue in which a room waits at most once and goes to the back after every
+# move, so rooms full of bots can't starve the others. Search policies think in a BotPool
+# (worker processes) without holding the room lock; the others are cheap and run under it.
+# A room whose player lets their turn time out was abandoned: it is paused (hibernated, see
+# storage.py) rather than played for them, and wakes up unchanged on the next request.
+# -----------------------------------------------------------------------------
+
+DEFAULT_WORKERS = 2
+DEFAULT_TURN_TIMEOUT = 120.0 # seconds
+FALLBACK_POLICY = "greedy"   # Backs up searches that found no move
+SEARCH_POLICIES = ("ismcts",)
+
+
+class TurnScheduler:
+    def __init__(self, on_change: Callable[[GameState], None], workers: int = DEFAULT_WORKERS,
+                 turn_timeout: float = DEFAULT_TURN_TIMEOUT):
+        self.on_change = on_change # Called (room lock held) after every move played, like after_mutation
+        self.workers = workers
+        self.turn_timeout = turn_timeout
+        self._cond = threading.Condition()
+        self._ready: Deque[str] = deque()
+        self._queued: Dict[str, int] = {}  # Room id -> the version whose turn should be played
+        self._busy: Set[str] = set()       # Rooms a worker is playing right now
+        self._deadlines: Dict[str, Tuple[float, int]] = {} # Room id -> (deadline, version) of its human turn
+        self._timers: List[Tuple[float, str]] = []         # Heap of (deadline, room id), one per room at most
+        self._timed: Set[str] = set()                      # Rooms with an entry in _timers
+        self._threads: List[threading.Thread] = []
+        self._pool: Optional[BotPool] = None
+        self._rng = random.Random()
+
+    @classmethod
+    def from_env(cls, on_change: Callable[[GameState], None]) -> "TurnScheduler":
+        """SQ_SCHEDULER_WORKERS (default 2) and SQ_TURN_TIMEOUT (seconds, default 120, 0 disables timeouts)."""
+        workers = int(os.environ.get("SQ_SCHEDULER_WORKERS") or DEFAULT_WORKERS)
+        turn_timeout = float(os.environ.get("SQ_TURN_TIMEOUT") or DEFAULT_TURN_TIMEOUT)
+        return cls(on_change, workers, turn_timeout)
+
+    def notify(self, game: GameState):
+        """Schedules the turn `game` is waiting for. Call after every mutation, with the room lock held."""
+        if not game.started or game.winner_id:
+            return
+        player = game.players.get(game.turn_player_id)
+        if player is None:
+            return
+        with self._cond:
+            if player.bot:
+                self._deadlines.pop(game.id, None)
+                self._enqueue(game.id, game.version)
+            elif self.turn_timeout > 0:
+                deadline = time.monotonic() + self.turn_timeout
+                self._deadlines[game.id] = (deadline, game.version)
+                if game.id in self._timed:
+                    return # Its heap entry comes up earlier and is pushed back then
+                self._timed.add(game.id)
+                heapq.heappush(self._timers, (deadline, game.id))
+            else:
+                return
+            self._start()
+            self._cond.notify()
+
+    # --- Queue (all with _cond held) ---
+    def _enqueue(self, room_id: str, version: int):
+        if room_id not in self._queued and room_id not in self._busy:
+            self._ready.append(room_id)
+        self._queued[room_id] = max(version, self._queued.get(room_id, version)) # Stale timers never win
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"turn-scheduler-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _fire_timers(self, now: float):
+        """Queues the rooms whose turn deadline has passed."""
+        while self._timers and self._timers[0][0] <= now:
+            _, room_id = heapq.heappop(self._timers)
+            self._timed.discard(room_id)
+            deadline, version = self._deadlines.get(room_id, (None, None))
+            if deadline is None:
+                continue # A bot's turn came up instead
+            if deadline > now: # Moved meanwhile: wait for the new deadline
+                self._timed.add(room_id)
+                heapq.heappush(self._timers, (deadline, room_id))
+                continue
+            del self._deadlines[room_id]
+            self._enqueue(room_id, version)
+
+    def _next_turn(self) -> Tuple[str, int]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._fire_timers(now)
+                if self._ready:
+                    room_id = self._ready.popleft()
+                    self._busy.add(room_id)
+                    return room_id, self._queued.pop(room_id)
+                self._cond.wait(self._timers[0][0] - now if self._timers else None)
+
+    def _done(self, room_id: str):
+        with self._cond:
+            self._busy.discard(room_id)
+            if room_id in self._queued: # Came up again while it was being played
+                self._ready.append(room_id)
+                self._cond.notify()
+
+    def _work(self):
+        while True:
+            room_id, version = self._next_turn()
+            try:
+                self._take_turn(room_id, version)
+            except Exception: # Keep scheduling even if one turn fails
+                logger.exception("Turn of room %s failed", room_id)
+            finally:
+                self._done(room_id)
+
+    # --- Turns ---
+    def _bot_pool(self) -> BotPool:
+        with self._cond:
+            if self._pool is None:
+                self._pool = BotPool.from_env()
+            return self._pool
+
+    def _take_turn(self, room_id: str, version: int):
+        with room_lock(room_id):
+            game = self._current(room_id, version)
+            if game is None:
+                return
+            player_id = game.turn_player_id
+            policy = game.players[player_id].bot
+            if policy is None: # A person's turn timed out
+                self._pause(room_id)
+                return
+            if policy not in SEARCH_POLICIES:
+                self._play(game, player_id, get_policy(policy)(game, player_id, self._rng))
+                return
+            future = self._bot_pool().choose(game, player_id)
+
+        move = future.result()
+        with room_lock(room_id):
+            game = self._current(room_id, version)
+            if game is not None:
+                fallback = get_policy(FALLBACK_POLICY)(game, player_id, self._rng)
+                self._play(game, player_id, ([move] if move else []) + fallback)
+
+    def _current(self, room_id: str, version: int) -> Optional[GameState]:
+        """The room if it is still waiting for the turn of `version` (nobody moved, it wasn't deleted or moved away)."""
+        try:
+            game = get_game(room_id)
+        except KeyError:
+            return None
+        if game.version != version or game.winner_id or not game.started:
+            return None
+        return game
+
+    def _pause(self, room_id: str):
+        logger.info("Turn in room %s timed out, hibernating it", room_id)
+        hibernate_game(room_id)
+
+    def _play(self, game: GameState, player_id: str, moves: List[Move]):
+        # Policies rank moves, the first the engine accepts is played (a hand of only
+        # Dragons and Wands has none, and the turn stays open)
+        for move in moves:
+            try:
+                play_card(game, player_id, move.card_ids, move.target_card_id)
+            except ValueError:
+                continue
+            self.on_change(game)
+            return
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
@@ -0,0 +1,46 @@
+import bisect
+import hashlib
+from typing import Iterable, List
+
+# -----------------------------------------------------------------------------
+# Consistent Hashing
+# Every worker gets `replicas` points on a 64-bit ring; a room belongs to the first point
+# at or after the hash of its id. Adding or removing a worker only moves the rooms on the
+# arcs it gains or loses (about 1/N of them), see router.py for the migration.
+# -----------------------------------------------------------------------------
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 128):
+        self.replicas = replicas
+        self.nodes: List[str] = []
+        self._points: List[int] = []  # Sorted
+        self._owners: List[str] = []  # Aligned with _points
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes: return
+        self.nodes.append(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            pos = bisect.bisect(self._points, point)
+            self._points.insert(pos, point)
+            self._owners.insert(pos, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes: return
+        self.nodes.remove(node)
+        keep = [(p, n) for p, n in zip(self._points, self._owners) if n != node]
+        self._points = [p for p, _ in keep]
+        self._owners = [n for _, n in keep]
+
+    def node_for(self, key: str) -> str:
+        """The node owning `key`. Raises LookupError on an empty ring."""
+        if not self._points:
+            raise LookupError("No nodes in the hash ring")
+        pos = bisect.bisect_left(self._points, _hash(key)) % len(self._points)
+        return self._owners[pos]
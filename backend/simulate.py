@@ -0,0 +1,227 @@
+"""
+Headless self-play simulator (no Flask involved).
+
+    python simulate.py --games 100000 --players 2..5 --workers 8 --policies greedy,random
+
+Every game gets a deterministic seed derived from --seed and its index, so runs are
+reproducible regardless of the worker count. Aggregate statistics are streamed to stderr
+while running and printed at the end (use --json for machine readable output).
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, List, Optional
+
+from game_engine import ChangeSet, add_player, create_new_game, play_card, start_game
+from bots import get_policy
+
+
+# -----------------------------------------------------------------------------
+# Single Game
+# -----------------------------------------------------------------------------
+
+def _count_outcome(events: Counter, card_type: str, changes: ChangeSet, player_id: str):
+    """Classifies what a move did from the engine's change set."""
+    moves = [(op[2], op[4]) for op in changes.ops if op[0] == "move"]
+    woke = [dst[1] for src, dst in moves if src[0] == "sleeping" and dst[0] == "awake"]
+
+    if card_type == "king":
+        events["king_wake"] += 1
+    elif card_type == "knight":
+        stolen = any(src[0] == "awake" and dst[0] == "awake" for src, dst in moves)
+        events["knight_steal" if stolen else "knight_blocked"] += 1
+    elif card_type == "potion":
+        slept = any(src[0] == "awake" and dst[0] == "sleeping" for src, dst in moves)
+        events["potion_sleep" if slept else "potion_blocked"] += 1
+    elif card_type == "jester":
+        # The first card taken from the deck before the Jester itself is discarded is the reveal
+        revealed_to = None
+        for src, dst in moves:
+            if src[0] == "hand":
+                break
+            if src[0] == "deck":
+                revealed_to = dst
+                break
+        if revealed_to is None:
+            events["jester_empty"] += 1
+        elif revealed_to == ("hand", player_id):
+            events["jester_power"] += 1
+        elif woke:
+            events["jester_woke_self" if woke[0] == player_id else "jester_woke_other"] += 1
+        else:
+            events["jester_no_queen"] += 1
+    elif card_type == "rose":
+        events["rose_bonus"] += 1
+
+
+def play_game(task) -> Dict:
+    """Plays one game to the end (or to max_turns). `task` is (seed, num_players, policy_names, max_turns)."""
+    seed, num_players, policy_names, max_turns = task
+    rng = random.Random(seed * 2 + 1)
+
+    game = create_new_game(seed=seed * 2)
+    seats = [add_player(game, f"Bot {i + 1}") for i in range(num_players)]
+    seat_of = {p.id: i for i, p in enumerate(seats)}
+    names = [policy_names[i % len(policy_names)] for i in range(num_players)]
+    policies = [get_policy(name) for name in names]
+    start_game(game)
+
+    events: Counter = Counter()
+    turns = 0
+    while not game.winner_id and turns < max_turns:
+        player_id = game.turn_player_id
+        hand = {c.id: c for c in game.players[player_id].hand}
+        for move in policies[seat_of[player_id]](game, player_id, rng):
+            try:
+                play_card(game, player_id, move.card_ids, move.target_card_id)
+            except ValueError:
+                continue
+            break
+        else:
+            break # Nothing playable (e.g. a hand of only Dragons and Wands)
+
+        turns += 1
+        card_type = hand[move.card_ids[0]].type if move.card_ids and move.card_ids[0] in hand else "rose"
+        _count_outcome(events, card_type, game.change_log[-1], player_id)
+
+    winner_seat = seat_of.get(game.winner_id)
+    return {
+        "players": num_players,
+        "turns": turns,
+        "winnerSeat": winner_seat,
+        "winnerPolicy": names[winner_seat] if winner_seat is not None else None,
+        "policies": names,
+        "events": events,
+    }
+
+
+# -----------------------------------------------------------------------------
+# Aggregation
+# -----------------------------------------------------------------------------
+
+class SimulationStats:
+    def __init__(self):
+        self.games = 0
+        self.unfinished = 0
+        self.turns: Counter = Counter()
+        self.seat_wins: Dict[int, Counter] = {}
+        self.games_by_players: Counter = Counter()
+        self.policy_seats: Counter = Counter()
+        self.policy_wins: Counter = Counter()
+        self.events: Counter = Counter()
+
+    def add(self, result: Dict):
+        self.games += 1
+        num_players = result["players"]
+        self.games_by_players[num_players] += 1
+        self.turns[result["turns"]] += 1
+        self.events.update(result["events"])
+        self.policy_seats.update(result["policies"])
+        if result["winnerSeat"] is None:
+            self.unfinished += 1
+        else:
+            self.seat_wins.setdefault(num_players, Counter())[result["winnerSeat"]] += 1
+            self.policy_wins[result["winnerPolicy"]] += 1
+
+    def _turn_percentile(self, pct: float) -> int:
+        target, seen = pct * self.games, 0
+        for turns in sorted(self.turns):
+            seen += self.turns[turns]
+            if seen >= target:
+                return turns
+        return 0
+
+    def to_dict(self) -> Dict:
+        total_turns = sum(t * n for t, n in self.turns.items())
+        return {
+            "games": self.games,
+            "unfinished": self.unfinished,
+            "turns": {
+                "mean": round(total_turns / self.games, 2) if self.games else 0,
+                "p50": self._turn_percentile(0.5),
+                "p95": self._turn_percentile(0.95),
+                "max": max(self.turns) if self.turns else 0,
+            },
+            "seatWinRate": {
+                n: [round(wins[seat] / self.games_by_players[n], 4) for seat in range(n)]
+                for n, wins in sorted(self.seat_wins.items())
+            },
+            "policyWinRate": {
+                name: round(self.policy_wins[name] / seats, 4) for name, seats in self.policy_seats.items()
+            },
+            "eventsPerGame": {
+                name: round(count / self.games, 4) for name, count in sorted(self.events.items())
+            },
+        }
+
+
+# -----------------------------------------------------------------------------
+# Entry Point
+# -----------------------------------------------------------------------------
+
+def _parse_players(value: str) -> List[int]:
+    """'3' -> [3], '2..5' -> [2, 3, 4, 5]"""
+    if ".." in value:
+        low, high = value.split("..", 1)
+        return list(range(int(low), int(high) + 1))
+    return [int(value)]
+
+
+def run(games: int, players: List[int], policies: List[str], seed: int = 0,
+        workers: int = 1, max_turns: int = 500, report_every: Optional[int] = None) -> SimulationStats:
+    tasks = (
+        ((seed << 32) | i, players[i % len(players)], policies, max_turns)
+        for i in range(games)
+    )
+    stats = SimulationStats()
+    started = time.time()
+
+    def _consume(results):
+        for result in results:
+            stats.add(result)
+            if report_every and stats.games % report_every == 0:
+                rate = stats.games / (time.time() - started)
+                print(f"[{stats.games}/{games}] {rate:.0f} games/s {json.dumps(stats.to_dict()['turns'])}", file=sys.stderr)
+
+    if workers <= 1:
+        _consume(map(play_game, tasks))
+    else:
+        with Pool(workers) as pool:
+            _consume(pool.imap_unordered(play_game, tasks, chunksize=64))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sleeping Queens self-play simulator")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", default="2..5", help="Player count or range, e.g. 3 or 2..5")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--policies", default="greedy", help="Comma separated policies, assigned to seats in turn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=500)
+    parser.add_argument("--report-every", type=int, default=10000)
+    parser.add_argument("--json", action="store_true", help="Print the final report as JSON")
+    args = parser.parse_args(argv)
+
+    stats = run(
+        args.games, _parse_players(args.players), args.policies.split(","),
+        seed=args.seed, workers=args.workers, max_turns=args.max_turns, report_every=args.report_every,
+    )
+    report = stats.to_dict()
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Games: {report['games']} (unfinished: {report['unfinished']})")
+    print(f"Turns: {report['turns']}")
+    for n, rates in report["seatWinRate"].items():
+        print(f"Win rate by seat ({n} players): {rates}")
+    print(f"Win rate by policy: {report['policyWinRate']}")
+    print(f"Events per game: {report['eventsPerGame']}")
+
+
+if __name__ == "__main__":
+    main()
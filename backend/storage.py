@@ -1,28 +1,585 @@
-import uuid
+import atexit
+import bisect
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
 from game_engine import create_new_game, GameState
+from movelog import MoveLog
+import codec
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# Storage Backends
+# Live games are kept in a bounded LRU of "resident" rooms. Rooms that go idle, finish,
+# or fall off the LRU are hibernated (written as a codec.py snapshot and dropped from memory)
+# and loaded back transparently by get_game(). Hibernated rooms are deleted for good
+# after `expire_ttl`.
+# -----------------------------------------------------------------------------
+
+class RoomLock:
+    """
+    Re-entrant lock serializing everything that reads or mutates one room.
+    Keyed by room id rather than held by the GameState, so it also covers loading and hibernating the room.
+    """
+    __slots__ = ("_lock", "__weakref__")
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        return self._lock.acquire(blocking)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+# --- Lobby Index: room summaries for GET /rooms, kept current on every save ---
+LOBBY_STATUSES = ("open", "started", "finished")
+
+def room_status(game: GameState) -> str:
+    if game.winner_id: return "finished"
+    return "started" if game.started else "open"
+
+
+class LobbyEntry(NamedTuple):
+    id: str
+    status: str
+    player_count: int
+    created_at: float
+    winner_id: Optional[str]
+
+    @classmethod
+    def of(cls, game: GameState) -> "LobbyEntry":
+        return cls(game.id, room_status(game), len(game.players), game.created_at, game.winner_id)
+
+    @property
+    def key(self) -> Tuple[float, str]:
+        return (self.created_at, self.id)
+
+
+class LobbyIndex:
+    """
+    Summaries of all rooms, newest first, overall and per status. Listing a page is a bisect
+    plus a slice, so the lobby never loads or serializes games. Pages continue below a cursor
+    key (created_at, id), which stays valid while rooms come and go.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, LobbyEntry] = {}
+        # Sorted (created_at, id) keys, for all rooms (None) and for each status
+        self._keys: Dict[Optional[str], List[Tuple[float, str]]] = {s: [] for s in (None,) + LOBBY_STATUSES}
+
+    def update(self, entry: LobbyEntry):
+        old = self.entries.get(entry.id)
+        self.entries[entry.id] = entry
+        if old is not None:
+            if old.key == entry.key and old.status == entry.status:
+                return
+            self._unlink(old)
+        for keys in (self._keys[None], self._keys[entry.status]):
+            bisect.insort(keys, entry.key)
+
+    def remove(self, room_id: str):
+        entry = self.entries.pop(room_id, None)
+        if entry is not None:
+            self._unlink(entry)
+
+    def _unlink(self, entry: LobbyEntry):
+        for keys in (self._keys[None], self._keys[entry.status]):
+            pos = bisect.bisect_left(keys, entry.key)
+            if pos < len(keys) and keys[pos] == entry.key:
+                del keys[pos]
+
+    def page(self, status: Optional[str] = None, limit: int = 50,
+             before: Optional[Tuple[float, str]] = None) -> List[LobbyEntry]:
+        """Up to `limit` entries with the given status (any if None), newest first, older than the `before` key."""
+        keys = self._keys[status]
+        end = bisect.bisect_left(keys, before) if before is not None else len(keys)
+        return [self.entries[room_id] for _, room_id in reversed(keys[max(0, end - limit):end])]
+
+
+class StorageBackend:
+    """
+    Interface of a game store plus the room lifecycle shared by all backends.
+    save_game() must be called after every mutation. Subclasses implement the
+    _write/_read/_remove/_stored_ids/_expire hooks for hibernated rooms
+    (and _needs_blob, if saves may skip the snapshot).
+    """
+
+    def __init__(self, idle_ttl: float = 30 * 60, finished_ttl: float = 2 * 60,
+                 max_resident: int = 10000, expire_ttl: float = 7 * 24 * 3600):
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_resident = max_resident
+        self.expire_ttl = expire_ttl
+
+        self.games: "OrderedDict[str, GameState]" = OrderedDict() # Resident rooms, least recently used first
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self.move_log: Optional[MoveLog] = None # Optional append-only log of live rooms
+        # Locks live as long as someone holds a reference, so the registry never outgrows the rooms in use
+        self._room_locks: "weakref.WeakValueDictionary[str, RoomLock]" = weakref.WeakValueDictionary()
+        self.lobby = LobbyIndex()
+        self._lobby_loaded = False # Stored rooms are added to the index on the first listing
+
+    # --- Hooks for hibernated rooms ---
+    def _needs_blob(self, game: GameState) -> bool:
+        """Whether save_game must encode and _write a snapshot of `game` (encoding is the costly part of a save)."""
+        return True
+
+    def _write(self, game: GameState, blob: bytes):
+        """Stores a snapshot (called on hibernation, and after every mutation that _needs_blob)."""
+        raise NotImplementedError
+
+    def _read(self, room_id) -> Optional[GameState]:
+        raise NotImplementedError
+
+    def _peek(self, room_id) -> Optional[GameState]:
+        """Reads a stored room without making it resident (for listings)."""
+        return self._read(room_id)
+
+    def _remove(self, room_id) -> bool:
+        """Deletes the stored snapshot, returns whether there was one."""
+        raise NotImplementedError
+
+    def _stored_ids(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def _expire(self, before: float) -> List[str]:
+        """Deletes stored snapshots last written before `before` (epoch seconds), returns their room ids."""
+        raise NotImplementedError
+
+    # --- Game store ---
+    def room_lock(self, room_id) -> RoomLock:
+        with self._lock:
+            lock = self._room_locks.get(room_id)
+            if lock is None:
+                lock = self._room_locks[room_id] = RoomLock()
+            return lock
+
+    def _admit(self, game: GameState):
+        self.games[game.id] = game
+        self.games.move_to_end(game.id)
+        self._last_access[game.id] = time.time()
+        if len(self.games) > self.max_resident:
+            # Least recently used first, skipping rooms a request is working on
+            for room_id in list(self.games):
+                if len(self.games) <= self.max_resident:
+                    break
+                if room_id != game.id:
+                    self._try_hibernate(room_id)
+
+    def create_game(self, api_key=None, game_id=None) -> GameState:
+        game = create_new_game(api_key=api_key, game_id=game_id)
+        with self._lock:
+            self._admit(game)
+        self.save_game(game)
+        return game
+
+    def import_game(self, game: GameState):
+        """Adds a game moved here from another worker (replacing any stale copy)."""
+        with self._lock:
+            self._admit(game)
+        self.save_game(game)
+
+    def room_ids(self) -> List[str]:
+        """Ids of all rooms, resident or not, without loading any of them."""
+        with self._lock:
+            return list(self.games) + [room_id for room_id in self._stored_ids() if room_id not in self.games]
+
+    def has_game(self, room_id) -> bool:
+        """Whether a room exists, resident or not (hibernated rooms are not woken up)."""
+        with self._lock:
+            return room_id in self.games or self._peek(room_id) is not None
+
+    def get_game(self, room_id) -> GameState:
+        """Raises KeyError if the game doesn't exist."""
+        with self._lock:
+            game = self.games.get(room_id)
+            if game is None:
+                game = self._read(room_id)
+                if game is None:
+                    raise KeyError(f"Game with ID {room_id} not found")
+            self._admit(game)
+            return game
+
+    def save_game(self, game: GameState):
+        # Serialize now, while the state is consistent (a room hibernated meanwhile was written by _hibernate)
+        blob = codec.encode(game) if self._needs_blob(game) else None
+        with self._lock:
+            if blob is not None:
+                self._write(game, blob)
+            if game.id in self.games:
+                self._last_access[game.id] = time.time()
+            self.lobby.update(LobbyEntry.of(game))
+        if self.move_log is not None:
+            self.move_log.record(game)
+
+    def delete_game(self, room_id):
+        """Raises KeyError if the game doesn't exist."""
+        with self._lock:
+            resident = self.games.pop(room_id, None) is not None
+            self._last_access.pop(room_id, None)
+            stored = self._remove(room_id)
+            self.lobby.remove(room_id)
+        if self.move_log is not None:
+            self.move_log.forget(room_id)
+        if not resident and not stored:
+            raise KeyError(f"Game with ID {room_id} not found")
+
+    def get_all_games(self) -> List[GameState]:
+        """All rooms, resident or not. Hibernated rooms are read without being woken up."""
+        with self._lock:
+            games = list(self.games.values())
+            hibernated = [room_id for room_id in self._stored_ids() if room_id not in self.games]
+        for room_id in hibernated:
+            game = self._peek(room_id)
+            if game is not None:
+                games.append(game)
+        return games
+
+    def lobby_rooms(self, status: Optional[str] = None, limit: int = 50,
+                    before: Optional[Tuple[float, str]] = None) -> List[LobbyEntry]:
+        """A page of room summaries from the lobby index (see LobbyIndex.page)."""
+        with self._lock:
+            if not self._lobby_loaded:
+                self._load_lobby()
+            return self.lobby.page(status, limit, before)
+
+    def _load_lobby(self):
+        # Rooms saved since startup are indexed already, the rest are read once
+        for game in self.games.values():
+            self.lobby.update(LobbyEntry.of(game))
+        for room_id in self._stored_ids():
+            if room_id not in self.lobby.entries:
+                game = self._peek(room_id)
+                if game is not None:
+                    self.lobby.update(LobbyEntry.of(game))
+        self._lobby_loaded = True
+
+    def restore(self, game: GameState):
+        """Puts back a game recovered from the move log, unless the store already has it at the same or a newer version."""
+        with self._lock:
+            current = self.games.get(game.id) or self._read(game.id)
+            if current is not None and current.version >= game.version:
+                game = current
+            self._admit(game)
+        self.save_game(game)
+
+    # --- Lifecycle ---
+    def hibernate(self, room_id):
+        """Takes a resident room out of memory now (e.g. one nobody is playing), unless it is in use."""
+        with self._lock:
+            if room_id in self.games:
+                self._try_hibernate(room_id)
 
-# In-memory storage for games
-games = {}
+    def _try_hibernate(self, room_id):
+        """Hibernates a room unless its lock is held (it's in use, so not worth evicting anyway)."""
+        lock = self.room_lock(room_id)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            self._hibernate(room_id)
+        finally:
+            lock.release()
 
-def create_game(api_key=None):
+    def _hibernate(self, room_id):
+        game = self.games.pop(room_id)
+        self._last_access.pop(room_id, None)
+        self._write(game, codec.encode(game))
+        if self.move_log is not None:
+            self.move_log.forget(room_id) # The snapshot just written supersedes the log
+
+    def sweep(self):
+        """Hibernates idle and finished rooms and deletes expired hibernated ones."""
+        now = time.time()
+        with self._lock:
+            for room_id, game in list(self.games.items()):
+                idle = now - self._last_access.get(room_id, now)
+                if idle >= self.idle_ttl or (game.winner_id and idle >= self.finished_ttl):
+                    self._try_hibernate(room_id)
+            for room_id in self._expire(now - self.expire_ttl):
+                self.lobby.remove(room_id)
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(StorageBackend):
+    """Keeps live games in memory. Hibernated rooms go to one snapshot file each in `hibernate_dir`."""
+
+    SUFFIX = ".sqg"
+
+    def __init__(self, hibernate_dir: Optional[str] = None, **lifecycle):
+        super().__init__(**lifecycle)
+        self.hibernate_dir = hibernate_dir or os.path.join(tempfile.gettempdir(), "sleeping_queens")
+        os.makedirs(self.hibernate_dir, exist_ok=True)
+
+    def _path(self, room_id) -> str:
+        return os.path.join(self.hibernate_dir, os.path.basename(room_id) + self.SUFFIX)
+
+    def _needs_blob(self, game):
+        return game.id not in self.games # Live games are already in memory, only hibernation hits the disk
+
+    def _write(self, game, blob):
+        tmp_path = self._path(game.id) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, self._path(game.id))
+
+    def _read(self, room_id):
+        try:
+            with open(self._path(room_id), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        os.remove(self._path(room_id)) # Resident again, memory is the source of truth
+        return codec.decode(blob)
+
+    def _remove(self, room_id):
+        try:
+            os.remove(self._path(room_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _stored_ids(self):
+        return [name[:-len(self.SUFFIX)] for name in os.listdir(self.hibernate_dir) if name.endswith(self.SUFFIX)]
+
+    def _peek(self, room_id):
+        # Unlike _read, the file stays (the room stays hibernated)
+        try:
+            with open(self._path(room_id), "rb") as f:
+                return codec.decode(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _expire(self, before):
+        expired = []
+        for room_id in self._stored_ids():
+            try:
+                if os.path.getmtime(self._path(room_id)) < before:
+                    os.remove(self._path(room_id))
+                    expired.append(room_id)
+            except FileNotFoundError:
+                pass
+        return expired
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Persists games in SQLite (WAL mode) as codec.py snapshots.
+    Writes are write-behind: save_game() serializes the game and queues it, and a background
+    thread commits all queued snapshots in one transaction every `flush_interval` seconds
+    (or as soon as `batch_size` rooms are waiting).
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5, batch_size: int = 100, **lifecycle):
+        super().__init__(**lifecycle)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._pending: Dict[str, bytes] = {}       # room_id -> snapshot waiting to be written
+        self._db_lock = threading.Lock()           # Serializes use of the connection
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rooms ("
+            " id TEXT PRIMARY KEY,"
+            " state BLOB NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-flush", daemon=True)
+        self._flusher.start()
+
+    # --- Write-behind ---
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes all queued snapshots now."""
+        # Lock order is always _lock -> _db_lock (reads and deletes run under _lock). _db_lock is
+        # taken before _lock is let go, so a delete can't slip in between taking the batch and writing it.
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            self._db_lock.acquire()
+        try:
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rooms (id, state, updated_at) VALUES (?, ?, ?)",
+                [(room_id, blob, now) for room_id, blob in pending.items()],
+            )
+            self._conn.commit()
+        finally:
+            self._db_lock.release()
+
+    # --- Hibernation hooks ---
+    def _write(self, game, blob):
+        self._pending[game.id] = blob
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _read(self, room_id):
+        blob = self._pending.get(room_id)
+        if blob is None:
+            with self._db_lock:
+                row = self._conn.execute("SELECT state FROM rooms WHERE id = ?", (room_id,)).fetchone()
+            blob = row[0] if row else None
+        return codec.decode(blob) if blob is not None else None
+
+    def _remove(self, room_id):
+        queued = self._pending.pop(room_id, None) is not None
+        with self._db_lock:
+            deleted = self._conn.execute("DELETE FROM rooms WHERE id = ?", (room_id,)).rowcount
+            self._conn.commit()
+        return queued or bool(deleted)
+
+    def _stored_ids(self):
+        with self._db_lock:
+            room_ids = [row[0] for row in self._conn.execute("SELECT id FROM rooms")]
+        return set(room_ids) | set(self._pending)
+
+    def _expire(self, before):
+        with self._db_lock:
+            stale = [row[0] for row in self._conn.execute("SELECT id FROM rooms WHERE updated_at < ?", (before,))]
+            stale = [room_id for room_id in stale if room_id not in self.games and room_id not in self._pending]
+            self._conn.executemany("DELETE FROM rooms WHERE id = ?", [(room_id,) for room_id in stale])
+            self._conn.commit()
+        return stale
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+def _lifecycle_from_env() -> Dict[str, float]:
+    """SQ_ROOM_IDLE_TTL / SQ_FINISHED_ROOM_TTL / SQ_ROOM_EXPIRE_TTL (seconds) and SQ_MAX_RESIDENT_ROOMS."""
+    settings = {}
+    for env, key, cast in (
+        ("SQ_ROOM_IDLE_TTL", "idle_ttl", float),
+        ("SQ_FINISHED_ROOM_TTL", "finished_ttl", float),
+        ("SQ_ROOM_EXPIRE_TTL", "expire_ttl", float),
+        ("SQ_MAX_RESIDENT_ROOMS", "max_resident", int),
+    ):
+        if os.environ.get(env):
+            settings[key] = cast(os.environ[env])
+    return settings
+
+
+def _backend_from_env() -> StorageBackend:
+    """SQ_STORAGE selects the backend: 'memory' (default) or 'sqlite:///path/to/rooms.db'."""
+    url = os.environ.get("SQ_STORAGE", "memory")
+    lifecycle = _lifecycle_from_env()
+    if url == "memory":
+        return MemoryBackend(hibernate_dir=os.environ.get("SQ_HIBERNATE_DIR"), **lifecycle)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):], **lifecycle)
+    raise ValueError(f"Unknown SQ_STORAGE: {url}")
+
+
+SWEEP_INTERVAL = 30 # seconds
+
+def _sweep_loop():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            backend.sweep()
+        except Exception: # Keep sweeping even if one pass fails
+            logger.exception("Room sweep failed")
+
+
+def _recover_move_log(backend: StorageBackend):
+    """SQ_MOVE_LOG_DIR enables the move log; rooms it still holds are rebuilt on startup."""
+    directory = os.environ.get("SQ_MOVE_LOG_DIR")
+    if not directory:
+        return
+    move_log = MoveLog(directory)
+    for game in move_log.recover():
+        backend.restore(game)
+    backend.move_log = move_log
+    atexit.register(move_log.close)
+
+
+backend = _backend_from_env()
+atexit.register(backend.close)
+_recover_move_log(backend)
+threading.Thread(target=_sweep_loop, name="room-sweeper", daemon=True).start()
+
+# -----------------------------------------------------------------------------
+# Module API (used by app.py)
+# -----------------------------------------------------------------------------
+
+def create_game(api_key=None, game_id=None):
     """Creates a new game using the engine's factory function."""
-    game = create_new_game(api_key=api_key)
-    games[game.id] = game
-    return game
+    return backend.create_game(api_key=api_key, game_id=game_id)
 
 def get_game(room_id):
     """Retrieves a game by ID."""
-    if room_id not in games:
-        raise KeyError(f"Game with ID {room_id} not found")
-    return games[room_id]
+    return backend.get_game(room_id)
+
+def has_game(room_id):
+    """Whether a room exists, without loading it."""
+    return backend.has_game(room_id)
+
+def room_lock(room_id):
+    """Lock to hold around get_game() and everything done with the game (see RoomLock)."""
+    return backend.room_lock(room_id)
+
+def save_game(game):
+    """Persists a game after a mutation."""
+    backend.save_game(game)
 
 def delete_game(room_id):
     """Removes a game from storage."""
-    if room_id in games:
-        del games[room_id]
-    else:
-        raise KeyError(f"Game with ID {room_id} not found")
+    backend.delete_game(room_id)
 
 def get_all_games():
     """Returns a list of all active game objects."""
-    return list(games.values())
\ No newline at end of file
+    return backend.get_all_games()
+
+def lobby_rooms(status=None, limit=50, before=None):
+    """A page of LobbyEntry summaries, newest first (see LobbyIndex.page)."""
+    return backend.lobby_rooms(status=status, limit=limit, before=before)
+
+def import_game(game):
+    """Stores a game moved here from another worker."""
+    backend.import_game(game)
+
+def room_ids():
+    """Ids of all stored rooms."""
+    return backend.room_ids()
+
+def hibernate_game(room_id):
+    """Takes a room out of memory until it is next requested (see StorageBackend.hibernate)."""
+    backend.hibernate(room_id)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The backend modules import each other as top-level modules (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No turn timeouts: the scheduler must only play the seats a test makes bots
+os.environ.setdefault("SQ_TURN_TIMEOUT", "0")
+
+# Rooms the tests create stay out of the default hibernation directory
+os.environ.setdefault("SQ_HIBERNATE_DIR", tempfile.mkdtemp(prefix="sleeping_queens-tests-"))
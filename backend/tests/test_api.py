@@ -0,0 +1,97 @@
+import copy
+import json
+import random
+
+from api import game_update_dict, game_view
+from game_engine import CHANGE_LOG_SIZE, add_player, create_new_game, legal_moves, play_card
+from test_game_engine import _seeded_game
+
+
+# -----------------------------------------------------------------------------
+# Delta Updates
+# -----------------------------------------------------------------------------
+
+def _apply_update(view, update):
+    """What a client does with a /changes response: replace its view, or replay the change sets onto it."""
+    if "changes" not in update:
+        return update
+    assert update["fromVersion"] == view["version"]
+    view = copy.deepcopy(view)
+    players = {p["id"]: p for p in view["players"]}
+
+    def cards(zone):
+        if zone == "discard": return view["discardPile"]
+        if zone == "sleeping": return view["queensSleeping"]
+        kind, player_id = zone.split(":", 1)
+        return players[player_id]["hand"] if kind == "hand" else players[player_id]["queensAwake"]
+
+    def counted(zone):
+        """The count standing in for a zone the viewer can't see, if it is one."""
+        if zone == "deck": return view, "deckSize"
+        if zone.startswith("hand:") and "hand" not in players[zone[5:]]: return players[zone[5:]], "handCount"
+        return None
+
+    for change in update["changes"]:
+        for player in change.get("players", []):
+            players[player["id"]] = {"score": 0, "queensAwake": [], **player}
+            view["players"].append(players[player["id"]])
+        for move in change["moves"]:
+            src, dst = counted(move["from"]), counted(move["to"])
+            if src:
+                src[0][src[1]] -= 1
+            else:
+                zone = cards(move["from"])
+                zone.remove(next(c for c in zone if c["id"] == move["cardId"]))
+            if dst:
+                dst[0][dst[1]] += 1
+            else:
+                cards(move["to"]).append(move["card"])
+        view.update(change.get("fields", {}))
+        for player_id, score in change.get("scores", {}).items():
+            players[player_id]["score"] = score
+    view["version"] = update["version"]
+    return view
+
+
+def _json(data):
+    return json.loads(json.dumps(data))
+
+
+def test_deltas_rebuild_every_viewers_state():
+    for seed in range(6):
+        game = _seeded_game(seed, 0, players=3)
+        rng = random.Random(seed)
+        viewers = [None] + list(game.players)
+        views = {viewer: _json(game_view(game, viewer)) for viewer in viewers}
+        while not game.winner_id:
+            for _ in range(rng.randint(1, 3)): # Clients may miss a few versions between polls
+                if game.winner_id:
+                    break
+                move = rng.choice(legal_moves(game, game.turn_player_id))
+                play_card(game, game.turn_player_id, move.card_ids, move.target_card_id)
+            for viewer in viewers:
+                update = _json(game_update_dict(game, views[viewer]["version"], viewer))
+                assert "changes" in update
+                views[viewer] = _apply_update(views[viewer], update)
+                assert views[viewer] == _json(game_view(game, viewer))
+
+
+def test_hidden_moves_carry_no_card_id():
+    game = _seeded_game(3, 40, players=3)
+    for viewer in [None] + list(game.players):
+        for change in game_update_dict(game, 0, viewer)["changes"]:
+            for move in change["moves"]:
+                hidden = [zone for zone in (move["from"], move["to"]) if zone == "deck" or (zone.startswith("hand:") and zone != f"hand:{viewer}")]
+                assert ("cardId" in move) == (len(hidden) < 2)
+                assert ("card" in move) == (move["to"] not in hidden)
+
+
+def test_full_state_when_the_log_no_longer_reaches_back():
+    game = create_new_game(seed=1)
+    for i in range(CHANGE_LOG_SIZE + 1):
+        add_player(game, f"P{i}")
+    assert len(game.change_log) == CHANGE_LOG_SIZE
+    assert game_update_dict(game, 1)["fromVersion"] == 1
+    assert "changes" not in game_update_dict(game, 0)
+    assert game_update_dict(game, game.version)["changes"] == []
+    assert "changes" not in game_update_dict(game, game.version + 1)
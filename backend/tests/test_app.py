@@ -0,0 +1,295 @@
+import pytest
+
+import api
+from api import seat_key
+from app import app
+from game_engine import clone_game, legal_moves, play_card
+import codec
+import storage
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def _room(client, players: int = 2, start: bool = True):
+    """A new room with `players` joined (and started), as (room id, player ids)."""
+    room_id = client.post("/rooms", json={}).get_json()["roomId"]
+    player_ids = [client.post(f"/rooms/{room_id}/join", json={"name": f"P{i}"}).get_json()["playerId"] for i in range(players)]
+    if start:
+        assert client.post(f"/rooms/{room_id}/start").status_code == 200
+    return room_id, player_ids
+
+
+def _seat(room_id, player_id):
+    """The playerId and seatKey of a seat, as request parameters."""
+    return {"playerId": player_id, "seatKey": seat_key(storage.get_game(room_id), player_id)}
+
+
+def _first_move(client, room_id, player_id):
+    return client.get(f"/rooms/{room_id}/moves", query_string=_seat(room_id, player_id)).get_json()["moves"][0]
+
+
+# -----------------------------------------------------------------------------
+# State Versions and Conditional GETs
+# -----------------------------------------------------------------------------
+
+def test_every_mutation_bumps_the_version(client):
+    room_id, _ = _room(client, players=0, start=False)
+    versions = [client.get(f"/rooms/{room_id}").get_json()["version"]]
+    player_ids = []
+    for i in range(2):
+        player_ids.append(client.post(f"/rooms/{room_id}/join", json={"name": f"P{i}"}).get_json()["playerId"])
+        versions.append(client.get(f"/rooms/{room_id}").get_json()["version"])
+    versions.append(client.post(f"/rooms/{room_id}/start").get_json()["version"])
+    turn = storage.get_game(room_id).turn_player_id
+    versions.append(client.post(f"/rooms/{room_id}/play", json={**_seat(room_id, turn), **_first_move(client, room_id, turn)}).get_json()["version"])
+    assert versions == list(range(versions[0], versions[0] + len(versions))) # One version per mutation
+
+    rejected = client.post(f"/rooms/{room_id}/play", json={**_seat(room_id, turn), "cardIds": ["nope"]})
+    assert rejected.status_code == 400
+    assert client.get(f"/rooms/{room_id}").get_json()["version"] == versions[-1]
+
+
+def test_unchanged_state_is_a_304(client):
+    room_id, player_ids = _room(client)
+    first = client.get(f"/rooms/{room_id}")
+    etag, version = first.headers["ETag"], first.get_json()["version"]
+
+    for unchanged in (client.get(f"/rooms/{room_id}", headers={"If-None-Match": etag}),
+                      client.get(f"/rooms/{room_id}?sinceVersion={version}")):
+        assert unchanged.status_code == 304
+        assert unchanged.data == b""
+        assert unchanged.headers["ETag"] == etag
+
+    turn = storage.get_game(room_id).turn_player_id
+    client.post(f"/rooms/{room_id}/play", json={**_seat(room_id, turn), **_first_move(client, room_id, turn)})
+    changed = client.get(f"/rooms/{room_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["version"] > version
+
+
+def test_unknown_room_is_a_404(client):
+    assert client.get("/rooms/no-such-room").status_code == 404
+
+
+# -----------------------------------------------------------------------------
+# Seat Keys
+# -----------------------------------------------------------------------------
+
+def test_join_hands_out_the_seat_key(client):
+    room_id = client.post("/rooms", json={"apiKey": "secret"}).get_json()["roomId"]
+    joined = client.post(f"/rooms/{room_id}/join", json={"name": "P0"}).get_json()
+    assert joined["seatKey"] == _seat(room_id, joined["playerId"])["seatKey"]
+
+
+def test_full_room_refuses_joins(client):
+    room_id, _ = _room(client, players=api.MAX_PLAYERS - 1, start=False)
+    assert client.post(f"/rooms/{room_id}/bots", json={"count": 1}).status_code == 201
+    assert client.post(f"/rooms/{room_id}/join", json={"name": "late"}).status_code == 400
+    assert len(storage.get_game(room_id).players) == api.MAX_PLAYERS
+
+
+def test_private_view_needs_the_seat_key(client):
+    room_id = client.post("/rooms", json={"apiKey": "secret"}).get_json()["roomId"]
+    player_ids = [client.post(f"/rooms/{room_id}/join", json={"name": f"P{i}"}).get_json()["playerId"] for i in range(2)]
+    client.post(f"/rooms/{room_id}/start")
+    mine, other = _seat(room_id, player_ids[0]), _seat(room_id, player_ids[1])
+
+    def view(**params):
+        state = client.get(f"/rooms/{room_id}", query_string=params).get_json()
+        return "hand" in state["players"][0], state["apiKey"]
+
+    assert view(**mine) == (True, "secret")
+    assert view(playerId=player_ids[0]) == (False, None)
+    assert view(playerId=player_ids[0], seatKey=other["seatKey"]) == (False, None)
+
+    def dealt(**params):
+        update = client.get(f"/rooms/{room_id}/changes", query_string=dict(params, sinceVersion=0)).get_json()
+        return [move for change in update["changes"] for move in change["moves"] if move["to"] == f"hand:{player_ids[0]}"]
+
+    assert dealt(**mine) and all("card" in move for move in dealt(**mine))
+    assert dealt(playerId=player_ids[0]) and not any("card" in move or "cardId" in move for move in dealt(playerId=player_ids[0]))
+
+
+def test_moves_need_the_seat_key(client):
+    room_id, player_ids = _room(client)
+    turn = storage.get_game(room_id).turn_player_id
+    other = next(pid for pid in player_ids if pid != turn)
+    wrong = {"playerId": turn, "seatKey": _seat(room_id, other)["seatKey"]}
+    version = storage.get_game(room_id).version
+
+    assert client.get(f"/rooms/{room_id}/moves", query_string=wrong).status_code == 403
+    move = _first_move(client, room_id, turn)
+    assert client.post(f"/rooms/{room_id}/play", json={"playerId": turn, **move}).status_code == 403
+    assert client.post(f"/rooms/{room_id}/play", json={**wrong, **move}).status_code == 403
+    assert storage.get_game(room_id).version == version
+
+
+# -----------------------------------------------------------------------------
+# Batch Moves
+# -----------------------------------------------------------------------------
+
+def _planned_moves(room_id, count: int):
+    """`count` legal moves in a row from the room's current state, as play-batch steps."""
+    game = clone_game(storage.get_game(room_id))
+    steps = []
+    for _ in range(count):
+        move = legal_moves(game, game.turn_player_id)[0]
+        steps.append({**_seat(room_id, game.turn_player_id), "cardIds": move.card_ids, "targetCardId": move.target_card_id})
+        play_card(game, game.turn_player_id, move.card_ids, move.target_card_id)
+    return steps
+
+
+def test_batch_applies_moves_in_order(client):
+    room_id, _ = _room(client, players=3)
+    steps = _planned_moves(room_id, 3)
+    version = storage.get_game(room_id).version
+    response = client.post(f"/rooms/{room_id}/play-batch", json={"moves": steps, "response": "steps"})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["applied"] == 3
+    assert [step["version"] for step in result["steps"]] == sorted(step["version"] for step in result["steps"])
+    assert result["version"] == storage.get_game(room_id).version > version
+
+
+def test_atomic_batch_rolls_back_on_a_rejected_move(client):
+    room_id, _ = _room(client, players=3)
+    steps = _planned_moves(room_id, 2)
+    steps.append(dict(steps[0], cardIds=["nope"]))
+    before = codec.encode(storage.get_game(room_id))
+    response = client.post(f"/rooms/{room_id}/play-batch", json={"moves": steps, "atomic": True})
+    assert response.status_code == 400
+    result = response.get_json()
+    assert (result["applied"], result["failedIndex"]) == (0, 2)
+    assert codec.encode(storage.get_game(room_id)) == before
+
+
+def test_batch_keeps_moves_before_a_rejected_one(client):
+    room_id, _ = _room(client, players=3)
+    steps = _planned_moves(room_id, 2)
+    steps.append(dict(steps[0], cardIds=["nope"]))
+    version = storage.get_game(room_id).version
+    result = client.post(f"/rooms/{room_id}/play-batch", json={"moves": steps}).get_json()
+    assert (result["applied"], result["failedIndex"]) == (2, 2)
+    assert storage.get_game(room_id).version > version
+
+
+def test_batch_with_a_wrong_seat_key_plays_nothing(client):
+    room_id, _ = _room(client, players=3)
+    steps = _planned_moves(room_id, 2)
+    steps[1]["seatKey"] = steps[0]["seatKey"]
+    version = storage.get_game(room_id).version
+    assert client.post(f"/rooms/{room_id}/play-batch", json={"moves": steps}).status_code == 403
+    assert storage.get_game(room_id).version == version
+
+
+def test_malformed_batch_is_a_400(client):
+    room_id, _ = _room(client)
+    version = storage.get_game(room_id).version
+    for body in ({"moves": "all of them"}, {"moves": [1, 2]}, {"moves": [], "response": "everything"}):
+        assert client.post(f"/rooms/{room_id}/play-batch", json=body).status_code == 400
+    assert storage.get_game(room_id).version == version
+
+
+# -----------------------------------------------------------------------------
+# Lobby
+# -----------------------------------------------------------------------------
+
+def _lobby(client, **params):
+    """Every room GET /rooms lists, walking its pages of 3, as a list of pages."""
+    pages, cursor = [], None
+    while True:
+        query = dict(params, limit=3, **({"cursor": cursor} if cursor else {}))
+        response = client.get("/rooms", query_string=query)
+        assert response.status_code == 200
+        data = response.get_json()
+        pages.append(data["rooms"])
+        cursor = data["nextCursor"]
+        if cursor is None:
+            return pages
+
+
+def _ids(pages):
+    return [room["id"] for page in pages for room in page]
+
+
+def test_lobby_pages_cover_every_room_once_newest_first(client):
+    created = [_room(client, players=1, start=False)[0] for _ in range(7)]
+    pages = _lobby(client)
+    rooms = [room for page in pages for room in page]
+
+    assert all(len(page) == 3 for page in pages[:-1])
+    assert sorted(_ids(pages)) == sorted(storage.room_ids())
+    assert [room_id for room_id in _ids(pages) if room_id in created] == created[::-1]
+    keys = [(room["createdAt"], room["id"]) for room in rooms]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_lobby_cursor_survives_new_rooms(client):
+    for _ in range(4):
+        _room(client, players=1, start=False)
+    first = client.get("/rooms?limit=2").get_json()
+    newer, _ = _room(client, players=1, start=False)
+    second = client.get("/rooms", query_string={"limit": 2, "cursor": first["nextCursor"]}).get_json()
+    assert newer not in _ids([first["rooms"], second["rooms"]])
+    assert not set(_ids([first["rooms"]])) & set(_ids([second["rooms"]]))
+
+
+def test_lobby_filters_by_status(client):
+    waiting, _ = _room(client, start=False)
+    playing, _ = _room(client)
+    open_ids, started_ids = _ids(_lobby(client, status="open")), _ids(_lobby(client, status="started"))
+    assert waiting in open_ids and waiting not in started_ids
+    assert playing in started_ids and playing not in open_ids
+
+
+def test_lobby_lists_hibernated_rooms(client):
+    room_id, _ = _room(client)
+    with storage.room_lock(room_id):
+        storage.backend._hibernate(room_id)
+    assert room_id not in storage.backend.games
+    assert room_id in _ids(_lobby(client, status="started"))
+
+
+def test_lobby_rejects_bad_arguments(client):
+    for query in ("status=lost", "limit=many", "cursor=nonsense"):
+        assert client.get(f"/rooms?{query}").status_code == 400
+
+
+# -----------------------------------------------------------------------------
+# Internal Routes (used by the shard router)
+# -----------------------------------------------------------------------------
+
+SHARD_TOKEN = "tok-0123456789abcdef"
+
+
+def test_internal_routes_are_hidden_without_the_token(client, monkeypatch):
+    room_id, _ = _room(client)
+    monkeypatch.setattr(api, "SHARD_TOKEN", None)
+    assert client.get("/internal/rooms", headers={"X-Shard-Token": ""}).status_code == 404 # Sharding off
+
+    monkeypatch.setattr(api, "SHARD_TOKEN", SHARD_TOKEN)
+    for headers in ({}, {"X-Shard-Token": "wrong"}):
+        assert client.get("/internal/rooms", headers=headers).status_code == 404
+        assert client.post("/internal/rooms", json={"roomId": "routed"}, headers=headers).status_code == 404
+        assert client.post(f"/internal/rooms/{room_id}/export", headers=headers).status_code == 404
+        assert client.put(f"/internal/rooms/{room_id}", data=b"", headers=headers).status_code == 404
+    assert storage.has_game(room_id)
+
+
+def test_internal_export_and_import_move_a_room(client, monkeypatch):
+    monkeypatch.setattr(api, "SHARD_TOKEN", SHARD_TOKEN)
+    headers = {"X-Shard-Token": SHARD_TOKEN}
+    room_id, _ = _room(client)
+    assert room_id in client.get("/internal/rooms", headers=headers).get_json()["rooms"]
+    before = codec.encode(storage.get_game(room_id))
+
+    exported = client.post(f"/internal/rooms/{room_id}/export", headers=headers)
+    assert exported.data == before
+    assert not storage.has_game(room_id)
+    assert client.put("/internal/rooms/another-room", data=exported.data, headers=headers).status_code == 400
+    assert client.put(f"/internal/rooms/{room_id}", data=exported.data, headers=headers).status_code == 200
+    assert codec.encode(storage.get_game(room_id)) == before
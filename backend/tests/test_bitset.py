@@ -0,0 +1,24 @@
+import bitset
+import compact
+from game_engine import legal_moves
+from test_game_engine import _midgame_states
+
+
+def _bit_move_keys(state: bitset.BitState, player_id: str):
+    keys = set()
+    for move in bitset.legal_moves(state, state.seat_of(player_id)):
+        card_ids, target = bitset.move_card_ids(state, move)
+        keys.add((tuple(sorted(card_ids)), target))
+    return keys
+
+
+def _engine_move_keys(game, player_id: str):
+    return {(tuple(sorted(m.card_ids)), m.target_card_id) for m in legal_moves(game, player_id)}
+
+
+def test_legal_moves_agree_with_the_engine():
+    for game in _midgame_states():
+        player_id = game.turn_player_id
+        expected = _engine_move_keys(game, player_id)
+        assert _bit_move_keys(bitset.from_game(game), player_id) == expected
+        assert _bit_move_keys(bitset.from_compact(compact.pack(game)), player_id) == expected
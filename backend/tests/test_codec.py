@@ -0,0 +1,38 @@
+import pytest
+
+import codec
+from game_engine import add_player, create_new_game
+from test_compact import _games
+
+
+def test_round_trip():
+    for game in _games():
+        blob = codec.encode(game)
+        restored = codec.decode(blob)
+        assert restored == game
+        assert restored.created_at == game.created_at
+        assert [p.bot for p in restored.players.values()] == [p.bot for p in game.players.values()]
+        assert codec.encode(restored) == blob
+
+
+def test_other_schemas_are_rejected():
+    blob = bytearray(codec.encode(_games()[0]))
+    for schema in (codec.SCHEMA_VERSION - 1, codec.SCHEMA_VERSION + 1):
+        blob[len(codec.MAGIC)] = schema
+        with pytest.raises(ValueError, match="schema"):
+            codec.decode(bytes(blob))
+
+
+def test_strings_longer_than_16_bits():
+    # Snapshots must hold whatever an engine caller put in the game (requests are limited in api.py)
+    game = create_new_game(seed=1, api_key="k" * 70000)
+    add_player(game, "é" * 40000)
+    restored = codec.decode(codec.encode(game))
+    assert restored.api_key == game.api_key
+    assert restored == game
+
+
+@pytest.mark.parametrize("blob", [b"", b"SQG", b"not a snapshot at all", codec.encode(_games()[0])[:40]])
+def test_garbage_is_a_value_error(blob):
+    with pytest.raises(ValueError):
+        codec.decode(blob)
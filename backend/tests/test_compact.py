@@ -0,0 +1,51 @@
+import json
+import zlib
+
+import pytest
+
+import compact
+from game_engine import add_player, create_new_game, start_game
+from test_game_engine import _midgame_states
+
+
+def _games():
+    game = create_new_game(seed=3, api_key="key")
+    add_player(game, "Ann")
+    add_player(game, "Bot", bot="greedy")
+    start_game(game)
+    return [game] + list(_midgame_states(20))
+
+
+def test_pack_unpack_round_trip():
+    for game in _games():
+        assert compact.unpack(compact.pack(game)) == game
+
+
+def test_dumps_loads_round_trip():
+    for game in _games():
+        restored = compact.loads(compact.dumps(game))
+        assert restored == game
+        assert restored.created_at == game.created_at
+        assert [p.bot for p in restored.players.values()] == [p.bot for p in game.players.values()]
+
+
+def test_card_ids_by_index():
+    game = _games()[0]
+    packed = compact.pack(game)
+    for card in game.deck + game.queens_sleeping:
+        assert compact.card_id(packed, card.index) == card.id
+        assert compact.card_index(packed, card.id) == card.index
+    with pytest.raises(KeyError):
+        compact.card_index(packed, "not a card id")
+
+
+def test_loads_format_2():
+    game = _games()[0]
+    data = json.loads(zlib.decompress(compact.dumps(game)))
+    data[0] = 2
+    data[3] = [p[:3] for p in data[3]] # No bot seats
+    restored = compact.loads(zlib.compress(json.dumps(data[:-1]).encode("utf-8"))) # No created_at
+    assert restored.created_at == 0.0
+    assert all(p.bot is None for p in restored.players.values())
+    assert restored.version == game.version
+    assert restored.deck == game.deck
@@ -0,0 +1,249 @@
+from itertools import combinations
+import random
+
+import pytest
+
+from game_engine import (GameState, Move, ZONE_DECK, ZONE_DISCARD, add_player, apply_move, clone_game,
+                         create_new_game, legal_moves, play_card, start_game, undo_move)
+from game_engine import _find_card, _zone_cards, _zones
+from bots import get_policy
+import codec
+
+# Two greedy players from seed 74 leave the first player with only Knights, a Potion and a
+# Dragon and no awake queen to aim them at on the fifth move
+STUCK_SEED, STUCK_MOVES = 74, 4
+
+
+def _seeded_game(seed: int, moves: int, players: int = 2, policy: str = "greedy") -> GameState:
+    """A game from `seed` after `moves` moves of `policy` (fewer if it ends first)."""
+    rng = random.Random(seed)
+    game = create_new_game(seed=seed)
+    for i in range(players):
+        add_player(game, f"P{i}")
+    start_game(game)
+    choose = get_policy(policy)
+    for _ in range(moves):
+        if game.winner_id:
+            break
+        move = choose(game, game.turn_player_id, rng)[0]
+        play_card(game, game.turn_player_id, move.card_ids, move.target_card_id)
+    return game
+
+
+def _midgame_states(count: int = 60):
+    """Started, unfinished games at assorted points, with 2 to 5 players."""
+    for seed in range(count):
+        game = _seeded_game(seed, seed % 40, players=2 + seed % 4, policy="random")
+        if not game.winner_id:
+            yield game
+
+
+# -----------------------------------------------------------------------------
+# Stuck Hands
+# -----------------------------------------------------------------------------
+
+def test_stuck_hand_has_no_legal_moves():
+    # The rules have no move for such a hand: the turn stays open (see scheduler.py)
+    game = _seeded_game(STUCK_SEED, STUCK_MOVES)
+    player = game.players[game.turn_player_id]
+    assert not any(c.type in ("number", "jester") for c in player.hand)
+    assert legal_moves(game, player.id) == []
+    for card in player.hand:
+        with pytest.raises(ValueError):
+            play_card(game, player.id, [card.id])
+
+
+# -----------------------------------------------------------------------------
+# Versions
+# -----------------------------------------------------------------------------
+
+def test_each_engine_call_bumps_the_version_once():
+    game = create_new_game(seed=9)
+    add_player(game, "P0")
+    add_player(game, "P1")
+    start_game(game)
+    assert game.version == 3
+    rng = random.Random(9)
+    while not game.winner_id:
+        version = game.version
+        move = rng.choice(legal_moves(game, game.turn_player_id))
+        play_card(game, game.turn_player_id, move.card_ids, move.target_card_id)
+        assert game.version == version + 1
+        assert (game.change_log[-1].from_version, game.change_log[-1].version) == (version, version + 1)
+
+
+def test_rejected_call_keeps_the_version():
+    game = _seeded_game(9, 2)
+    version = game.version
+    with pytest.raises(ValueError):
+        play_card(game, game.turn_player_id, ["no such card"])
+    assert game.version == version
+
+
+# -----------------------------------------------------------------------------
+# Legal Moves
+# -----------------------------------------------------------------------------
+
+def _move_key(move: Move):
+    return tuple(sorted(move.card_ids)), move.target_card_id
+
+
+def _brute_force_moves(game: GameState, player_id: str):
+    """
+    Every (card set, target) play_card accepts, found by trying them all on copies.
+    Numbers and Jesters are only tried without a target, and the Rose Bonus without cards:
+    the engine ignores them there.
+    """
+    hand = [] if game.pending_rose_wake else game.players[player_id].hand
+    queens = [None] + [q.id for q in game.queens_sleeping] + [q.id for queens in game.queens_awake.values() for q in queens]
+    accepted = set()
+    for n in range(len(hand) + 1):
+        for cards in combinations(hand, n):
+            card_ids = [c.id for c in cards]
+            targets = [None] if cards and cards[0].type in ("number", "jester") else queens
+            for target in targets:
+                try:
+                    play_card(clone_game(game), player_id, card_ids, target)
+                except ValueError:
+                    continue
+                accepted.add(_move_key(Move(card_ids, target)))
+    return accepted
+
+
+def test_legal_moves_match_brute_force():
+    checked = 0
+    for game in _midgame_states():
+        moves = legal_moves(game, game.turn_player_id)
+        assert {_move_key(m) for m in moves} == _brute_force_moves(game, game.turn_player_id)
+        assert len({_move_key(m) for m in moves}) == len(moves)
+        checked += 1
+    assert checked > 30
+
+
+def test_legal_moves_only_for_the_player_on_turn():
+    game = _seeded_game(1, 3, players=3)
+    for player_id in game.players:
+        assert bool(legal_moves(game, player_id)) == (player_id == game.turn_player_id)
+
+
+def test_legal_moves_cached_until_the_state_changes():
+    game = _seeded_game(2, 5)
+    moves = legal_moves(game, game.turn_player_id)
+    assert legal_moves(game, game.turn_player_id) is moves
+    play_card(game, game.turn_player_id, moves[0].card_ids, moves[0].target_card_id)
+    assert legal_moves(game, game.turn_player_id) is not moves
+
+
+# -----------------------------------------------------------------------------
+# Cloning and Undo
+# -----------------------------------------------------------------------------
+
+def test_undo_restores_the_exact_state():
+    for game in _midgame_states(30):
+        rng = random.Random(game.seed)
+        before, applied = [], []
+        while not game.winner_id and len(applied) < 30:
+            before.append(codec.encode(game))
+            move = rng.choice(legal_moves(game, game.turn_player_id))
+            applied.append(apply_move(game, game.turn_player_id, move))
+        while applied:
+            undo_move(game, applied.pop())
+            assert codec.encode(game) == before.pop()
+
+
+def test_rejected_move_leaves_the_game_untouched():
+    game = _seeded_game(6, 8, players=3)
+    blob = codec.encode(game)
+    hand = game.players[game.turn_player_id].hand
+    with pytest.raises(ValueError):
+        apply_move(game, game.turn_player_id, Move([c.id for c in hand])) # The whole hand at once
+    assert codec.encode(game) == blob
+
+
+def test_only_the_latest_move_can_be_undone():
+    game = _seeded_game(7, 4)
+    first = apply_move(game, game.turn_player_id, legal_moves(game, game.turn_player_id)[0])
+    apply_move(game, game.turn_player_id, legal_moves(game, game.turn_player_id)[0])
+    with pytest.raises(ValueError):
+        undo_move(game, first)
+
+
+def test_clone_plays_independently():
+    game = _seeded_game(8, 6, players=3)
+    blob = codec.encode(game)
+    copy = clone_game(game)
+    move = legal_moves(copy, copy.turn_player_id)[0]
+    play_card(copy, copy.turn_player_id, move.card_ids, move.target_card_id)
+    assert codec.encode(game) == blob
+    assert copy.version == game.version + 1
+
+
+# -----------------------------------------------------------------------------
+# Card Index
+# -----------------------------------------------------------------------------
+
+def _zone_scan(game: GameState):
+    """card id -> zone, found by walking every zone list."""
+    return {c.id: zone for zone in _zones(game) for c in _zone_cards(game, zone)}
+
+
+def _indexed(game: GameState):
+    """card id -> zone, as the card index reports it."""
+    return {card_id: _find_card(game, card_id)[1] for card_id in _zone_scan(game)}
+
+
+def test_card_index_follows_every_move():
+    for game in _midgame_states(30):
+        assert _indexed(game) == _zone_scan(game)
+        assert all(_find_card(game, c.id)[0] is c for zone in _zones(game) for c in _zone_cards(game, zone))
+
+
+def test_card_index_follows_undo_and_clones():
+    game = _seeded_game(5, 10, players=3)
+    zones = _indexed(game)
+    copy = clone_game(game)
+    changes = apply_move(game, game.turn_player_id, legal_moves(game, game.turn_player_id)[0])
+    assert _indexed(game) == _zone_scan(game)
+    assert _indexed(copy) == zones
+    undo_move(game, changes)
+    assert _indexed(game) == zones
+
+
+def test_find_card_checks_the_zone():
+    game = _seeded_game(3, 2)
+    card = game.deck[0]
+    assert _find_card(game, card.id, ZONE_DECK) == (card, ZONE_DECK)
+    assert _find_card(game, card.id, ZONE_DISCARD) == (None, None)
+    assert _find_card(game, "no such card") == (None, None)
+    assert _find_card(game, None) == (None, None)
+
+
+# -----------------------------------------------------------------------------
+# Seeded Games
+# -----------------------------------------------------------------------------
+
+def _replayed(seed: int, restore_at: int = -1) -> bytes:
+    """Snapshot of a 3 player game from `seed`, optionally restored from a snapshot midway."""
+    rng = random.Random(7)
+    game = create_new_game(seed=seed, game_id="room")
+    game.created_at = 0.0 # The only wall clock input
+    for i in range(3):
+        add_player(game, f"P{i}", player_id=f"player-{i}")
+    start_game(game)
+    for turn in range(200):
+        if game.winner_id:
+            break
+        if turn == restore_at:
+            game = codec.decode(codec.encode(game))
+        move = rng.choice(legal_moves(game, game.turn_player_id))
+        play_card(game, game.turn_player_id, move.card_ids, move.target_card_id)
+    return codec.encode(game)
+
+
+def test_same_seed_same_game():
+    assert _replayed(42) == _replayed(42)
+    assert _replayed(42) != _replayed(43)
+
+
+def test_restored_game_continues_identically():
+    assert _replayed(42, restore_at=30) == _replayed(42)
@@ -0,0 +1,180 @@
+import random
+import time
+
+import storage
+from bots import get_policy
+from game_engine import add_player, legal_moves, play_card, start_game
+from ismcts import BotPool
+from scheduler import TurnScheduler
+from test_game_engine import STUCK_MOVES, STUCK_SEED, _seeded_game
+
+
+def _scheduler(turn_timeout: float = 0):
+    """A scheduler without worker threads: tests pull its turns with _next_turn / _take_turn."""
+    changed = []
+    return TurnScheduler(changed.append, workers=0, turn_timeout=turn_timeout), changed
+
+
+def _stored_room(bots=(), people: int = 1):
+    """A started room in storage with `people` players and a bot seat per policy in `bots`."""
+    game = storage.create_game()
+    with storage.room_lock(game.id):
+        for i in range(people):
+            add_player(game, f"P{i}")
+        for policy in bots:
+            add_player(game, f"Bot ({policy})", bot=policy)
+        start_game(game)
+        storage.save_game(game)
+    return game
+
+
+def _bot_turn(bots=("greedy",)):
+    """A stored room waiting for a bot's turn."""
+    while True:
+        game = _stored_room(bots, people=1)
+        if game.players[game.turn_player_id].bot:
+            return game
+        storage.delete_game(game.id)
+
+
+# -----------------------------------------------------------------------------
+# Bot Turns
+# -----------------------------------------------------------------------------
+
+def test_bot_turn_is_played():
+    scheduler, changed = _scheduler()
+    game = _bot_turn()
+    bot_id, version = game.turn_player_id, game.version
+    scheduler.notify(game)
+    room_id, queued = scheduler._next_turn()
+    assert (room_id, queued) == (game.id, version)
+    scheduler._take_turn(room_id, queued)
+    scheduler._done(room_id)
+    assert changed == [game]
+    assert game.version > version
+    assert game.turn_player_id != bot_id or game.pending_rose_wake or game.winner_id
+
+
+def test_stale_turn_is_skipped():
+    scheduler, changed = _scheduler()
+    game = _bot_turn()
+    scheduler.notify(game)
+    room_id, version = scheduler._next_turn()
+    with storage.room_lock(room_id):
+        move = legal_moves(game, game.turn_player_id)[0]
+        play_card(game, game.turn_player_id, move.card_ids, move.target_card_id) # Someone else played it
+    scheduler._take_turn(room_id, version)
+    assert changed == []
+
+
+def test_stuck_bot_leaves_the_turn_open():
+    scheduler, changed = _scheduler()
+    game = _seeded_game(STUCK_SEED, STUCK_MOVES)
+    player_id, version = game.turn_player_id, game.version
+    scheduler._play(game, player_id, get_policy("greedy")(game, player_id, random.Random(0)))
+    assert changed == []
+    assert (game.version, game.turn_player_id) == (version, player_id)
+
+
+def test_rooms_take_turns_in_fifo_order():
+    scheduler, _ = _scheduler()
+    rooms = [_bot_turn() for _ in range(3)]
+    for game in rooms:
+        scheduler.notify(game)
+    first, _ = scheduler._next_turn()
+    scheduler.notify(rooms[0]) # Comes up again while it is being played: waits behind the others
+    assert [scheduler._next_turn()[0] for _ in range(2)] == [rooms[1].id, rooms[2].id]
+    assert first == rooms[0].id and not scheduler._ready
+    scheduler._done(first)
+    assert list(scheduler._ready) == [first]
+
+
+def test_room_waits_in_the_queue_once():
+    scheduler, _ = _scheduler()
+    game = _bot_turn()
+    for _ in range(3):
+        scheduler.notify(game)
+    assert list(scheduler._ready) == [game.id]
+
+
+def test_search_bots_think_in_the_bot_pool():
+    scheduler, changed = _scheduler()
+    scheduler._pool = BotPool(workers=1, iterations=50)
+    try:
+        game = _bot_turn(bots=("ismcts",))
+        version = game.version
+        scheduler._take_turn(game.id, version)
+    finally:
+        scheduler.close()
+    assert changed == [game]
+    assert game.version > version
+
+
+# -----------------------------------------------------------------------------
+# Turn Timeouts
+# -----------------------------------------------------------------------------
+
+def _human_turn():
+    while True:
+        game = _stored_room(("greedy",), people=1)
+        if not game.players[game.turn_player_id].bot:
+            return game
+        storage.delete_game(game.id)
+
+
+def test_timeouts_keep_one_deadline_per_room():
+    scheduler, _ = _scheduler(turn_timeout=60)
+    game = _human_turn()
+    for _ in range(5):
+        scheduler.notify(game)
+    assert len(scheduler._timers) == 1
+    assert set(scheduler._deadlines) == {game.id}
+
+
+def test_timed_out_room_is_paused_not_played():
+    scheduler, changed = _scheduler(turn_timeout=0.05)
+    game = _human_turn()
+    version = game.version
+    scheduler.notify(game)
+    time.sleep(0.06)
+    room_id, queued = scheduler._next_turn()
+    assert (room_id, queued) == (game.id, version)
+    scheduler._take_turn(room_id, queued)
+
+    assert changed == []
+    assert game.id not in storage.backend.games # Hibernated
+    restored = storage.get_game(game.id)
+    assert (restored.version, restored.turn_player_id) == (version, game.turn_player_id)
+
+
+def test_moving_in_time_pushes_the_deadline_back():
+    scheduler, _ = _scheduler(turn_timeout=60)
+    game = _human_turn()
+    scheduler.notify(game)
+    first = scheduler._timers[0][0]
+    time.sleep(0.01)
+    scheduler.notify(game) # After a move: the next turn gets the full timeout again
+    second, version = scheduler._deadlines[game.id]
+    assert second > first
+
+    scheduler._fire_timers((first + second) / 2)
+    assert not scheduler._ready
+    assert scheduler._timers == [(second, game.id)]
+    scheduler._fire_timers(second)
+    assert list(scheduler._ready) == [game.id] and scheduler._queued[game.id] == version
+    assert not scheduler._timers and not scheduler._deadlines
+
+
+def test_bot_turn_cancels_the_deadline():
+    scheduler, _ = _scheduler(turn_timeout=60)
+    game = _human_turn()
+    scheduler.notify(game)
+    with storage.room_lock(game.id):
+        move = legal_moves(game, game.turn_player_id)[0]
+        play_card(game, game.turn_player_id, move.card_ids, move.target_card_id)
+    if not game.players[game.turn_player_id].bot:
+        return # The Rose Bonus or a Jester kept the turn
+    scheduler.notify(game)
+    scheduler._fire_timers(time.monotonic() + 120)
+    assert list(scheduler._ready) == [game.id] # Queued once, for the bot
+    assert not scheduler._deadlines
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import uuid
+from collections import Counter
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+import router as router_module
+from router import ShardRouter
+from sharding import HashRing, _hash
+
+TOKEN = "tok-0123456789abcdef"
+WORKERS = [f"http://w{i}:5000" for i in range(1, 5)]
+
+
+# -----------------------------------------------------------------------------
+# Hash Ring
+# -----------------------------------------------------------------------------
+
+def _room_ids(count: int):
+    return [str(uuid.UUID(int=i)) for i in range(count)]
+
+
+def test_ring_places_a_key_on_the_first_point_at_or_after_its_hash():
+    ring = HashRing(WORKERS[:3], replicas=8)
+    points = sorted(zip(ring._points, ring._owners))
+    for room_id in _room_ids(500):
+        owner = next((o for p, o in points if p >= _hash(room_id)), points[0][1]) # Wraps around
+        assert ring.node_for(room_id) == owner
+    # A worker's point names hash to exactly its points
+    assert all(ring.node_for(f"{worker}#{i}") == worker for worker in WORKERS[:3] for i in range(8))
+
+
+def test_ring_spreads_rooms_evenly():
+    ring = HashRing(WORKERS)
+    counts = Counter(ring.node_for(room_id) for room_id in _room_ids(4000))
+    assert set(counts) == set(WORKERS)
+    assert max(counts.values()) < 1.5 * min(counts.values())
+
+
+def test_adding_a_worker_only_moves_rooms_to_it():
+    rooms = _room_ids(2000)
+    before, after = HashRing(WORKERS[:3]), HashRing(WORKERS)
+    moved = [r for r in rooms if before.node_for(r) != after.node_for(r)]
+    assert all(after.node_for(r) == WORKERS[3] for r in moved)
+    assert len(moved) < len(rooms) / 3 # About a quarter
+
+    after.remove(WORKERS[3])
+    assert [after.node_for(r) for r in rooms] == [before.node_for(r) for r in rooms]
+
+
+def test_empty_ring_has_no_owner():
+    with pytest.raises(LookupError):
+        HashRing().node_for("room")
+
+
+# -----------------------------------------------------------------------------
+# Rebalancing (fake workers behind an httpx.MockTransport)
+# -----------------------------------------------------------------------------
+
+class _Workers:
+    """Workers' /internal routes, keeping each worker's rooms as {room id: snapshot}."""
+
+    def __init__(self, urls):
+        self.rooms = {url: {} for url in urls}
+        self.refusing = set() # Workers whose imports fail
+        self.seen = []        # (worker, request) of every request
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        worker = f"{request.url.scheme}://{request.url.netloc.decode()}"
+        self.seen.append((worker, request))
+        rooms, path = self.rooms[worker], request.url.path
+        if path.startswith("/internal/") and request.headers.get("X-Shard-Token") != TOKEN:
+            return httpx.Response(404)
+        if path == "/internal/rooms" and request.method == "GET":
+            return httpx.Response(200, json={"rooms": list(rooms)})
+        if path.endswith("/export"):
+            room_id = path.split("/")[3]
+            if room_id not in rooms:
+                return httpx.Response(404)
+            return httpx.Response(200, content=rooms.pop(room_id))
+        if path.startswith("/internal/rooms/") and request.method == "PUT":
+            if worker in self.refusing:
+                return httpx.Response(500)
+            rooms[path.split("/")[3]] = request.content
+            return httpx.Response(200)
+        # Proxied routes: streamed like a real worker's response (the router reads it raw)
+        return httpx.Response(200, stream=httpx.ByteStream(b"{}"), headers=[
+            ("content-type", "application/json"), ("vary", "Accept-Encoding"), ("vary", "Accept-Encoding, Origin"),
+            ("date", "upstream"), ("server", "upstream"),
+        ])
+
+    def holder(self, room_id):
+        return next(url for url, rooms in self.rooms.items() if room_id in rooms)
+
+
+def _router(workers: _Workers, urls):
+    router = ShardRouter(urls, TOKEN)
+    router.client = httpx.AsyncClient(transport=httpx.MockTransport(workers))
+    return router
+
+
+def _placed(workers: _Workers, urls, count: int = 200):
+    """`count` rooms, each on its owner in a ring of `urls`."""
+    ring = HashRing(urls)
+    rooms = _room_ids(count)
+    for room_id in rooms:
+        workers.rooms[ring.node_for(room_id)][room_id] = room_id.encode()
+    return rooms
+
+
+def test_rebalance_moves_the_rooms_whose_owner_changed():
+    workers = _Workers(WORKERS)
+    rooms = _placed(workers, WORKERS[:3])
+
+    async def run():
+        router = _router(workers, WORKERS[:3])
+        return router, await router.rebalance(WORKERS)
+    router, result = asyncio.run(run())
+
+    ring = HashRing(WORKERS)
+    assert result["failed"] == 0
+    assert result["moved"] == len(workers.rooms[WORKERS[3]]) > 0
+    assert all(workers.holder(r) == ring.node_for(r) == router.owner(r) for r in rooms)
+    assert all(workers.rooms[workers.holder(r)][r] == r.encode() for r in rooms) # Snapshots arrive intact
+    assert not router._moving and not router._move_locks
+
+
+def test_failed_import_puts_the_room_back():
+    workers = _Workers(WORKERS)
+    rooms = _placed(workers, WORKERS[:3])
+    before = {r: workers.holder(r) for r in rooms}
+    workers.refusing.add(WORKERS[3])
+
+    async def run():
+        router = _router(workers, WORKERS[:3])
+        return router, await router.rebalance(WORKERS)
+    router, result = asyncio.run(run())
+
+    stuck = [r for r in rooms if HashRing(WORKERS).node_for(r) == WORKERS[3]]
+    assert (result["moved"], result["failed"]) == (0, len(stuck))
+    assert {r: workers.holder(r) for r in rooms} == before # Nothing lost, nothing moved
+    assert all(router.owner(r) == before[r] for r in stuck) # Pinned to the old worker
+
+
+def test_rebalance_skips_rooms_deleted_meanwhile():
+    workers = _Workers(WORKERS[:2])
+    router = _router(workers, WORKERS[:2])
+    room_id = _room_ids(1)[0]
+    source = router.ring.node_for(room_id)
+    target = next(url for url in WORKERS[:2] if url != source)
+    assert asyncio.run(router._move(room_id, source, target)) is False
+    assert not workers.rooms[target]
+
+
+# -----------------------------------------------------------------------------
+# Router Routes
+# -----------------------------------------------------------------------------
+
+@pytest.fixture
+def routed(monkeypatch):
+    """A test client of the router app (without its lifespan) in front of fake workers."""
+    workers = _Workers(WORKERS)
+    monkeypatch.setattr(router_module, "router", _router(workers, WORKERS[:2]))
+    return TestClient(router_module.app), workers
+
+
+def test_shards_needs_the_token(routed):
+    client, _ = routed
+    assert client.get("/shards").status_code == 403
+    assert client.get("/shards", headers={"X-Shard-Token": "wrong"}).status_code == 403
+    assert client.post("/shards", json={"workers": WORKERS}).status_code == 403
+    assert client.get("/shards", headers={"X-Shard-Token": TOKEN}).json()["workers"] == WORKERS[:2]
+
+
+def test_shards_rejects_bad_bodies(routed):
+    client, _ = routed
+    headers = {"X-Shard-Token": TOKEN, "Content-Type": "application/json"}
+    for body in ("{not json", json.dumps(["http://w1:5000"]), json.dumps({"workers": []}), json.dumps({"workers": [1]})):
+        assert client.post("/shards", content=body, headers=headers).status_code == 400
+    assert router_module.router.ring.nodes == WORKERS[:2]
+
+
+def test_proxy_forwards_only_the_clients_encodings(routed):
+    client, workers = routed
+    client.get("/rooms/some-room", headers={"Accept-Encoding": ""})
+    client.get("/rooms/some-room", headers={"Accept-Encoding": "br"})
+    assert [request.headers["accept-encoding"] for _, request in workers.seen] == ["identity", "br"]
+
+
+def test_proxy_drops_upstream_server_headers(routed):
+    client, _ = routed
+    response = client.get("/rooms/some-room")
+    assert response.headers.get("date") != "upstream"
+    assert response.headers.get("server") != "upstream"
+    vary = [value.strip() for value in response.headers["vary"].split(",")]
+    assert vary.count("Accept-Encoding") == 1 and vary.count("Origin") <= 1
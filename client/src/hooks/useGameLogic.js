@@ -1,5 +1,6 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { api } from '../services/api';
+import { applyChanges } from '../utils/applyChanges';
 
 export const useGameLogic = (t, language) => {
   // --- STATE ---
@@ -7,24 +8,32 @@ export const useGameLogic = (t, language) => {
   const [gameState, setGameState] = useState(null);
   const [roomId, setRoomId] = useState(localStorage.getItem('sq_room_id') || '');
   const [playerId, setPlayerId] = useState(localStorage.getItem('sq_player_id') || null);
+  const [seatKey, setSeatKey] = useState(localStorage.getItem('sq_seat_key') || null);
   const [playerName, setPlayerName] = useState(localStorage.getItem('sq_player_name') || '');
   const [roomsList, setRoomsList] = useState([]);
   const [error, setError] = useState('');
   const [selectedCardIds, setSelectedCardIds] = useState([]);
   const [isHandOpen, setIsHandOpen] = useState(true);
 
+  // Last state version we received (lets the server answer polls with 304)
+  const versionRef = useRef(null);
+  useEffect(() => { versionRef.current = gameState?.version ?? null; }, [gameState]);
+
   // --- HELPERS ---
-  const saveSession = (rId, pId, pName) => {
+  const saveSession = (rId, pId, sKey, pName) => {
     localStorage.setItem('sq_room_id', rId);
     localStorage.setItem('sq_player_id', pId);
+    localStorage.setItem('sq_seat_key', sKey);
     localStorage.setItem('sq_player_name', pName);
   };
 
   const clearSession = () => {
     localStorage.removeItem('sq_room_id');
     localStorage.removeItem('sq_player_id');
+    localStorage.removeItem('sq_seat_key');
     setRoomId('');
     setPlayerId(null);
+    setSeatKey(null);
   };
 
   // --- ACTIONS ---
@@ -37,7 +46,8 @@ export const useGameLogic = (t, language) => {
   const fetchGameState = useCallback(async () => {
     if (!roomId) return;
     try {
-      const data = await api.getGameState(roomId, playerId);
+      const data = await api.getGameState(roomId, playerId, seatKey, versionRef.current);
+      if (data === undefined) return; // Unchanged
       if (data === null) {
         alert("Game session lost.");
         clearSession();
@@ -49,7 +59,23 @@ export const useGameLogic = (t, language) => {
     } catch (err) {
       console.error('Error fetching state:', err);
     }
-  }, [roomId, playerId]);
+  }, [roomId, playerId, seatKey]);
+
+  // Accepts either a full state or a delta update from the server
+  const receiveUpdate = useCallback((data) => {
+    if (!data.changes) {
+      versionRef.current = data.version ?? null;
+      setGameState(data);
+      return;
+    }
+    if (versionRef.current !== data.fromVersion) {
+      // Out of sync: resync with a full state unless we're already ahead
+      if (versionRef.current === null || versionRef.current < data.version) fetchGameState();
+      return;
+    }
+    versionRef.current = data.version;
+    setGameState(prev => applyChanges(prev, data) || prev);
+  }, [fetchGameState]);
 
   const createGame = async (apiKey) => {
     try {
@@ -58,7 +84,7 @@ export const useGameLogic = (t, language) => {
         setRoomId(data.roomId);
         setPlayerId(data.playerId);
         // We need to fetch state immediately for mock
-        const state = await api.getGameState(data.roomId, data.playerId);
+        const state = await api.getGameState(data.roomId, data.playerId, null);
         setGameState(state);
         setView('game');
       } else {
@@ -75,11 +101,12 @@ export const useGameLogic = (t, language) => {
     try {
       const data = await api.joinRoom(roomToJoin, playerName);
       setPlayerId(data.playerId);
+      setSeatKey(data.seatKey);
       setRoomId(roomToJoin);
-      saveSession(roomToJoin, data.playerId, playerName);
+      saveSession(roomToJoin, data.playerId, data.seatKey, playerName);
       setView('game');
       // Trigger a fetch immediately
-      const state = await api.getGameState(roomToJoin, data.playerId);
+      const state = await api.getGameState(roomToJoin, data.playerId, data.seatKey);
       setGameState(state);
     } catch (err) {
       if (err.message === "404") { alert("Room not found!"); setRoomId(''); }
@@ -89,7 +116,7 @@ export const useGameLogic = (t, language) => {
 
   const startGame = async () => {
     try {
-      const data = await api.startGame(roomId);
+      const data = await api.startGame(roomId, playerId, seatKey);
       setGameState(data);
     } catch (err) { setError(err.message || 'Start failed'); }
   };
@@ -106,8 +133,8 @@ export const useGameLogic = (t, language) => {
     if (window.innerWidth <= 768) setIsHandOpen(false);
 
     try {
-      const { state, isMock } = await api.playCard(roomId, playerId, effectiveCardIds, targetId, language);
-      setGameState(state);
+      const { state, isMock } = await api.playCard(roomId, playerId, seatKey, effectiveCardIds, targetId, language, versionRef.current);
+      receiveUpdate(state);
       setSelectedCardIds([]);
 
       // Mock CPU Logic
@@ -150,7 +177,7 @@ export const useGameLogic = (t, language) => {
     const checkActiveSession = async () => {
       if (view === 'lobby' && roomId && playerId) {
            try {
-             const data = await api.getGameState(roomId, playerId);
+             const data = await api.getGameState(roomId, playerId, seatKey);
              if (data && data.players && data.players.find(p => p.id === playerId)) {
                  setGameState(data);
                  setView('game');
@@ -161,14 +188,22 @@ export const useGameLogic = (t, language) => {
     checkActiveSession();
   }, []); // Run once
 
-  // 3. Polling (Game Loop)
+  // 3. Live Updates (Game Loop): server push, falling back to polling
   useEffect(() => {
-    if (view === 'game') {
-      fetchGameState();
-      const interval = setInterval(fetchGameState, 2000);
-      return () => clearInterval(interval);
-    }
-  }, [view, roomId, fetchGameState]);
+    if (view !== 'game') return;
+
+    const source = api.subscribeToGame(roomId, playerId, seatKey, receiveUpdate, () => {
+      alert("Game session lost.");
+      clearSession();
+      setView('lobby');
+      setGameState(null);
+    });
+    if (source) return () => source.close();
+
+    fetchGameState();
+    const interval = setInterval(fetchGameState, 2000);
+    return () => clearInterval(interval);
+  }, [view, roomId, playerId, seatKey, fetchGameState, receiveUpdate]);
 
   // 4. Mobile Auto-Minimize Hand
   useEffect(() => {
@@ -19,19 +19,41 @@ export const api = {
     }
   },
 
-  getGameState: async (roomId, playerId) => {
+  // Returns null if the game is gone, undefined if unchanged since `sinceVersion`.
+  // The seat's own hand is only shown with the seatKey /join handed out.
+  getGameState: async (roomId, playerId, seatKey, sinceVersion = null) => {
     if (USE_MOCK_API) {
       const state = mockServer.getState();
       // Return a deep copy to mimic network request
       return JSON.parse(JSON.stringify(state));
     }
     
-    const res = await fetch(`${API_URL}/rooms/${roomId}?playerId=${playerId}`);
+    let url = `${API_URL}/rooms/${roomId}?playerId=${playerId}&seatKey=${seatKey}`;
+    if (sinceVersion !== null && sinceVersion !== undefined) url += `&sinceVersion=${sinceVersion}`;
+    const res = await fetch(url);
     if (res.status === 404) return null; // Game lost/over
+    if (res.status === 304) return undefined; // Nothing changed
     if (!res.ok) throw new Error("Network response was not ok");
     return await res.json();
   },
 
+  // --- PUSH ---
+  // Opens a Server-Sent Events stream for the room. Returns null when push isn't available
+  // (mock mode / old browsers) so the caller can fall back to polling.
+  // onUpdate receives either a full state or a delta update ({ version, fromVersion, changes }).
+  subscribeToGame: (roomId, playerId, seatKey, onUpdate, onClosed) => {
+    if (USE_MOCK_API || typeof EventSource === 'undefined') return null;
+
+    const source = new EventSource(`${API_URL}/rooms/${roomId}/events?playerId=${playerId}&seatKey=${seatKey}`);
+    source.onmessage = (e) => onUpdate(JSON.parse(e.data));
+    source.addEventListener('changes', (e) => onUpdate(JSON.parse(e.data)));
+    source.addEventListener('closed', () => {
+      source.close();
+      onClosed();
+    });
+    return source;
+  },
+
   // --- WRITE ---
   createRoom: async (apiKey, playerName, language) => {
     if (USE_MOCK_API) {
@@ -52,7 +74,7 @@ export const api = {
 
   joinRoom: async (roomId, playerName) => {
     if (USE_MOCK_API) {
-      return { playerId: 'simulated-join-id', roomId: mockServer.id };
+      return { playerId: 'simulated-join-id', seatKey: null, roomId: mockServer.id };
     }
 
     const res = await fetch(`${API_URL}/rooms/${roomId}/join`, {
@@ -63,21 +85,22 @@ export const api = {
     
     if (res.status === 404) throw new Error("404");
     if (!res.ok) throw new Error("Room full or error");
-    return await res.json(); // Returns { playerId, ... }
+    return await res.json(); // Returns { playerId, seatKey }
   },
 
-  startGame: async (roomId) => {
+  startGame: async (roomId, playerId, seatKey) => {
     if (USE_MOCK_API) {
       return mockServer.startGame();
     }
     
-    const res = await fetch(`${API_URL}/rooms/${roomId}/start`, { method: 'POST' });
+    const res = await fetch(`${API_URL}/rooms/${roomId}/start?playerId=${playerId}&seatKey=${seatKey}`, { method: 'POST' });
     const data = await res.json();
     if (data.error) throw new Error(data.error);
     return data;
   },
 
-  playCard: async (roomId, playerId, cardIds, targetId, language) => {
+  // With sinceVersion the server may answer with a delta update instead of the full state
+  playCard: async (roomId, playerId, seatKey, cardIds, targetId, language, sinceVersion = null) => {
     if (USE_MOCK_API) {
       const newState = mockServer.playCard(playerId, cardIds, targetId, language);
       return { state: newState, isMock: true };
@@ -86,7 +109,7 @@ export const api = {
     const res = await fetch(`${API_URL}/rooms/${roomId}/play`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ playerId, cardIds, targetCardId: targetId }),
+      body: JSON.stringify({ playerId, seatKey, cardIds, targetCardId: targetId, sinceVersion }),
     });
     const data = await res.json();
     if (data.error) throw new Error(data.error);
@@ -131,13 +131,15 @@ export const useGemini = (gameState, playerId, language, apiKey, setShowKeyModal
       setAiType('spy');
       setAiModalOpen(true);
       setAiLoading(true);
+      // Opponents come with a handCount only (their cards are never sent to us)
+      const cardCount = opp.handCount ?? opp.hand?.length ?? 0;
       const prompt = language === 'he'
           ? `אתה שדון סקרן, חמוד וידידותי מאוד. הצצת בקלפים של החבר/ה "${opp.name}".
-             יש לו/ה ${opp.score} נקודות ו-${opp.hand.length} קלפים ביד.
+             יש לו/ה ${opp.score} נקודות ו-${cardCount} קלפים ביד.
              במקום לתת "דו"ח ריגול", תן מחמאה מצחיקה או הערה חמודה לילדים על המצב שלהם.
              למשל: "וואו! איזה אוסף יפה!" או "נראה שהם מתכננים מסיבת הפתעה!". היה קצר ומתוק.`
           : `You are a cute, friendly, and curious little scout. You took a peek at "${opp.name}"'s cards.
-             They have ${opp.score} points and ${opp.hand.length} cards.
+             They have ${opp.score} points and ${cardCount} cards.
              Instead of a "spy report", give a funny compliment or a sweet comment for kids.
              For example: "Wow! What a great collection!" or "Looks like they are planning a surprise party!". Be short and sweet.`;
       const response = await callGemini(prompt, apiKey);
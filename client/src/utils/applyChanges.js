@@ -0,0 +1,49 @@
+// Applies a delta update from the backend ({ version, fromVersion, changes }) to a local game state.
+// Returns null if the update doesn't start at our version (caller should refetch the full state).
+
+// Maps a backend zone key ("deck", "discard", "sleeping", "hand:<id>", "awake:<id>") to local state
+const resolveZone = (state, key) => {
+  if (key === 'deck') return { counter: 'deckSize', owner: state };
+  if (key === 'discard') return { cards: state.discardPile };
+  if (key === 'sleeping') return { cards: state.queensSleeping };
+
+  const sep = key.indexOf(':');
+  const kind = key.slice(0, sep);
+  const playerId = key.slice(sep + 1);
+  const player = state.players.find(p => p.id === playerId);
+  if (kind === 'awake') return { cards: player.queensAwake };
+  // Opponent hands may only be sent as a count
+  return player.hand ? { cards: player.hand } : { counter: 'handCount', owner: player };
+};
+
+export const applyChanges = (state, update) => {
+  if (!state || state.version !== update.fromVersion) return null;
+
+  const next = JSON.parse(JSON.stringify(state));
+  for (const change of update.changes) {
+    // New players come with either their (empty) hand or a handCount, like full states
+    (change.players || []).forEach(p => next.players.push({ score: 0, queensAwake: [], ...p }));
+
+    change.moves.forEach(move => {
+      const src = resolveZone(next, move.from);
+      if (src.cards) {
+        const idx = src.cards.findIndex(c => c.id === move.cardId);
+        if (idx !== -1) src.cards.splice(idx, 1);
+      } else {
+        src.owner[src.counter] -= 1;
+      }
+
+      const dst = resolveZone(next, move.to);
+      if (dst.cards) dst.cards.push(move.card);
+      else dst.owner[dst.counter] += 1;
+    });
+
+    Object.assign(next, change.fields || {});
+    Object.entries(change.scores || {}).forEach(([playerId, score]) => {
+      const player = next.players.find(p => p.id === playerId);
+      if (player) player.score = score;
+    });
+  }
+  next.version = update.version;
+  return next;
+};